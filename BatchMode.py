@@ -8,11 +8,13 @@ from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtGui import QFont, QPixmap, QImage
 from PIL import Image
 import cv2
-import numpy as np
-from ultralytics import YOLO
-import easyocr
 import threading
 
+from detection_pipeline import OCR_ALLOWED_CHARS
+from inference_server import connect_pipeline, server_available
+from plate_db import PlateDatabaseWriter, CROP_DIR
+from watchlist import load_watchlist
+
 # --- Các hàm helper (pil_to_qpixmap, cv_image_to_qpixmap) giữ nguyên ---
 def pil_to_qpixmap(pil_image):
     # (Code đã có)
@@ -85,11 +87,12 @@ class BatchModeAppRedesigned(QMainWindow):
         super().__init__()
         self.files = []
         self.output_directory = None
-        self.yolo_model = None
-        self.lp_model = None
-        self.ocr_reader = None
+        self.pipeline = None
         self.models_loaded = False
-        self.ocr_allowed_chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+        self.ocr_allowed_chars = OCR_ALLOWED_CHARS
+        self.detection_image_batch = 8 # Số ảnh nhận dạng chung, OCR tất cả biển số trong một lần gọi
+        self.plate_db = PlateDatabaseWriter(crop_dir=CROP_DIR) # Lưu biển số vào SQLite ở thread ghi riêng
+        self.watchlist = load_watchlist() # watchlist.txt nếu có: cảnh báo khi ảnh chứa biển số cần theo dõi
 
         # <<< !!! THAY ĐỔI ĐƯỜNG DẪN NÀY NẾU FILE MODEL BIỂN SỐ CỦA BẠN KHÁC !!! >>>
         self.lp_model_path = "license_plate_detector.pt" # Ví dụ: dùng file tên best_lp_detector.pt
@@ -106,12 +109,6 @@ class BatchModeAppRedesigned(QMainWindow):
     def _load_models_background(self):
         # (Code tải model giữ nguyên như trước)
         try:
-            print("[INFO] Bắt đầu tải model nhận diện xe (YOLOv8)...")
-            self.yolo_model = YOLO('yolov8n.pt')
-            _ = self.yolo_model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False) # Warm-up
-            print("[INFO] Model nhận diện xe đã tải xong.")
-
-            print(f"[INFO] Bắt đầu tải model nhận diện biển số ({os.path.basename(self.lp_model_path)})...")
             if not os.path.exists(self.lp_model_path):
                  print(f"[ERROR] Không tìm thấy file model biển số: {self.lp_model_path}")
                  self.status_label.setText(f"Lỗi: Không tìm thấy {os.path.basename(self.lp_model_path)}")
@@ -119,13 +116,11 @@ class BatchModeAppRedesigned(QMainWindow):
                  self.update_button_states()
                  return
 
-            self.lp_model = YOLO(self.lp_model_path)
-            _ = self.lp_model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False) # Warm-up
-            print("[INFO] Model nhận diện biển số đã tải xong.")
-
-            print("[INFO] Bắt đầu khởi tạo OCR Reader (EasyOCR)...")
-            self.ocr_reader = easyocr.Reader(['en'], gpu=False)
-            print("[INFO] OCR Reader đã sẵn sàng.")
+            pipeline = connect_pipeline('batch', plate_model_path=self.lp_model_path,
+                                        vehicle_classes=self.target_vehicle_classes,
+                                        ocr_allowed_chars=self.ocr_allowed_chars)
+            pipeline.load_models(warmup=True)
+            self.pipeline = pipeline
 
             self.models_loaded = True
             print("[INFO] Tất cả model đã sẵn sàng.")
@@ -559,7 +554,7 @@ QProgressBar::chunk {
         if not self.files: QMessageBox.warning(self, "Thiếu file", "Vui lòng thêm file ảnh trước khi xử lý."); return False
         if not self.output_directory: QMessageBox.warning(self, "Thiếu thư mục lưu", "Vui lòng chọn thư mục lưu kết quả trước khi xử lý."); return False
         if operation_name == "nhận dạng phương tiện và biển số" and not self.models_loaded:
-             if not self.yolo_model or not self.lp_model or not self.ocr_reader:
+             if self.pipeline is None or not self.pipeline.models_loaded:
                  QMessageBox.warning(self, "Models chưa sẵn sàng", "Các model cần thiết đang được tải hoặc đã xảy ra lỗi. Vui lòng chờ hoặc kiểm tra console.")
                  return False
              else: self.models_loaded = True
@@ -635,58 +630,45 @@ QProgressBar::chunk {
         # (Code đã có)
         operation_name = "nhận dạng phương tiện và biển số"; processed_count = 0; last_processed_pixmap = None
         if not self._prepare_processing(operation_name): return
+        batch_results = {}
         for i, file_path in enumerate(self.files):
+            if i % self.detection_image_batch == 0:
+                self.status_label.setText(f"Đang nhận dạng ảnh {i+1}-{min(i + self.detection_image_batch, len(self.files))}/{len(self.files)}..."); QApplication.processEvents()
+                batch_results = self._detect_image_batch(self.files[i:i + self.detection_image_batch])
             base_name = os.path.basename(file_path); name_part, ext_part = os.path.splitext(base_name)
             output_filename = f"{name_part}_detected_recognized{ext_part}"; output_path = os.path.join(self.output_directory, output_filename)
             self.status_label.setText(f"Đang xử lý: {base_name} ({i+1}/{len(self.files)})"); QApplication.processEvents()
             try:
-                img_cv = cv2.imread(file_path)
+                img_cv, result = batch_results.get(file_path, (None, None))
                 if img_cv is None: raise ValueError("OpenCV không thể đọc file ảnh.")
                 original_pixmap = cv_image_to_qpixmap(img_cv)
                 if not original_pixmap.isNull(): self.current_image_label.setPixmap(original_pixmap.scaled(self.current_image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
                 QApplication.processEvents()
-                vehicle_results = self.yolo_model(img_cv, verbose=False)
+                if result is None: result = self.pipeline.process(img_cv)
                 detection_summary = []; img_draw = img_cv.copy()
-                for result in vehicle_results:
-                    for box in result.boxes:
-                        x1_v, y1_v, x2_v, y2_v = map(int, box.xyxy[0]); conf_v = float(box.conf[0]); cls_v = int(box.cls[0])
-                        class_name_v = self.yolo_model.names[cls_v]
-                        if class_name_v in self.target_vehicle_classes and conf_v > 0.5:
-                            class_name_vn = self.vehicle_classes_vn.get(class_name_v, class_name_v)
-                            vehicle_label = f"{class_name_vn}: {conf_v:.2f}"; vehicle_color = (0, 255, 0)
-                            cv2.rectangle(img_draw, (x1_v, y1_v), (x2_v, y2_v), vehicle_color, 2)
-                            (lbl_w, lbl_h), base = cv2.getTextSize(vehicle_label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                            cv2.rectangle(img_draw, (x1_v, y1_v - lbl_h - base), (x1_v + lbl_w, y1_v), vehicle_color, -1)
-                            cv2.putText(img_draw, vehicle_label, (x1_v, y1_v - base), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 1, cv2.LINE_AA)
-                            vehicle_roi = img_cv[y1_v:y2_v, x1_v:x2_v]
-                            if vehicle_roi.size == 0: continue
-                            lp_results = self.lp_model(vehicle_roi, verbose=False, conf=0.4)
-                            best_lp_box = None; max_conf_lp = 0
-                            for lp_result in lp_results:
-                                for lp_box in lp_result.boxes:
-                                     if lp_box.conf[0] > max_conf_lp: max_conf_lp = lp_box.conf[0]; best_lp_box = lp_box
-                            recognized_plate = "N/A"
-                            if best_lp_box is not None:
-                                lp_x1, lp_y1, lp_x2, lp_y2 = map(int, best_lp_box.xyxy[0])
-                                lp_image = vehicle_roi[lp_y1:lp_y2, lp_x1:lp_x2]
-                                if lp_image.size > 0:
-                                    gray_lp = cv2.cvtColor(lp_image, cv2.COLOR_BGR2GRAY)
-                                    try:
-                                        ocr_result = self.ocr_reader.readtext(gray_lp, detail=0, paragraph=False, allowlist=self.ocr_allowed_chars)
-                                        if ocr_result:
-                                            raw_text = "".join(ocr_result).upper().replace(" ", "")
-                                            recognized_plate = raw_text # Giữ nguyên hoặc chuẩn hóa thêm nếu cần
-                                            detection_summary.append(f"{class_name_vn}: {recognized_plate}")
-                                            g_lp_x1 = x1_v + lp_x1; g_lp_y1 = y1_v + lp_y1; g_lp_x2 = x1_v + lp_x2; g_lp_y2 = y1_v + lp_y2
-                                            lp_color = (255, 0, 0)
-                                            cv2.rectangle(img_draw, (g_lp_x1, g_lp_y1), (g_lp_x2, g_lp_y2), lp_color, 2)
-                                            (lbl_w_ocr, lbl_h_ocr), base_ocr = cv2.getTextSize(recognized_plate, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                                            cv2.rectangle(img_draw, (g_lp_x1, g_lp_y2 + base_ocr), (g_lp_x1 + lbl_w_ocr, g_lp_y2 + lbl_h_ocr + base_ocr + 5), lp_color, -1)
-                                            cv2.putText(img_draw, recognized_plate, (g_lp_x1, g_lp_y2 + lbl_h_ocr + base_ocr), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
-                                        else: detection_summary.append(f"{class_name_vn}: (LP detected, OCR failed)")
-                                    except Exception as ocr_err: print(f"Lỗi OCR cho {base_name}: {ocr_err}"); detection_summary.append(f"{class_name_vn}: (LP detected, OCR error)")
-                                else: detection_summary.append(f"{class_name_vn}: (LP region empty)")
-                            else: detection_summary.append(f"{class_name_vn}: (LP not found)")
+                for vehicle in result['vehicles']:
+                    x1_v, y1_v, x2_v, y2_v = vehicle['bbox']; conf_v = vehicle['conf']
+                    class_name_vn = self.vehicle_classes_vn.get(vehicle['class_name'], vehicle['class_name'])
+                    vehicle_label = f"{class_name_vn}: {conf_v:.2f}"; vehicle_color = (0, 255, 0)
+                    cv2.rectangle(img_draw, (x1_v, y1_v), (x2_v, y2_v), vehicle_color, 2)
+                    (lbl_w, lbl_h), base = cv2.getTextSize(vehicle_label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+                    cv2.rectangle(img_draw, (x1_v, y1_v - lbl_h - base), (x1_v + lbl_w, y1_v), vehicle_color, -1)
+                    cv2.putText(img_draw, vehicle_label, (x1_v, y1_v - base), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 1, cv2.LINE_AA)
+                    if not vehicle['plates']: detection_summary.append(f"{class_name_vn}: (LP not found)"); continue
+                    plate = vehicle['plates'][0]
+                    if plate['ocr_error']: print(f"Lỗi OCR cho {base_name}: {plate['ocr_error']}"); detection_summary.append(f"{class_name_vn}: (LP detected, OCR error)"); continue
+                    if not plate['valid']: detection_summary.append(f"{class_name_vn}: (LP detected, OCR failed)"); continue
+                    recognized_plate = plate['text']
+                    detection_summary.append(f"{class_name_vn}: {recognized_plate}")
+                    if self.watchlist is not None:
+                        for alert in self.watchlist.check(recognized_plate, file_path, bbox=plate['bbox'], frame=img_cv): detection_summary.append(f"⚠ THEO DÕI {alert['plate']} {alert['note']}".strip())
+                    g_lp_x1, g_lp_y1, g_lp_x2, g_lp_y2 = plate['bbox']
+                    self.plate_db.record(file_path, recognized_plate, bbox=plate['bbox'], confidence=plate['conf'], crop=img_cv[max(0, g_lp_y1):g_lp_y2, max(0, g_lp_x1):g_lp_x2].copy())
+                    lp_color = (255, 0, 0)
+                    cv2.rectangle(img_draw, (g_lp_x1, g_lp_y1), (g_lp_x2, g_lp_y2), lp_color, 2)
+                    (lbl_w_ocr, lbl_h_ocr), base_ocr = cv2.getTextSize(recognized_plate, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+                    cv2.rectangle(img_draw, (g_lp_x1, g_lp_y2 + base_ocr), (g_lp_x1 + lbl_w_ocr, g_lp_y2 + lbl_h_ocr + base_ocr + 5), lp_color, -1)
+                    cv2.putText(img_draw, recognized_plate, (g_lp_x1, g_lp_y2 + lbl_h_ocr + base_ocr), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
                 cv2.imwrite(output_path, img_draw)
                 result_pixmap = cv_image_to_qpixmap(img_draw)
                 if not result_pixmap.isNull():
@@ -698,6 +680,23 @@ QProgressBar::chunk {
         if last_processed_pixmap and not last_processed_pixmap.isNull(): self.current_image_label.setPixmap(last_processed_pixmap.scaled(self.current_image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
         self._finish_processing(operation_name, processed_count)
 
+    def _detect_image_batch(self, file_paths):
+        # Đọc một nhóm ảnh và nhận dạng chung để OCR tất cả biển số trong một lần gọi
+        images = {}
+        for file_path in file_paths:
+            img_cv = cv2.imread(file_path)
+            if img_cv is not None: images[file_path] = img_cv
+        try:
+            results = self.pipeline.process_batch(list(images.values()))
+        except Exception as e:
+            print(f"[ERROR] Lỗi nhận dạng theo batch, chuyển sang xử lý từng ảnh: {e}")
+            results = [None] * len(images)
+        batch_results = {path: (img_cv, result) for (path, img_cv), result in zip(images.items(), results)}
+        if results and results[0] is not None:
+            per_plate = results[0]['timings']['ocr_per_plate']
+            print(f"[INFO] OCR {sum(len(r['plates']) for r in results)} biển số / {len(images)} ảnh, trung bình {per_plate:.1f} ms/biển số")
+        return batch_results
+
     def add_result_item(self, pixmap, original_name, info_text, result_path):
         # (Code đã có)
         item_widget = QWidget(); item_layout = QVBoxLayout(item_widget); item_layout.setContentsMargins(5, 5, 5, 5); item_layout.setSpacing(3)
@@ -745,6 +744,7 @@ QProgressBar::chunk {
 
     def closeEvent(self, event):
         # (Code đã có)
+        self.plate_db.close() # Ghi nốt các biển số còn trong hàng đợi
         super().closeEvent(event)
 
 # --- Main execution block ---
@@ -757,14 +757,15 @@ if __name__ == '__main__':
     except ImportError: missing_libs.append("Pillow")
     try: import cv2
     except ImportError: missing_libs.append("opencv-python")
-    try: from ultralytics import YOLO
-    except ImportError: missing_libs.append("ultralytics")
-    try: import torch
-    except ImportError: missing_libs.append("torch (pytorch)")
     try: import numpy
     except ImportError: missing_libs.append("numpy")
-    try: import easyocr
-    except ImportError: missing_libs.append("easyocr")
+    if not server_available(): # Model chạy trong inference server thì không cần import torch ở đây
+        try: from ultralytics import YOLO
+        except ImportError: missing_libs.append("ultralytics")
+        try: import torch
+        except ImportError: missing_libs.append("torch (pytorch)")
+        try: import easyocr
+        except ImportError: missing_libs.append("easyocr")
 
     if missing_libs:
         print("Lỗi: Thiếu các thư viện cần thiết.")
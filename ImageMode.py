@@ -1,14 +1,12 @@
 import sys
 import cv2
 import numpy as np
-import pytesseract
-from ultralytics import YOLO
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPushButton,
                              QHBoxLayout, QFileDialog, QSlider, QComboBox)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QPixmap, QImage
 
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from inference_server import connect_pipeline
 
 
 class ImageModeApp(QMainWindow):
@@ -16,8 +14,8 @@ class ImageModeApp(QMainWindow):
         super().__init__()
         self.image = None
         self.current_image = None
-        self.vehicle_model = YOLO('imgmodels/yolov8n.pt')  # Pre-trained YOLOv8n model
-        self.plate_model = YOLO('imgmodels/best.pt')  # Updated to HuggingFace model
+        self.pipeline = connect_pipeline('image')  # imgmodels/yolov8n.pt + imgmodels/best.pt + Tesseract
+        self.pipeline.load_models()
         self.initUI()
 
     def initUI(self):
@@ -145,35 +143,19 @@ class ImageModeApp(QMainWindow):
             return
         detected = self.image.copy()
 
-        vehicle_results = self.vehicle_model.predict(self.image, conf=0.3)
-        for result in vehicle_results:
-            for box in result.boxes.xyxy:
-                x1, y1, x2, y2 = map(int, box[:4])
-                cv2.rectangle(detected, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(detected, 'Vehicle', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                cropped_vehicle = self.image[y1:y2, x1:x2]
-                plate_results = self.plate_model.predict(cropped_vehicle, conf=0.3)
-
-                for p_result in plate_results:
-                    for p_box in p_result.boxes.xyxy:
-                        px1, py1, px2, py2 = map(int, p_box[:4])
-                        real_px1 = x1 + px1
-                        real_py1 = y1 + py1
-                        real_px2 = x1 + px2
-                        real_py2 = y1 + py2
-                        cv2.rectangle(detected, (real_px1, real_py1), (real_px2, real_py2), (255, 0, 0), 2)
-
-                        # Crop the detected plate region for OCR
-                        plate_image = self.image[real_py1:real_py2, real_px1:real_px2]
-
-                        # Convert the cropped plate to grayscale and apply OCR
-                        gray_plate = cv2.cvtColor(plate_image, cv2.COLOR_BGR2GRAY)
-                        plate_text = pytesseract.image_to_string(gray_plate, config='--psm 8')  # Use psm 8 for single word
-
-                        # Display the detected license plate number next to the box
-                        cv2.putText(detected, plate_text.strip(), (real_px1, real_py1 - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+        result = self.pipeline.process(self.image)
+        for vehicle in result['vehicles']:
+            x1, y1, x2, y2 = vehicle['bbox']
+            cv2.rectangle(detected, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(detected, 'Vehicle', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+            for plate in vehicle['plates']:
+                px1, py1, px2, py2 = plate['bbox']
+                cv2.rectangle(detected, (px1, py1), (px2, py2), (255, 0, 0), 2)
+
+                # Display the detected license plate number next to the box
+                cv2.putText(detected, plate['text'], (px1, py1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
 
         self.current_image = detected
         self.show_image(detected)
@@ -1,23 +1,210 @@
 import sys
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPushButton,
-                             QHBoxLayout, QSlider, QStyle, QFileDialog, QMessageBox, QFrame, QSizePolicy)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QFont, QImage, QPixmap
+                             QHBoxLayout, QSlider, QStyle, QFileDialog, QMessageBox, QFrame, QSizePolicy,
+                             QLineEdit, QSpinBox, QListWidget, QListWidgetItem, QComboBox)
+from PyQt5.QtCore import Qt, QTimer, QEvent, QPoint, QRect
+from PyQt5.QtGui import QFont, QImage, QPixmap, QPainter, QColor, QPen, QPolygon
 import cv2
 from datetime import timedelta
-import torch
-from PIL import Image
-import numpy as np
-import easyocr
-import re
+import time
+import sqlite3
+import threading
+from collections import deque
+
+from detection_pipeline import draw_plates
+from inference_server import connect_pipeline
+from stage_timer import StageTimer
+from video_worker import VideoWorker
+from frame_scheduler import AdaptiveDetectionScheduler
+from plate_tracker import PlateTracker
+from motion_gate import MotionGate, SENSITIVITY_LEVELS
+from roi_masks import load_rois, save_rois
+from thumbnail_strip import ThumbnailStrip
+from frame_presenter import FramePresenter
+from plate_events import PlateEventStore
+from plate_db import PlateDatabaseWriter, PlateDatabase, CROP_DIR, format_read
+from plate_search import load_search_index, find_sightings, SEARCH_MAX_DISTANCE
+from watchlist import load_watchlist, Watchlist, WATCHLIST_PATH
+from video_export import AnnotatedVideoWriter
+
+class ThumbnailStripWidget(QWidget):
+    """Dải thumbnail phía trên thanh thời gian; vạch đỏ là frame có biển số, click để seek"""
+
+    def __init__(self, on_seek, parent=None):
+        super().__init__(parent)
+        self.on_seek = on_seek
+        self.strip = None
+        self.total_frames = 1
+        self.position = 0
+        self.markers = set()
+        self.marker_step = 1
+        self.pixmaps = {}
+        self.painted_ready = 0
+        self.setFixedHeight(60)
+        self.setCursor(Qt.PointingHandCursor)
+
+    def set_strip(self, strip, total_frames):
+        self.strip = strip
+        self.total_frames = max(1, total_frames)
+        self.pixmaps = {}
+        self.markers = set()
+        # Gộp vạch theo ~1/1000 độ dài video: vài trăm nghìn biển số vẫn chỉ vẽ tối đa ~1000 vạch
+        self.marker_step = max(1, self.total_frames // 1000)
+        self.painted_ready = 0
+        self.update()
+
+    def set_position(self, frame_index):
+        if frame_index != self.position:
+            self.position = frame_index
+            self.update()
+
+    def add_markers(self, frames):
+        count = len(self.markers)
+        self.markers.update(frame_index // self.marker_step for frame_index in frames)
+        if len(self.markers) != count:
+            self.update()
+
+    def poll(self):
+        # Thumbnail được tạo dần ở thread nền, vẽ lại khi có ảnh mới
+        if self.strip is not None and self.strip.ready != self.painted_ready:
+            self.update()
+
+    def _pixmap(self, i):
+        if i not in self.pixmaps:
+            thumbnail = cv2.cvtColor(self.strip.thumbnails[i], cv2.COLOR_BGR2RGB)
+            h, w = thumbnail.shape[:2]
+            self.pixmaps[i] = QPixmap.fromImage(QImage(thumbnail.data, w, h, 3 * w, QImage.Format_RGB888).copy())
+        return self.pixmaps[i]
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(34, 34, 34))
+        width, height = self.width(), self.height()
+        if self.strip is not None:
+            ready = self.strip.ready
+            cell_width = width / float(self.strip.count)
+            for i in range(ready):
+                if self.strip.thumbnails[i] is None:
+                    continue
+                x = int(i * cell_width)
+                painter.drawPixmap(QRect(x, 0, int((i + 1) * cell_width) - x, height), self._pixmap(i))
+            self.painted_ready = ready
+
+        painter.setPen(Qt.NoPen)
+        for step_index in self.markers:
+            x = int(step_index * self.marker_step * width / self.total_frames)
+            painter.fillRect(x - 1, 0, 3, height, QColor(231, 76, 60))
+        x = int(self.position * width / self.total_frames)
+        painter.fillRect(x - 1, 0, 2, height, QColor(255, 255, 255))
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self.strip is not None and self.width() > 0:
+            self.on_seek(int(event.x() * self.total_frames / self.width()))
+
+
+class PlateSearchPanel(QWidget):
+    """Cửa sổ tìm gần đúng biển số trong CSDL; kích đúp một kết quả để mở lại vị trí đó"""
+
+    def __init__(self, on_open_read, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.on_open_read = on_open_read
+        self.index = None
+        self.database = None
+        self.loading = None
+        self.setWindowTitle("Tìm biển số")
+        self.resize(560, 420)
+
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Biển số, ví dụ 51F12345")
+        self.query_edit.returnPressed.connect(self.search)
+        self.distance_box = QSpinBox()
+        self.distance_box.setRange(0, SEARCH_MAX_DISTANCE)
+        self.distance_box.setValue(SEARCH_MAX_DISTANCE)
+        self.distance_box.setPrefix("Sai khác ≤ ")
+        search_button = QPushButton("Tìm")
+        search_button.clicked.connect(self.search)
+        query_layout = QHBoxLayout()
+        query_layout.addWidget(self.query_edit, 1)
+        query_layout.addWidget(self.distance_box)
+        query_layout.addWidget(search_button)
+
+        self.results_list = QListWidget()
+        self.results_list.setFont(QFont('Consolas', 9))
+        self.results_list.itemActivated.connect(lambda item: self.on_open_read(item.data(Qt.UserRole)))
+        self.status = QLabel("")
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(query_layout)
+        layout.addWidget(self.results_list, 1)
+        layout.addWidget(self.status)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll_loading)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.index is None and self.loading is None:
+            # Lần đầu: nạp/tạo chỉ mục ở thread nền (có thể mất vài giây với CSDL lớn)
+            self.loading = threading.Thread(target=self._load_index, daemon=True)
+            self.loading.start()
+            self.status.setText("Đang nạp chỉ mục tìm kiếm...")
+            self.poll_timer.start(200)
+        self.query_edit.setFocus()
+
+    def _load_index(self):
+        database = PlateDatabase()
+        try:
+            self.index = load_search_index(database)
+        except Exception as e:
+            print(f"[ERROR] Không tạo được chỉ mục tìm kiếm: {e}")
+        finally:
+            database.close()
+
+    def poll_loading(self):
+        if self.loading.is_alive():
+            return
+        self.poll_timer.stop()
+        self.loading = None
+        if self.index is None:
+            self.status.setText("Lỗi nạp chỉ mục tìm kiếm")
+            return
+        self.status.setText(f"Chỉ mục: {len(self.index)} biển số")
+        if self.query_edit.text():
+            self.search()
+
+    def search(self):
+        if self.index is None:
+            return
+        if self.database is None:
+            self.database = PlateDatabase()
+        t0 = time.perf_counter()
+        self.index.refresh(self.database)  # Chỉ nạp thêm các lần đọc mới
+        reads = find_sightings(self.index, self.database, self.query_edit.text(), self.distance_box.value(),
+                               limit=500)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        self.results_list.clear()
+        for read in reads:
+            item = QListWidgetItem(f"d={read['distance']}  {format_read(read)}")
+            item.setData(Qt.UserRole, read)
+            self.results_list.addItem(item)
+        self.status.setText(f"{len(reads)} lần thấy trong {elapsed_ms:.1f} ms | chỉ mục {len(self.index)} biển số")
+
+    def closeEvent(self, event):
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+        super().closeEvent(event)
+
 
 class VideoModeApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.playing = False
         self.video_path = None
-        self.cap = None
+        self.worker = None  # Giải mã + nhận diện chạy ở thread nền, GUI chỉ vẽ frame mới nhất
+        self.shown_serial = 0
         self.total_frames = 0
         self.fps = 0
         self.current_frame = 0
@@ -26,16 +213,51 @@ class VideoModeApp(QMainWindow):
 
         # For license plate detection
         self.detection_mode = False
-        self.detected_plates = []
+        # Sự kiện biển số (gộp theo text trong cửa sổ thời gian), frame mới cần vạch trên dải thumbnail
+        self.plate_events = PlateEventStore()
+        self.pending_markers = deque()
+        # Mọi lần đọc (kèm crop biển số) được lưu vào SQLite bởi thread ghi riêng
+        self.plate_db = PlateDatabaseWriter(crop_dir=CROP_DIR)
+        self.search_panel = None
+        # Danh sách theo dõi: mọi lần OCR được so khớp ngay trên thread worker, cảnh báo chuyển về thread GUI
+        self.pending_alerts = deque()
+        self.watch_tracks = {}  # track id -> biển số trong danh sách, để tô box các xe đang theo dõi
+        self.watchlist = load_watchlist(on_alert=self.pending_alerts.append)
+        # Xuất video đã chú thích: encoder chạy ở thread riêng, không làm chậm phát/nhận diện
+        self.video_exporter = None
         self.was_playing = False
 
         # Tải model chỉ khi cần thiết để tránh lag lúc khởi động
         self.models_loaded = False
-        self.plate_detector = None
-
-        # Thêm biến để tối ưu hiệu suất
-        self.skip_frames = 5  # Chỉ xử lý 1 frame sau mỗi 5 frame
-        self.frame_count = 0
+        self.pipeline = None
+
+        # Tần suất chạy detector được chọn theo độ trễ đo được và budget mỗi frame
+        self.latency_budget = 0.8
+        self.scheduler = AdaptiveDetectionScheduler(30, self.latency_budget)
+        # Dự đoán box biển số ở các frame không chạy detector
+        self.plate_tracker = PlateTracker()
+        # Bỏ qua YOLO + OCR khi cảnh đứng yên (camera cố định)
+        self.motion_gate = MotionGate('medium')
+        # Scheduler/tracker/cổng chuyển động chỉ được đổi trên thread worker: thread GUI chỉ ghi yêu cầu
+        # vào đây, annotate_frame áp dụng trước khi xử lý frame kế tiếp
+        self.reset_lock = threading.Lock()
+        self.pending_reset = {}
+
+        # Đa giác ROI (toạ độ chuẩn hoá) của video hiện tại, chỉ phát hiện trong các vùng này
+        self.rois = []
+        self.roi_editing = False
+        self.roi_points = []
+        self.last_frame = None
+        self.display_rect = None  # (x, y, w, h) của ảnh đã scale bên trong video_frame
+        self.thumbnails = None
+
+        # Đo thời gian từng bước để hiển thị overlay thống kê / xuất Chrome trace
+        self.stage_timer = StageTimer()
+        # Resize bằng OpenCV vào buffer dùng lại, không đổi màu/scale full-frame mỗi lần vẽ
+        self.presenter = FramePresenter()
+        self.show_stats = False
+        self.overlay_stages = ('decode', 'seek', 'inference', 'roi_pack', 'plate_detection', 'ocr_preprocess', 'ocr_recognize',
+                               'draw', 'convert', 'scale')
 
         self.initUI()
 
@@ -118,8 +340,12 @@ class VideoModeApp(QMainWindow):
         """)
         self.video_frame.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.video_frame.setMinimumHeight(500)
+        self.video_frame.installEventFilter(self)  # Click chuột để vẽ ROI
         video_layout.addWidget(self.video_frame)
 
+        # Thumbnail strip above the timeline
+        self.thumbnail_strip = ThumbnailStripWidget(self.seek_from_strip)
+
         # Time display and slider
         time_layout = QHBoxLayout()
         self.current_time = QLabel("00:00")
@@ -129,9 +355,9 @@ class VideoModeApp(QMainWindow):
 
         self.timeline = QSlider(Qt.Horizontal)
         self.timeline.setRange(0, 100)
-        self.timeline.sliderMoved.connect(self.seek_position)
+        self.timeline.sliderMoved.connect(self.preview_position)
         self.timeline.sliderPressed.connect(self.pause_video)
-        self.timeline.sliderReleased.connect(self.resume_video_if_playing)
+        self.timeline.sliderReleased.connect(self.release_timeline)
 
         time_layout.addWidget(self.current_time)
         time_layout.addWidget(self.timeline, 1)
@@ -218,11 +444,73 @@ class VideoModeApp(QMainWindow):
         self.volume_slider.setValue(70)
         self.volume_slider.valueChanged.connect(self.set_volume)
 
+        # Stats overlay button
+        self.stats_button = QPushButton("📊 Thống kê")
+        self.stats_button.setFixedHeight(40)
+        self.stats_button.setStyleSheet("""
+            QPushButton {
+                background-color: #555;
+                color: white;
+                border-radius: 5px;
+                padding: 5px 15px;
+            }
+            QPushButton:hover {
+                background-color: #666;
+            }
+        """)
+        self.stats_button.setToolTip("Hiện thời gian từng bước (S), xuất Chrome trace (T)")
+        self.stats_button.clicked.connect(self.toggle_stats)
+
+        # Fuzzy plate search button
+        self.search_button = QPushButton("🔎 Tìm biển số")
+        self.search_button.setFixedHeight(40)
+        self.search_button.setStyleSheet("""
+            QPushButton {
+                background-color: #555;
+                color: white;
+                border-radius: 5px;
+                padding: 5px 15px;
+            }
+            QPushButton:hover {
+                background-color: #666;
+            }
+        """)
+        self.search_button.setToolTip("Tìm gần đúng biển số đã lưu (/)")
+        self.search_button.clicked.connect(self.show_search_panel)
+
+        # Annotated video export button and what to do when the encoder falls behind
+        self.export_button = QPushButton("⏺ Xuất video")
+        self.export_button.setFixedHeight(40)
+        self.export_button.setStyleSheet("""
+            QPushButton {
+                background-color: #555;
+                color: white;
+                border-radius: 5px;
+                padding: 5px 15px;
+            }
+            QPushButton:hover {
+                background-color: #666;
+            }
+        """)
+        self.export_button.setToolTip("Ghi video đã chú thích ra file trong lúc phát")
+        self.export_button.clicked.connect(self.toggle_export)
+        self.export_button.setEnabled(False)
+
+        self.export_policy_box = QComboBox()
+        self.export_policy_box.setFixedHeight(40)
+        self.export_policy_box.addItem("Encoder chậm: bỏ frame", 'drop')
+        self.export_policy_box.addItem("Encoder chậm: lặp frame", 'duplicate')
+        self.export_policy_box.setToolTip("Bỏ frame: video xuất ngắn hơn; lặp frame: giữ đúng thời lượng gốc")
+
         controls_layout.addWidget(open_button)
         controls_layout.addStretch(1)
         controls_layout.addWidget(self.stop_button)
         controls_layout.addWidget(self.play_button)
         controls_layout.addWidget(self.detection_button)
+        controls_layout.addWidget(self.stats_button)
+        controls_layout.addWidget(self.search_button)
+        controls_layout.addWidget(self.export_button)
+        controls_layout.addWidget(self.export_policy_box)
         controls_layout.addStretch(1)
         controls_layout.addWidget(volume_label)
         controls_layout.addWidget(self.volume_slider)
@@ -233,6 +521,12 @@ class VideoModeApp(QMainWindow):
         self.status_label.setFont(QFont('Segoe UI', 9))
         self.status_layout.addWidget(self.status_label)
 
+        # Detection rate chosen by the adaptive scheduler
+        self.rate_label = QLabel("")
+        self.rate_label.setFont(QFont('Segoe UI', 9))
+        self.rate_label.setAlignment(Qt.AlignCenter)
+        self.status_layout.addWidget(self.rate_label)
+
         # Recognition results
         self.results_label = QLabel("Đã nhận diện: 0 biển số")
         self.results_label.setFont(QFont('Segoe UI', 9))
@@ -242,6 +536,7 @@ class VideoModeApp(QMainWindow):
         # Add components to main layout
         main_layout.addLayout(header_layout)
         main_layout.addWidget(video_container, 1)
+        main_layout.addWidget(self.thumbnail_strip)
         main_layout.addLayout(time_layout)
         main_layout.addLayout(controls_layout)
         main_layout.addLayout(self.status_layout)
@@ -276,11 +571,8 @@ class VideoModeApp(QMainWindow):
             return True
 
         try:
-            from ultralytics import YOLO
-            import easyocr
-
-            self.plate_detector = YOLO('license_plate_detector.pt')
-            self.reader = easyocr.Reader(['en'])  # Initialize for English characters
+            self.pipeline = connect_pipeline('video')
+            self.pipeline.load_models()
 
             self.models_loaded = True
             self.status_label.setText("Trạng thái: Model đã được tải")
@@ -298,18 +590,35 @@ class VideoModeApp(QMainWindow):
             try:
                 # Close previous video if open
                 self.stop_video()
+                self.close_worker()
 
                 # Open new video file
                 self.video_path = file_name
-                self.cap = cv2.VideoCapture(file_name)
-
-                if not self.cap.isOpened():
+                try:
+                    # Chưa chạy thread: frame đầu tiên phải được chú thích với trạng thái của video mới
+                    self.worker = VideoWorker(file_name, annotate=self.annotate_frame, timer=self.stage_timer,
+                                              autostart=False)
+                except IOError:
                     QMessageBox.critical(self, "Lỗi", "Không thể mở video. Vui lòng thử lại với file khác.")
                     return
 
                 # Get video properties
-                self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-                self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                self.fps = self.worker.fps
+                self.total_frames = self.worker.total_frames
+                self.scheduler = AdaptiveDetectionScheduler(self.fps, self.latency_budget)
+                self.rois = load_rois(file_name)
+
+                # Thumbnail được tạo ở thread nền (hoặc nạp từ cache) trong lúc video đã phát được
+                self.thumbnails = ThumbnailStrip(file_name, self.fps, self.total_frames)
+                self.thumbnails.start()
+                self.thumbnail_strip.set_strip(self.thumbnails, self.total_frames)
+                self.load_saved_markers(file_name)
+                self.plate_tracker = PlateTracker(max_age=max(1, int(round(self.fps))))
+                self.motion_gate.reset()
+                self.plate_events.clear()
+                self.pending_markers.clear()
+                self.watch_tracks = {}
+                self.worker.start()
                 duration_seconds = self.total_frames / self.fps if self.fps > 0 else 0
 
                 # Update UI
@@ -323,135 +632,285 @@ class VideoModeApp(QMainWindow):
                 self.total_time.setText(duration_str)
                 self.current_time.setText("00:00")
 
-                # Display first frame
-                ret, frame = self.cap.read()
-                if ret:
-                    self.display_frame(frame)
+                # First frame is shown by the worker while paused
+                self.shown_serial = 0
+                self.frame_update_timer.start(10)
 
                 # Enable controls
                 self.play_button.setEnabled(True)
                 self.stop_button.setEnabled(True)
                 self.detection_button.setEnabled(True)
+                self.export_button.setEnabled(True)
 
                 # Update status
                 self.status_label.setText(f"Trạng thái: Đã mở video - {os.path.basename(file_name)}")
                 self.results_label.setText("Đã nhận diện: 0 biển số")
-                self.detected_plates = []
 
             except Exception as e:
                 QMessageBox.critical(self, "Lỗi", f"Lỗi khi mở video: {str(e)}")
                 self.status_label.setText("Trạng thái: Lỗi khi mở video")
 
-    def display_frame(self, frame):
-        # Convert frame for display
-        height, width, channel = frame.shape
-        bytes_per_line = 3 * width
+    def load_saved_markers(self, file_name):
+        """Vẽ lại mốc biển số đã lưu trong CSDL từ các lần mở video này trước đó"""
+        try:
+            database = PlateDatabase()
+            try:
+                self.thumbnail_strip.add_markers(database.source_frames(file_name))
+            finally:
+                database.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Không đọc được mốc biển số đã lưu: {e}")
+
+    def annotate_frame(self, frame, frame_index):
+        # Chạy trên thread nền của VideoWorker: không được chạm vào widget Qt ở đây
+        self.apply_pending_reset()
+        if not self.detection_mode:
+            return frame
+        t0 = time.perf_counter()
+        moving, motion_started = self.motion_gate.update(frame)
+        if motion_started:
+            self.scheduler.reset()  # Có chuyển động trở lại: nhận diện ngay frame này
+        if moving:
+            detect = self.scheduler.should_detect(frame_index)
+        else:
+            detect = False
+            self.plate_tracker.hold(frame_index)
+        result_frame = self.detect_license_plates(frame, frame_index, detect)
+        self.scheduler.record_frame(frame_index, (time.perf_counter() - t0) * 1000, detect)
+        return result_frame
 
-        # If detection mode is on, process the frame
-        if self.detection_mode:
-            frame = self.detect_license_plates(frame)
+    def request_reset(self, motion=True, sensitivity=None):
+        # Thread GUI: không reset trực tiếp vì annotate_frame có thể đang dùng các đối tượng này
+        with self.reset_lock:
+            self.pending_reset['scheduler'] = True
+            self.pending_reset['tracker'] = True
+            if motion:
+                self.pending_reset['motion'] = True
+            if sensitivity is not None:
+                self.pending_reset['sensitivity'] = sensitivity
+
+    def apply_pending_reset(self):
+        # Thread worker, giữa hai frame
+        with self.reset_lock:
+            pending, self.pending_reset = self.pending_reset, {}
+        if not pending:
+            return
+        if 'sensitivity' in pending:
+            self.motion_gate.set_sensitivity(pending['sensitivity'])
+        if pending.get('scheduler'):
+            self.scheduler.reset()
+        if pending.get('tracker'):
+            self.collect_track_results(None, None, self.plate_tracker.reset())
+        if pending.get('motion'):
+            self.motion_gate.reset()
+        if pending.get('watchlist'):
+            self.recheck_watchlist()
+
+    def display_frame(self, frame):
+        timer = self.stage_timer
+        with timer.stage('scale'):
+            # Scale to fit (keeping aspect ratio) in OpenCV before any Qt conversion
+            self.presenter.scale(frame, self.video_frame.width(), self.video_frame.height())
 
-        # Convert to RGB (OpenCV uses BGR)
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with timer.stage('convert'):
+            # BGR QImage over the reused buffer, one copy into the pixmap
+            scaled_pixmap = QPixmap.fromImage(self.presenter.qimage())
 
-        # Convert to QPixmap and display
-        q_img = QImage(frame_rgb.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_img)
+        self.last_frame = frame
+        self.display_rect = ((self.video_frame.width() - scaled_pixmap.width()) // 2,
+                             (self.video_frame.height() - scaled_pixmap.height()) // 2,
+                             scaled_pixmap.width(), scaled_pixmap.height())
 
-        # Scale to fit but maintain aspect ratio
-        scaled_pixmap = pixmap.scaled(self.video_frame.width(), self.video_frame.height(),
-                                      Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if self.roi_editing or self.show_stats:
+            self.draw_roi_overlay(scaled_pixmap)
+        if self.show_stats:
+            self.draw_stats_overlay(scaled_pixmap)
 
         self.video_frame.setPixmap(scaled_pixmap)
         self.video_frame.setAlignment(Qt.AlignCenter)
 
     def update_frame(self):
-        if self.cap is None or not self.cap.isOpened() or not self.playing:
+        # Chỉ vẽ frame mới nhất mà worker đã xử lý xong, các frame cũ hơn bị bỏ qua
+        if self.worker is None:
             return
+        self.thumbnail_strip.poll()
 
-        ret, frame = self.cap.read()
-        if ret:
-            self.display_frame(frame)
-            self.current_frame += 1
-            self.timeline.setValue(self.current_frame)
-
-            # Update time display
-            if self.fps > 0:
-                current_time = self.current_frame / self.fps
-                time_str = str(timedelta(seconds=int(current_time)))
-                if time_str.startswith('0:'):
-                    time_str = time_str[2:]  # Remove leading '0:'
-                self.current_time.setText(time_str)
-        else:
+        if self.worker.finished and self.playing:
             # End of video
             self.stop_video()
+            return
+
+        latest = self.worker.take_latest()
+        if latest is None or latest[0] == self.shown_serial:
+            return
+        self.shown_serial, frame_index, frame = latest
+
+        self.display_frame(frame)
+        if self.playing:
+            self.stage_timer.tick_frame(1.0 / self.fps if self.fps > 0 else None)
+        self.results_label.setText(f"Đã nhận diện: {len(self.plate_events)} biển số")
+        if self.pending_markers:
+            markers = []
+            while self.pending_markers:
+                markers.append(self.pending_markers.popleft())
+            self.thumbnail_strip.add_markers(markers)
+        if self.pending_alerts:
+            self.show_watchlist_alerts()
+        if self.detection_mode:
+            self.rate_label.setText(f"{self.scheduler.describe()} | {self.motion_gate.describe()}")
+        if self.video_exporter is not None:
+            self.export_button.setToolTip(self.video_exporter.describe())
+            if not self.detection_mode:
+                self.rate_label.setText(self.video_exporter.describe())
+
+        if not self.timeline.isSliderDown():
+            self.thumbnail_strip.set_position(frame_index)
+            self.current_frame = frame_index
+            self.timeline.setValue(frame_index)
+            self.update_time_label(frame_index)
+
+    def update_time_label(self, frame_index):
+        if self.fps > 0:
+            current_time = frame_index / self.fps
+            time_str = str(timedelta(seconds=int(current_time)))
+            if time_str.startswith('0:'):
+                time_str = time_str[2:]  # Remove leading '0:'
+            self.current_time.setText(time_str)
 
     def toggle_play(self):
-        if self.cap is None or not self.cap.isOpened():
+        if self.worker is None:
             return
 
         self.playing = not self.playing
 
         if self.playing:
             self.play_button.setText("⏸ Tạm dừng")
-            self.frame_update_timer.start(int(1000 / self.fps) if self.fps > 0 else 30)
+            if self.worker.finished:
+                self.worker.seek(0)
+            self.worker.play()
             self.status_label.setText(f"Trạng thái: Đang phát - {os.path.basename(self.video_path)}")
         else:
             self.play_button.setText("▶ Phát")
-            self.frame_update_timer.stop()
+            self.worker.pause()
             self.status_label.setText(f"Trạng thái: Tạm dừng - {os.path.basename(self.video_path)}")
 
     def stop_video(self):
         self.playing = False
         self.play_button.setText("▶ Phát")
 
-        if self.frame_update_timer.isActive():
-            self.frame_update_timer.stop()
-
-        if self.cap is not None and self.cap.isOpened():
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            ret, frame = self.cap.read()
-            if ret:
-                self.display_frame(frame)
-                self.current_frame = 0
-                self.timeline.setValue(0)
-                self.current_time.setText("00:00")
+        if self.worker is not None:
+            # Huỷ frame đang chờ/đang nhận diện rồi quay về frame đầu
+            self.worker.pause()
+            self.worker.seek(0)
+            self.current_frame = 0
+            self.timeline.setValue(0)
+            self.current_time.setText("00:00")
 
         self.status_label.setText(f"Trạng thái: Dừng - {os.path.basename(self.video_path) if self.video_path else ''}")
 
     def seek_position(self, position):
-        if self.cap is None or not self.cap.isOpened():
+        if self.worker is None:
             return
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
-        ret, frame = self.cap.read()
-        if ret:
-            self.display_frame(frame)
-            self.current_frame = position
+        # Worker bỏ các frame cũ và hiện frame tại vị trí mới
+        self.request_reset()
+        self.worker.seek(position)
+        self.current_frame = position
+        self.update_time_label(position)
 
-            # Update time display
-            if self.fps > 0:
-                current_time = position / self.fps
-                time_str = str(timedelta(seconds=int(current_time)))
-                if time_str.startswith('0:'):
-                    time_str = time_str[2:]  # Remove leading '0:'
-                self.current_time.setText(time_str)
+    def preview_position(self, position):
+        # Khi đang kéo: chỉ hiện ảnh thu nhỏ của keyframe gần nhất, frame chính xác khi thả chuột
+        if self.worker is None:
+            return
+        self.worker.seek(position, preview=True)
+        self.update_time_label(position)
 
-        # Reset position back one frame to avoid skipping
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+    def release_timeline(self):
+        self.seek_position(self.timeline.value())
+        self.resume_video_if_playing()
 
     def pause_video(self):
         if self.playing:
             self.was_playing = True
             self.playing = False
-            self.frame_update_timer.stop()
+            self.worker.pause()
         else:
             self.was_playing = False
 
     def resume_video_if_playing(self):
         if self.was_playing:
             self.playing = True
-            self.frame_update_timer.start(int(1000 / self.fps) if self.fps > 0 else 30)
+            self.worker.play()
+
+    def seek_from_strip(self, frame_index):
+        frame_index = min(max(0, frame_index), max(0, self.total_frames - 1))
+        self.timeline.setValue(frame_index)
+        self.seek_position(frame_index)
+
+    def show_search_panel(self):
+        if self.search_panel is None:
+            self.search_panel = PlateSearchPanel(self.open_search_read)
+        self.search_panel.show()
+        self.search_panel.raise_()
+        self.search_panel.activateWindow()
+
+    def open_search_read(self, read):
+        # Chỉ seek được khi lần đọc thuộc video đang mở
+        if read['source'] == self.video_path and read['frame'] is not None and self.worker is not None:
+            if self.playing:
+                self.toggle_play()
+            self.seek_from_strip(read['frame'])
+            self.activateWindow()
+        else:
+            self.status_label.setText(f"Trạng thái: {read['text']} thuộc {os.path.basename(read['source'])}")
+
+    def toggle_export(self):
+        if self.video_exporter is not None:
+            self.stop_export()
+            return
+        if self.worker is None:
+            return
+        default_name = os.path.splitext(self.video_path)[0] + '_annotated.mp4'
+        file_name, _ = QFileDialog.getSaveFileName(self, "Lưu video đã chú thích", default_name,
+                                                   "Video Files (*.mp4 *.avi);;All Files (*)")
+        if not file_name:
+            return
+        fourcc = 'XVID' if file_name.lower().endswith('.avi') else 'mp4v'
+        self.video_exporter = AnnotatedVideoWriter(file_name, self.fps, self.export_policy_box.currentData(),
+                                                   fourcc=fourcc)
+        self.worker.sink = self.video_exporter.submit
+        self.export_policy_box.setEnabled(False)
+        self.export_button.setText("⏹ Dừng xuất")
+        self.status_label.setText(f"Trạng thái: Đang xuất video - {os.path.basename(file_name)}")
+
+    def stop_export(self, wait=False):
+        if self.video_exporter is None:
+            return
+        if self.worker is not None:
+            self.worker.sink = None
+        # Thread ghi tự ghi nốt hàng đợi rồi đóng file, không chặn giao diện
+        self.video_exporter.close(wait=wait)
+        self.status_label.setText(f"Trạng thái: {self.video_exporter.describe()} -> "
+                                  f"{os.path.basename(self.video_exporter.path)}")
+        self.video_exporter = None
+        self.export_policy_box.setEnabled(True)
+        self.export_button.setText("⏺ Xuất video")
+        self.export_button.setToolTip("Ghi video đã chú thích ra file trong lúc phát")
+
+    def close_worker(self):
+        self.stop_export()
+        if self.thumbnails is not None:
+            self.thumbnails.cancel()
+            self.thumbnails = None
+        if self.worker is not None:
+            self.frame_update_timer.stop()
+            stopped = self.worker.stop()
+            self.worker = None
+            if stopped:
+                # Thread worker đã dừng: báo nốt các biển số đã đọc nhưng track chưa chốt
+                self.collect_track_results(None, None, self.plate_tracker.flush())
+            else:
+                print("[WARN] Thread xử lý video chưa dừng sau timeout, bỏ qua các track chưa chốt")
 
     def set_volume(self, value):
         # This is just a placeholder for volume functionality
@@ -498,24 +957,17 @@ class VideoModeApp(QMainWindow):
             """)
             self.status_label.setText(f"Trạng thái: {os.path.basename(self.video_path)}")
 
+        self.request_reset()
+        if not self.detection_mode:
+            self.rate_label.setText("")
+
         # Update current frame with/without detection
-        if self.cap is not None and self.cap.isOpened():
-            # Store current position
-            current_pos = self.current_frame
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, current_pos)
-            ret, frame = self.cap.read()
-            if ret:
-                self.display_frame(frame)
-                # Reset position back
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, current_pos)
-
-    def detect_license_plates(self, frame):
-        # Increment frame counter
-        self.frame_count += 1
-
-        # Only process every few frames to improve performance
-        if self.frame_count % self.skip_frames != 0 and hasattr(self, 'last_detection_result'):
-            return self.last_detection_result
+        if self.worker is not None and not self.playing:
+            self.worker.seek(self.current_frame)
+
+    def detect_license_plates(self, frame, frame_index=None, detect=True):
+        if frame_index is None:
+            frame_index = self.current_frame
 
         # Clone frame to avoid modifying original
         result_frame = frame.copy()
@@ -523,90 +975,45 @@ class VideoModeApp(QMainWindow):
         if not hasattr(self, 'models_loaded') or not self.models_loaded:
             cv2.putText(result_frame, "Model không được tải", (10, 30),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            self.last_detection_result = result_frame
+            return result_frame
+
+        # Scheduler decides which frames run the detector; the others get tracker predictions
+        if not detect:
+            self.plate_tracker.predict(frame_index)
+            with self.stage_timer.stage('draw'):
+                plates = self.plate_tracker.plates(frame.shape)
+                draw_plates(result_frame, plates)
+                self.draw_watchlist_hits(result_frame, plates)
+            self.collect_track_results(frame, frame_index)
             return result_frame
 
         try:
-            # Initialize EasyOCR if not already done
-            if not hasattr(self, 'reader'):
-                self.reader = easyocr.Reader(['en'])  # Initialize for English characters
-
-            # Perform detection with YOLOv8
-            results = self.plate_detector(frame, conf=0.4)
-
-            for result in results:
-                boxes = result.boxes.cpu().numpy()
-                for box in boxes:
-                    # Get license plate coordinates
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                    # Extract license plate region
-                    plate_roi = frame[y1:y2, x1:x2]
-
-                    if plate_roi.size == 0:
-                        continue
-
-                    # Preprocess image for better OCR
-                    # Convert to grayscale
-                    gray_plate = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
-
-                    # Enhance contrast
-                    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                    enhanced = clahe.apply(gray_plate)
-
-                    # Apply bilateral filter to preserve edges while reducing noise
-                    filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
-
-                    # Apply adaptive thresholding
-                    binary = cv2.adaptiveThreshold(
-                        filtered, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                        cv2.THRESH_BINARY, 11, 2
-                    )
-
-                    # Resize image to better handle text recognition
-                    resized = cv2.resize(binary, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-
-                    # Use EasyOCR for text detection
-                    ocr_results = self.reader.readtext(resized)
-
-                    # Process OCR results
-                    if ocr_results:
-                        # Extract text from results
-                        plate_text = ''.join([result[1] for result in ocr_results])
-
-                        # Clean up text - remove non-alphanumeric characters
-                        plate_text = re.sub(r'[^A-Z0-9]', '', plate_text.upper())
-
-                        # If we have a reasonable-length text
-                        if len(plate_text) >= 4:
-                            # Draw rectangle around the license plate
-                            cv2.rectangle(result_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                            # Add background for text
-                            text_width = len(plate_text) * 15
-                            cv2.rectangle(result_frame, (x1, y1 - 30), (x1 + text_width, y1), (0, 255, 0), -1)
-
-                            # Display the recognized text
-                            cv2.putText(result_frame, plate_text, (x1 + 5, y1 - 10),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-
-                            # Store plate information if it's new
-                            plate_info = {'x': x1, 'y': y1, 'w': x2 - x1, 'h': y2 - y1,
-                                          'frame': self.current_frame, 'text': plate_text}
-
-                            if not any(abs(plate['x'] - x1) < 20 and abs(plate['y'] - y1) < 20 for plate in
-                                       self.detected_plates):
-                                self.detected_plates.append(plate_info)
-                                self.results_label.setText(f"Đã nhận diện: {len(self.detected_plates)} biển số")
-                        else:
-                            # Draw red rectangle if text is invalid
-                            cv2.rectangle(result_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                    else:
-                        # Draw red rectangle if no text was detected
-                        cv2.rectangle(result_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-            # Save result for reuse on skipped frames
-            self.last_detection_result = result_frame
+            # Vehicle-free cascade: plate detector on the full frame
+            t0 = time.perf_counter()
+            with self.stage_timer.stage('inference'):
+                result = self.pipeline.detect(frame, self.rois or None)
+                self.plate_tracker.update(result['plates'], frame_index)
+
+                # OCR only plates whose track has not settled on a text yet
+                pending = self.plate_tracker.needs_ocr(result['plates'])
+                if pending:
+                    t_ocr = time.perf_counter()
+                    rois = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (plate['bbox'] for plate in pending)]
+                    ocr = self.pipeline.recognize_plates(rois)
+                    self.plate_tracker.add_reads(pending, ocr['reads'])
+                    self.check_watchlist(frame, frame_index, pending, ocr['reads'])
+            # Chi tiết từng bước được đo trong pipeline (có thể ở inference server)
+            self.stage_timer.record_breakdown(t0, result['timings'],
+                                              ('roi_pack', 'vehicle_detection', 'plate_detection'))
+            if pending:
+                self.stage_timer.record_breakdown(t_ocr, ocr['timings'], ('ocr_preprocess', 'ocr_recognize'))
+
+            with self.stage_timer.stage('draw'):
+                plates = self.plate_tracker.plates(frame.shape)
+                draw_plates(result_frame, plates)
+                self.draw_watchlist_hits(result_frame, plates)
+
+            self.collect_track_results(frame, frame_index)
 
         except Exception as e:
             print(f"Error in license plate detection: {str(e)}")
@@ -614,82 +1021,202 @@ class VideoModeApp(QMainWindow):
             traceback.print_exc()
             cv2.putText(result_frame, "Lỗi nhận diện", (10, 30),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            self.last_detection_result = result_frame
 
         return result_frame
 
-    def process_plate(self, frame, x1, y1, x2, y2):
-        """Process a detected license plate region"""
-        # Extract license plate ROI
-        plate_roi = frame[y1:y2, x1:x2]
-
-        if plate_roi.size == 0:
+    def check_watchlist(self, frame, frame_index, plates, reads):
+        # Từng lần OCR được so khớp ngay (không chờ track chốt text) để cảnh báo trong vòng một frame
+        watchlist = self.watchlist
+        if watchlist is None:
+            return
+        seconds = frame_index / self.fps if self.fps > 0 else None
+        for plate, read in zip(plates, reads):
+            if not read['valid']:
+                continue
+            # Tô box theo kết quả khớp; check() chỉ quyết định có cảnh báo (cooldown) hay không
+            matches = watchlist.match(read['text'])
+            if matches:
+                self.watch_tracks[plate['track_id']] = matches[0][0]
+                watchlist.check(read['text'], self.video_path, frame_index, seconds, plate['bbox'], frame)
+
+    def recheck_watchlist(self):
+        # Thread worker, sau khi nạp danh sách mới: các track đã chốt text không còn được OCR
+        # nên phải so khớp lại ở đây
+        watchlist = self.watchlist
+        if watchlist is None:
+            return
+        for track in self.plate_tracker.tracks:
+            matches = watchlist.match(track.text) if track.text else []
+            if not matches:
+                continue
+            self.watch_tracks[track.id] = matches[0][0]
+            seconds = track.last_update / self.fps if self.fps > 0 else None
+            watchlist.check(track.text, self.video_path, track.last_update, seconds, track.plate['bbox'])
+
+    def draw_watchlist_hits(self, image, plates):
+        for plate in plates:
+            listed = self.watch_tracks.get(plate['track_id'])
+            if listed is None:
+                continue
+            x1, y1, x2, y2 = plate['bbox']
+            cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 255), 4)
+            cv2.putText(image, f"WATCHLIST {listed}", (x1, y2 + 25),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 2)
+
+    def show_watchlist_alerts(self):
+        # Thread GUI: lưu ảnh frame khớp và báo trên thanh trạng thái
+        while self.pending_alerts:
+            alert = self.pending_alerts.popleft()
+            snapshot = ''
+            if alert['frame'] is not None:
+                alert_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watchlist_alerts')
+                os.makedirs(alert_dir, exist_ok=True)
+                snapshot = os.path.join(alert_dir, f"{alert['plate']}_{int(alert['time'])}_{alert['frame_index']}.jpg")
+                cv2.imwrite(snapshot, alert['frame'])
+            self.status_label.setText(f"⚠ Biển số theo dõi {alert['plate']} (đọc {alert['read']}) tại frame "
+                                      f"{alert['frame_index']} {alert['note']}")
+            self.status_label.setStyleSheet("color: #ff4df0; font-weight: bold;")
+            self.status_label.setToolTip(snapshot)
+
+    def load_watchlist_file(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Chọn danh sách biển số theo dõi",
+                                                   os.path.dirname(WATCHLIST_PATH),
+                                                   "Danh sách (*.txt *.csv);;All Files (*)")
+        if not file_name:
             return
-
-        # Preprocess for better OCR
-        gray_plate = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
-
-        # Apply adaptive thresholding
-        binary_plate = cv2.adaptiveThreshold(
-            gray_plate, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV, 11, 2
-        )
-
-        # Optional: Apply morphological operations to clean the image
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        binary_plate = cv2.morphologyEx(binary_plate, cv2.MORPH_CLOSE, kernel)
-        binary_plate = cv2.morphologyEx(binary_plate, cv2.MORPH_OPEN, kernel)
-
-        # Invert if needed (white text on black background)
-        if np.mean(binary_plate) > 127:
-            binary_plate = cv2.bitwise_not(binary_plate)
-
-        # Perform OCR on the plate
         try:
-            plate_text = ""
-
-            # Use appropriate OCR engine
-            if hasattr(self, 'ocr_engine'):
-                if self.ocr_engine == "tesseract":
-                    # Using Tesseract OCR with specific config for license plates
-                    config = '--oem 3 --psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                    plate_text = self.reader.image_to_string(binary_plate, config=config)
-                    # Clean the text
-                    plate_text = ''.join(c for c in plate_text if c.isalnum())
-
-                elif self.ocr_engine == "easyocr":
-                    # Using EasyOCR
-                    results = self.reader.readtext(binary_plate)
-                    plate_text = ' '.join([result[1] for result in results])
-                    # Clean the text
-                    plate_text = ''.join(c for c in plate_text if c.isalnum())
-
-            # If we have valid text of reasonable length
-            if plate_text and 4 <= len(plate_text) <= 12:
-                # Draw rectangle around plate
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                # Show the text above the rectangle
-                cv2.putText(frame, plate_text, (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                # Store the detected plate if it's not already in the list
-                plate_info = {'x': x1, 'y': y1, 'w': x2 - x1, 'h': y2 - y1,
-                              'frame': self.current_frame, 'text': plate_text}
-
-                # Check if this is a new detection
-                if not any(abs(plate['x'] - x1) < 20 and abs(plate['y'] - y1) < 20 for plate in self.detected_plates):
-                    self.detected_plates.append(plate_info)
-                    self.results_label.setText(f"Đã nhận diện: {len(self.detected_plates)} biển số")
-            else:
-                # Draw a different color rectangle if text is invalid
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 165, 255), 2)
-                cv2.putText(frame, "Biển số không rõ", (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
-
+            watchlist = Watchlist.from_file(file_name, on_alert=self.pending_alerts.append)
         except Exception as e:
-            print(f"OCR error: {str(e)}")
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            QMessageBox.critical(self, "Lỗi", f"Không đọc được danh sách theo dõi: {str(e)}")
+            return
+        # Gán một lần: thread worker dùng bản cũ hoặc bản mới, không thấy bản đang nạp dở
+        self.watchlist = watchlist
+        self.watch_tracks = {}
+        with self.reset_lock:
+            self.pending_reset['watchlist'] = True  # Thread worker so khớp lại các track đang sống
+        self.status_label.setStyleSheet("")
+        self.status_label.setText(f"Trạng thái: Đang theo dõi {len(watchlist)} biển số")
+
+    def collect_track_results(self, frame, frame_index, tracks=None):
+        # Mỗi track được báo một lần với text đã chốt qua bỏ phiếu; cùng biển số xuất hiện lại
+        # trong cửa sổ thời gian của kho sự kiện được gộp vào sự kiện cũ.
+        # tracks: các track đã kết thúc sẵn (reset/flush), mặc định lấy từ pop_finished()
+        fps = self.fps if self.fps > 0 else 30.0
+        for track in self.plate_tracker.pop_finished() if tracks is None else tracks:
+            bbox = tuple(int(v) for v in track.plate['bbox'])
+            event, is_new = self.plate_events.add(track.text, track.first_frame, track.first_frame / fps, bbox,
+                                                  reads=track.reads, track_id=track.id, source=self.video_path)
+            x1, y1, x2, y2 = bbox
+            # Track vừa chốt text ở frame này thì box ứng với frame hiện tại: lưu kèm crop
+            crop = None
+            if frame is not None and track.last_update == frame_index:
+                crop = frame[max(0, y1):y2, max(0, x1):x2].copy()
+            # Lưu frame đầu của track, giống mốc trên thanh thumbnail và analyze_video
+            self.plate_db.record(self.video_path, track.text, frame=track.first_frame,
+                                 video_seconds=track.first_frame / fps, bbox=bbox,
+                                 confidence=track.confidence, crop=crop if crop is not None and crop.size else None)
+            if is_new:
+                self.pending_markers.append(event.first_frame)
+
+    def toggle_roi_editing(self):
+        if self.worker is None:
+            return
+        self.roi_editing = not self.roi_editing
+        self.roi_points = []
+        if self.roi_editing:
+            if self.playing:
+                self.toggle_play()
+            self.status_label.setText("Trạng thái: Vẽ ROI - click thêm điểm, Enter đóng đa giác, "
+                                      "Backspace xoá điểm, Delete xoá mọi ROI, R để thoát")
+        else:
+            self.status_label.setText(f"Trạng thái: {len(self.rois)} ROI - {os.path.basename(self.video_path)}")
+        self.refresh_display()
+
+    def eventFilter(self, obj, event):
+        if obj is self.video_frame and self.roi_editing and event.type() == QEvent.MouseButtonPress:
+            point = self.label_to_frame(event.pos())
+            if point is not None:
+                self.roi_points.append(point)
+                self.refresh_display()
+            return True
+        return super().eventFilter(obj, event)
+
+    def label_to_frame(self, pos):
+        """Đổi vị trí click trên video_frame sang toạ độ chuẩn hoá 0..1 của frame"""
+        if self.display_rect is None:
+            return None
+        x, y, w, h = self.display_rect
+        if not (x <= pos.x() < x + w and y <= pos.y() < y + h):
+            return None
+        return ((pos.x() - x) / float(w), (pos.y() - y) / float(h))
+
+    def finish_roi_polygon(self):
+        if len(self.roi_points) < 3:
+            return
+        self.rois.append(self.roi_points)
+        self.roi_points = []
+        self.save_roi_changes()
+
+    def save_roi_changes(self):
+        path = save_rois(self.video_path, self.rois)
+        # Box cũ được tính trên vùng khác, bắt đầu lại từ frame hiện tại
+        self.request_reset(motion=False)
+        self.status_label.setText(f"Trạng thái: Đã lưu {len(self.rois)} ROI - {os.path.basename(path)}")
+        self.refresh_display()
+
+    def refresh_display(self):
+        if self.last_frame is not None:
+            self.display_frame(self.last_frame)
+
+    def draw_roi_overlay(self, pixmap):
+        w, h = pixmap.width(), pixmap.height()
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(QColor(241, 196, 15), 2))
+        for polygon in self.rois:
+            painter.drawPolygon(QPolygon([QPoint(int(x * w), int(y * h)) for x, y in polygon]))
+        if self.roi_points:
+            painter.setPen(QPen(QColor(231, 76, 60), 2, Qt.DashLine))
+            points = [QPoint(int(x * w), int(y * h)) for x, y in self.roi_points]
+            painter.drawPolyline(QPolygon(points))
+            for point in points:
+                painter.drawEllipse(point, 3, 3)
+        painter.end()
+
+    def toggle_stats(self):
+        self.show_stats = not self.show_stats
+        # Chỉ ghi trace khi overlay đang bật để không tốn bộ nhớ
+        self.stage_timer.tracing = self.show_stats
+        self.stage_timer.reset()
+        self.stats_button.setText("📊 Ẩn thống kê" if self.show_stats else "📊 Thống kê")
+
+    def draw_stats_overlay(self, pixmap):
+        lines = self.stage_timer.overlay_lines(self.overlay_stages)
+        if self.worker is not None:
+            lines.append(self.worker.clock.describe())
+        if self.detection_mode:
+            lines.append(self.scheduler.describe())
+            lines.append(self.motion_gate.describe())
+            lines.append(f"OCR: {self.plate_tracker.ocr_reads} lần, bỏ qua {self.plate_tracker.ocr_skipped} "
+                         f"(track đã chốt)")
+        painter = QPainter(pixmap)
+        painter.setFont(QFont('Consolas', 10))
+        line_height = painter.fontMetrics().height()
+        width = max(painter.fontMetrics().width(line) for line in lines) + 16
+        painter.fillRect(8, 8, width, line_height * len(lines) + 12, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(46, 204, 113))
+        for i, line in enumerate(lines):
+            painter.drawText(16, 14 + line_height * (i + 1) - painter.fontMetrics().descent(), line)
+        painter.end()
+
+    def export_trace(self):
+        if not self.stage_timer.trace_events:
+            QMessageBox.information(self, "Chrome trace", "Chưa có dữ liệu. Bật thống kê (S) và phát video trước.")
+            return
+        file_name, _ = QFileDialog.getSaveFileName(self, "Xuất Chrome trace", "video_trace.json",
+                                                   "JSON Files (*.json)")
+        if file_name:
+            count = self.stage_timer.export_chrome_trace(file_name)
+            self.status_label.setText(f"Trạng thái: Đã xuất {count} sự kiện trace - {os.path.basename(file_name)}")
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
@@ -698,16 +1225,50 @@ class VideoModeApp(QMainWindow):
             self.toggle_play()
         elif event.key() == Qt.Key_Left:
             # Go back 5 seconds
-            if self.cap is not None and self.fps > 0:
+            if self.worker is not None and self.fps > 0:
                 new_frame = max(0, self.current_frame - int(5 * self.fps))
                 self.timeline.setValue(new_frame)
                 self.seek_position(new_frame)
         elif event.key() == Qt.Key_Right:
             # Go forward 5 seconds
-            if self.cap is not None and self.fps > 0:
+            if self.worker is not None and self.fps > 0:
                 new_frame = min(self.total_frames - 1, self.current_frame + int(5 * self.fps))
                 self.timeline.setValue(new_frame)
                 self.seek_position(new_frame)
+        elif event.key() == Qt.Key_S:
+            self.toggle_stats()
+        elif event.key() == Qt.Key_T:
+            self.export_trace()
+        elif event.key() in (Qt.Key_BracketLeft, Qt.Key_BracketRight):
+            # Giảm/tăng phần thời gian mỗi frame dành cho nhận diện
+            step = 0.1 if event.key() == Qt.Key_BracketRight else -0.1
+            self.scheduler.set_budget(self.scheduler.budget + step)
+            self.latency_budget = self.scheduler.budget
+            self.rate_label.setText(f"{self.scheduler.describe()} | {self.motion_gate.describe()}")
+        elif event.key() == Qt.Key_R:
+            self.toggle_roi_editing()
+        elif event.key() == Qt.Key_Slash:
+            self.show_search_panel()
+        elif event.key() == Qt.Key_W:
+            self.load_watchlist_file()
+        elif self.roi_editing and event.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self.finish_roi_polygon()
+        elif self.roi_editing and event.key() == Qt.Key_Backspace:
+            self.roi_points = self.roi_points[:-1]
+            self.refresh_display()
+        elif self.roi_editing and event.key() == Qt.Key_Delete:
+            self.rois = []
+            self.roi_points = []
+            self.save_roi_changes()
+        elif event.key() == Qt.Key_M:
+            # Đổi độ nhạy cổng chuyển động: tắt -> thấp -> vừa -> cao
+            levels = ['off'] + list(SENSITIVITY_LEVELS)
+            with self.reset_lock:
+                current = self.pending_reset.get('sensitivity', self.motion_gate.sensitivity)
+                next_level = levels[(levels.index(current) + 1) % len(levels)]
+                self.pending_reset['sensitivity'] = next_level
+                self.pending_reset['motion'] = True
+            self.rate_label.setText(f"{self.scheduler.describe()} | Cổng chuyển động: {next_level}")
         elif event.key() == Qt.Key_F:
             # Toggle fullscreen
             if self.isFullScreen():
@@ -717,8 +1278,11 @@ class VideoModeApp(QMainWindow):
 
     def closeEvent(self, event):
         # Clean up resources before closing
-        if self.cap is not None and self.cap.isOpened():
-            self.cap.release()
+        self.stop_export(wait=True)
+        self.close_worker()
+        self.plate_db.close()
+        if self.search_panel is not None:
+            self.search_panel.close()
 
         # Accept the close event
         event.accept()
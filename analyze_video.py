@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""Phân tích cả video không cần giao diện, nhanh hơn thời gian thực.
+
+Frame được giải mã nhanh nhất có thể ở thread riêng, gom thành batch theo thời
+gian để model biển số chạy một lần cho cả batch, sau đó tracker + bỏ phiếu OCR
+(giống VideoMode) gộp các lần thấy cùng một biển số thành một sự kiện. Mỗi sự
+kiện được ghi ngay ra JSONL hoặc CSV nên chạy qua đêm bị ngắt vẫn giữ được kết quả:
+
+    python analyze_video.py camera1.mp4 --output camera1.jsonl --stride 2
+
+Video dài có thể chia thành các đoạn frame chạy song song trên nhiều process
+(mỗi process có capture và model riêng); sự kiện ở ranh giới đoạn được gộp lại:
+
+    python analyze_video.py archive.mp4 --output archive.csv --workers 16
+"""
+import sys
+import os
+import csv
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from detection_pipeline import create_pipeline, PIPELINE_PRESETS
+from model_backends import BACKENDS, DEFAULT_BACKEND
+from plate_tracker import PlateTracker
+from plate_db import PlateDatabaseWriter, DB_PATH
+from watchlist import Watchlist
+from roi_masks import load_rois
+
+EVENT_FIELDS = ('track_id', 'text', 'first_frame', 'last_frame', 'first_time', 'last_time',
+                'first_seconds', 'last_seconds', 'reads', 'bbox')
+
+
+def format_timestamp(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def iter_frames(path, start=0, end=None, stride=1, queue_size=64):
+    """Sinh (chỉ số frame, frame) từ start tới end (không gồm end), giải mã ở thread riêng"""
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def decode():
+        cap = cv2.VideoCapture(path)
+        try:
+            if start:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            index = start
+            while not stop.is_set() and (end is None or index < end):
+                if (index - start) % stride:
+                    ok = cap.grab()  # Frame bị bỏ qua: không cần giải mã ảnh
+                    frame = None
+                else:
+                    ok, frame = cap.read()
+                if not ok:
+                    break
+                if frame is not None:
+                    frames.put((index, frame))
+                index += 1
+        finally:
+            cap.release()
+            frames.put(None)
+
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Giải phóng chỗ trong hàng đợi để thread decoder thoát được
+        while thread.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class EventWriter:
+    """Ghi sự kiện biển số ra .jsonl hoặc .csv (theo đuôi file), hoặc JSONL ra stdout"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8', newline='') if path else sys.stdout
+        self.csv = None
+        if path and path.lower().endswith('.csv'):
+            self.csv = csv.DictWriter(self.file, fieldnames=EVENT_FIELDS)
+            self.csv.writeheader()
+        self.count = 0
+
+    def write(self, event):
+        if self.csv is not None:
+            self.csv.writerow(dict(event, bbox=' '.join(str(v) for v in event['bbox'])))
+        else:
+            self.file.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ProgressBar:
+    def __init__(self, total, stream=sys.stderr, width=30, interval=0.5):
+        self.total = total
+        self.stream = stream
+        self.width = width
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_draw = 0.0
+        self.done = 0
+
+    def update(self, done, extra='', force=False):
+        self.done = done
+        now = time.perf_counter()
+        if not force and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            fraction = min(1.0, done / float(self.total))
+            filled = int(self.width * fraction)
+            eta = format_timestamp(max(0, self.total - done) / rate)[:8] if rate > 0 else '--:--:--'
+            line = (f"\r[{'#' * filled}{'.' * (self.width - filled)}] {fraction:6.1%} "
+                    f"{done}/{self.total} frame  {rate:6.1f} fps  ETA {eta}  {extra}")
+        else:
+            line = f"\r{done} frame  {rate:6.1f} fps  {extra}"
+        self.stream.write(line)
+        self.stream.flush()
+
+    def close(self, done=None, extra=''):
+        self.update(self.done if done is None else done, extra, force=True)
+        self.stream.write('\n')
+
+
+def track_event(track, fps):
+    x1, y1, x2, y2 = (int(v) for v in track.plate['bbox'])
+    return {'track_id': track.id, 'text': track.text,
+            'first_frame': track.first_frame, 'last_frame': track.last_update,
+            'first_time': format_timestamp(track.first_frame / fps),
+            'last_time': format_timestamp(track.last_update / fps),
+            'first_seconds': round(track.first_frame / fps, 3),
+            'last_seconds': round(track.last_update / fps, 3),
+            'reads': track.reads, 'bbox': [x1, y1, x2, y2]}
+
+
+def analyze_video(path, pipeline, on_event, batch_size=8, stride=1, rois=None,
+                  start=0, end=None, progress=None, count_end=None):
+    """Phân tích frame [start, end) của video, gọi on_event(dict) cho mỗi biển số; trả về thống kê
+
+    count_end: chỉ đếm frame / phát hiện / lần OCR của frame trước count_end vào thống kê
+    (phần overlap của một đoạn đã được đoạn sau đếm).
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Không thể mở video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    # Một số file / stream không báo số frame (0 hoặc -1): khi đó đọc tới hết video
+    if total_frames > 0 and (end is None or end > total_frames):
+        end = total_frames
+
+    pipeline.load_models()
+    # Track sống tối đa 1 giây không thấy lại, tính theo chỉ số frame gốc
+    tracker = PlateTracker(max_age=max(stride, int(round(fps))))
+    stats = {'frames': 0, 'detections': 0, 'ocr_reads': 0, 'events': 0}
+    t_start = time.perf_counter()
+
+    def emit(tracks):
+        for track in tracks:
+            on_event(track_event(track, fps))
+            stats['events'] += 1
+
+    def counted(index):
+        return count_end is None or index < count_end
+
+    def run_batch(batch):
+        results = pipeline.detect_batch([frame for _, frame in batch], rois)
+        pending, crops = [], []
+        for (index, frame), result in zip(batch, results):
+            tracker.update(result['plates'], index)
+            plates_to_read = tracker.needs_ocr(result['plates'])
+            if counted(index):
+                stats['detections'] += len(result['plates'])
+                stats['ocr_reads'] += len(plates_to_read)
+            for plate in plates_to_read:
+                x1, y1, x2, y2 = plate['bbox']
+                pending.append(plate)
+                crops.append(frame[y1:y2, x1:x2])
+        if crops:
+            # OCR tất cả biển số chưa chốt của cả batch trong một lần gọi
+            tracker.add_reads(pending, pipeline.recognize_plates(crops)['reads'])
+        emit(tracker.pop_finished())
+
+    batch = []
+    last_index = start - 1
+    for index, frame in iter_frames(path, start, end, stride):
+        last_index = index
+        batch.append((index, frame))
+        if counted(index):
+            stats['frames'] += 1
+        if len(batch) >= batch_size:
+            run_batch(batch)
+            batch = []
+            if progress is not None:
+                progress.update(index + 1 - start, f"{stats['events']} biển số")
+    if batch:
+        run_batch(batch)
+    emit(tracker.flush())
+
+    stats['elapsed_s'] = time.perf_counter() - t_start
+    stats['video_seconds'] = ((end if end is not None else last_index + 1) - start) / fps
+    if stats['video_seconds'] and stats['elapsed_s'] > 0:
+        stats['speed_vs_realtime'] = stats['video_seconds'] / stats['elapsed_s']
+    return stats
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def plan_segments(start, end, segment_frames, overlap):
+    """Chia [start, end) thành các đoạn; mỗi đoạn đọc thêm overlap frame để track ở ranh giới kết thúc tự nhiên"""
+    segments = []
+    for seg_start in range(start, end, segment_frames):
+        seg_end = min(end, seg_start + segment_frames)
+        segments.append((seg_start, seg_end, min(end, seg_end + overlap)))
+    return segments
+
+
+_worker_pipeline = None
+
+
+def _init_segment_worker(mode, backend, threads):
+    global _worker_pipeline
+    # Mỗi process chỉ dùng vài thread để các process không tranh nhau CPU
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_pipeline = create_pipeline(mode, backend=backend)
+
+
+def _analyze_segment(path, segment, batch_size, stride, rois):
+    seg_start, seg_end, read_end = segment
+    events = []
+    stats = analyze_video(path, _worker_pipeline, events.append, batch_size, stride, rois, seg_start, read_end,
+                          count_end=seg_end)
+    # Sự kiện bắt đầu trong phần overlap thuộc về đoạn sau
+    events = [event for event in events if event['first_frame'] < seg_end]
+    return segment, events, stats
+
+
+def merge_segment_events(segment_events, max_gap_frames, max_text_distance=1):
+    """Gộp sự kiện trùng ở ranh giới đoạn.
+
+    segment_events là list (đoạn, sự kiện của đoạn) theo thứ tự đoạn. Chỉ gộp một sự kiện
+    của đoạn k còn sống tới phần overlap (last_frame >= seg_end) với một sự kiện của đoạn
+    k + 1 bắt đầu ngay đầu đoạn đó, nếu text gần giống: đó là cùng một xe bị cắt ở ranh giới.
+    Hai sự kiện cùng đoạn, hoặc cách xa ranh giới, luôn là hai lần xuất hiện khác nhau.
+    """
+    merged = []
+    carried = []  # Sự kiện của đoạn trước còn sống ở ranh giới
+    for (seg_start, seg_end, _), events in segment_events:
+        next_carried = []
+        for event in sorted(events, key=lambda e: (e['first_frame'], e['last_frame'])):
+            target = None
+            if event['first_frame'] - seg_start <= max_gap_frames:
+                for candidate in carried:
+                    if (candidate['last_frame'] >= event['first_frame'] - max_gap_frames
+                            and edit_distance(event['text'], candidate['text']) <= max_text_distance):
+                        target = candidate
+                        break
+            if target is None:
+                event = dict(event)
+                merged.append(event)
+            else:
+                carried.remove(target)  # Mỗi sự kiện ở ranh giới chỉ gộp với một sự kiện của đoạn sau
+                if event['reads'] > target['reads']:
+                    target['text'] = event['text']  # Giữ text của lần đọc được nhiều phiếu hơn
+                if event['last_frame'] > target['last_frame']:
+                    for key in ('last_frame', 'last_time', 'last_seconds', 'bbox'):
+                        target[key] = event[key]
+                # Hai đoạn cùng đọc xe này trong phần overlap nên không cộng số lần đọc
+                target['reads'] = max(target['reads'], event['reads'])
+                event = target
+            if event['last_frame'] >= seg_end:
+                next_carried.append(event)
+        carried = next_carried
+    for track_id, event in enumerate(merged, 1):
+        event['track_id'] = track_id  # Đánh lại id vì mỗi đoạn đếm id riêng
+    return merged
+
+
+def analyze_video_parallel(path, mode, backend, on_event, workers, segment_frames=None, batch_size=8,
+                           stride=1, rois=None, start=0, end=None, progress=None):
+    """Chia video thành các đoạn xử lý song song trên nhiều process, gộp sự kiện rồi gọi on_event theo thứ tự"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Không thể mở video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total_frames > 0:
+        end = total_frames if end is None or end > total_frames else end
+    elif end is None:
+        # Không chia được đoạn khi không biết độ dài video
+        raise ValueError(f"Video không báo số frame, không thể chia đoạn song song: {path} "
+                         f"(chỉ định end hoặc dùng 1 worker)")
+
+    # Nhiều đoạn hơn số worker để cân tải, nhưng không ngắn hơn 30 giây
+    overlap = int(round(fps * 2))
+    segment_frames = segment_frames or max(int(fps * 30), (end - start) // (workers * 4) + 1)
+    segments = plan_segments(start, end, segment_frames, overlap)
+    threads = max(1, (os.cpu_count() or workers) // workers)
+
+    segment_events = []
+    stats = {'frames': 0, 'detections': 0, 'ocr_reads': 0, 'segments': len(segments), 'workers': workers}
+    t_start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(workers, initializer=_init_segment_worker,
+                             initargs=(mode, backend, threads)) as pool:
+        futures = [pool.submit(_analyze_segment, path, segment, batch_size, stride, rois) for segment in segments]
+        for future in as_completed(futures):
+            segment, events, segment_stats = future.result()
+            segment_events.append((segment, events))
+            for key in ('frames', 'detections', 'ocr_reads'):
+                stats[key] += segment_stats[key]
+            done += segment[1] - segment[0]
+            if progress is not None:
+                progress.update(done, f"{sum(len(e) for _, e in segment_events)} biển số", force=True)
+
+    # Track sống tối đa 1 giây, nên sự kiện cách nhau hơn 1 giây là hai lần xe xuất hiện khác nhau
+    segment_events.sort(key=lambda item: item[0][0])
+    events = merge_segment_events(segment_events, max_gap_frames=int(round(fps)))
+    for event in events:
+        on_event(event)
+    stats['events'] = len(events)
+    stats['elapsed_s'] = time.perf_counter() - t_start
+    stats['video_seconds'] = (end - start) / fps
+    if stats['elapsed_s'] > 0:
+        stats['speed_vs_realtime'] = stats['video_seconds'] / stats['elapsed_s']
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Phân tích toàn bộ video, ghi sự kiện biển số ra JSONL/CSV")
+    parser.add_argument('video')
+    parser.add_argument('--output', help="File .jsonl hoặc .csv (mặc định in JSONL ra stdout)")
+    parser.add_argument('--mode', choices=sorted(PIPELINE_PRESETS), default='video')
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument('--batch-size', type=int, default=8, help="Số frame đưa vào detector mỗi lần")
+    parser.add_argument('--stride', type=int, default=1, help="Chỉ phân tích 1 frame mỗi N frame")
+    parser.add_argument('--start', type=int, default=0, help="Frame bắt đầu")
+    parser.add_argument('--end', type=int, help="Frame kết thúc (không gồm)")
+    parser.add_argument('--no-roi', action='store_true', help="Bỏ qua ROI đã lưu cho video này")
+    parser.add_argument('--quiet', action='store_true', help="Không hiện thanh tiến trình")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Số process xử lý song song các đoạn video (mỗi process tải model riêng)")
+    parser.add_argument('--segment-seconds', type=float, help="Độ dài mỗi đoạn khi dùng --workers")
+    parser.add_argument('--db', nargs='?', const=DB_PATH,
+                        help="Đồng thời lưu sự kiện vào CSDL SQLite (mặc định plate_reads.db)")
+    parser.add_argument('--watchlist', help="File danh sách biển số theo dõi, cảnh báo khi sự kiện khớp")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.video):
+        parser.error(f"Không tìm thấy video: {args.video}")
+    rois = None if args.no_roi else load_rois(args.video) or None
+
+    capture = cv2.VideoCapture(args.video)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    if frame_count > 0:
+        last = min(args.end, frame_count) if args.end else frame_count
+    else:
+        last = args.end  # Không biết số frame: thanh tiến trình chỉ hiện số frame và tốc độ
+        if args.workers > 1 and last is None:
+            parser.error("Video không báo số frame, không thể chia đoạn cho --workers; hãy chỉ định --end")
+    progress_bar = None if args.quiet else ProgressBar(max(0, last - args.start) if last else None)
+
+    writer = EventWriter(args.output)
+    plate_db = PlateDatabaseWriter(args.db) if args.db else None
+    watchlist = Watchlist.from_file(args.watchlist) if args.watchlist else None
+
+    def on_event(event):
+        writer.write(event)
+        if plate_db is not None:
+            plate_db.record(args.video, event['text'], frame=event['first_frame'],
+                            video_seconds=event['first_seconds'], bbox=event['bbox'])
+        if watchlist is not None:
+            watchlist.check(event['text'], args.video, event['first_frame'], event['first_seconds'], event['bbox'])
+    try:
+        if args.workers > 1:
+            segment_frames = None
+            if args.segment_seconds:
+                capture = cv2.VideoCapture(args.video)
+                segment_frames = max(1, int(args.segment_seconds * (capture.get(cv2.CAP_PROP_FPS) or 30.0)))
+                capture.release()
+            summary = analyze_video_parallel(args.video, args.mode, args.backend, on_event, args.workers,
+                                             segment_frames, args.batch_size, args.stride, rois,
+                                             args.start, args.end, progress_bar)
+        else:
+            summary = analyze_video(args.video, create_pipeline(args.mode, backend=args.backend), on_event,
+                                    args.batch_size, args.stride, rois, args.start, args.end, progress_bar)
+    finally:
+        writer.close()
+        if plate_db is not None:
+            plate_db.close()
+    if progress_bar is not None:
+        progress_bar.close(max(0, last - args.start) if last else None, f"{summary['events']} biển số")
+    print(json.dumps(summary, indent=2), file=sys.stderr)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Benchmark độ trễ từng bước của cascade trên img-testing/*.png và img/*.png.
+
+Đo decode, nhận diện xe, nhận diện biển số, OCR, vẽ kết quả và chuyển sang Qt qua
+FramePresenter như VideoMode (qt_convert_legacy: cách cũ, chỉ để so sánh),
+in ra JSON (p50/p95/p99 từng bước + throughput) để so sánh giữa các phiên bản/máy:
+
+    python benchmark.py --mode batch --repeat 3 --scale 1 2 --output bench.json
+
+Chỉ đo đường hiển thị frame của VideoMode (cách cũ so với FramePresenter), không cần model:
+
+    python benchmark.py --presentation --scale 1 3 --display-size 1280x720
+"""
+import sys
+import os
+import glob
+import json
+import math
+import time
+import platform
+
+import cv2
+import numpy as np
+
+from detection_pipeline import create_pipeline, draw_plates, PIPELINE_PRESETS
+from model_backends import BACKENDS, DEFAULT_BACKEND
+
+# qt_convert: đường hiển thị VideoMode đang dùng (FramePresenter); qt_convert_legacy: cách cũ để so sánh
+STAGES = ('decode', 'vehicle_detection', 'plate_detection', 'ocr', 'draw', 'qt_convert', 'qt_convert_legacy',
+          'end_to_end')
+DEFAULT_IMAGES = ('img-testing/*.png', 'img/*.png')
+
+
+def percentile(sorted_samples, q):
+    """Percentile kiểu nearest-rank trên list đã sắp xếp"""
+    if not sorted_samples:
+        return None
+    rank = math.ceil(q / 100.0 * len(sorted_samples))
+    return sorted_samples[max(0, min(len(sorted_samples), rank) - 1)]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    return {'count': len(samples),
+            'mean_ms': sum(samples) / len(samples),
+            'p50_ms': percentile(samples, 50),
+            'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99),
+            'max_ms': samples[-1]}
+
+
+def make_qt_converter(target_size=(1280, 720)):
+    """Trả về hàm chuyển frame BGR -> QPixmap đã scale giống VideoMode, hoặc None nếu không có PyQt5"""
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtGui import QImage, QPixmap
+        from PyQt5.QtCore import Qt
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    def convert(frame):
+        height, width = frame.shape[:2]
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        q_img = QImage(frame_rgb.data, width, height, 3 * width, QImage.Format_RGB888)
+        return QPixmap.fromImage(q_img).scaled(target_size[0], target_size[1],
+                                               Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    convert.app = app
+    return convert
+
+
+def make_presenter_converter(target_size=(1280, 720)):
+    """Như make_qt_converter nhưng dùng FramePresenter (resize OpenCV + buffer dùng lại)"""
+    legacy = make_qt_converter(target_size)
+    if legacy is None:
+        return None
+    from PyQt5.QtGui import QPixmap
+    from frame_presenter import FramePresenter
+
+    presenter = FramePresenter()
+
+    def convert(frame):
+        return QPixmap.fromImage(presenter.present(frame, target_size[0], target_size[1]))
+    convert.app = legacy.app
+    return convert
+
+
+def run_presentation_benchmark(inputs, target_size, repeat=1):
+    """So sánh chi phí hiển thị một frame: cvtColor + QPixmap.scaled (cũ) và FramePresenter (mới)"""
+    converters = {'legacy': make_qt_converter(target_size), 'presenter': make_presenter_converter(target_size)}
+    if converters['legacy'] is None:
+        raise RuntimeError("Cần PyQt5 để đo đường hiển thị")
+    frames = []
+    for item in inputs:
+        image = cv2.imdecode(item['bytes'], cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        if item['scale'] != 1:
+            image = cv2.resize(image, None, fx=item['scale'], fy=item['scale'], interpolation=cv2.INTER_LINEAR)
+        frames.append(image)
+    if not frames:
+        raise RuntimeError("Không giải mã được ảnh đầu vào nào để đo đường hiển thị")
+
+    report = {}
+    for name, convert in converters.items():
+        convert(frames[0])  # Warm-up (cấp phát buffer lần đầu)
+        samples = []
+        for _ in range(repeat):
+            for frame in frames:
+                t0 = time.perf_counter()
+                convert(frame)
+                samples.append((time.perf_counter() - t0) * 1000)
+        report[name] = summarize(samples)
+    if report['legacy'].get('mean_ms') and report['presenter'].get('mean_ms'):
+        report['speedup'] = report['legacy']['mean_ms'] / report['presenter']['mean_ms']
+    report['resolutions'] = sorted({f"{f.shape[1]}x{f.shape[0]}" for f in frames})
+    return report
+
+
+def load_inputs(patterns, scales, crowd):
+    """Đọc byte của ảnh (decode được đo riêng) và sinh các biến thể scale/crowd"""
+    inputs = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'rb') as f:
+                data = np.frombuffer(f.read(), dtype=np.uint8)
+            for scale in scales:
+                inputs.append({'file': path, 'bytes': data, 'scale': scale, 'crowd': crowd})
+    return inputs
+
+
+def run_benchmark(pipeline, inputs, repeat=1, qt_convert=None, legacy_convert=None):
+    samples = {stage: [] for stage in STAGES}
+    plates_seen = 0
+    pipeline.load_models()
+
+    start = time.perf_counter()
+    frames = 0
+    for _ in range(repeat):
+        for item in inputs:
+            t_frame = time.perf_counter()
+            t0 = time.perf_counter()
+            image = cv2.imdecode(item['bytes'], cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            if item['scale'] != 1:
+                image = cv2.resize(image, None, fx=item['scale'], fy=item['scale'], interpolation=cv2.INTER_LINEAR)
+            if item['crowd'] > 1:
+                image = np.tile(image, (item['crowd'], item['crowd'], 1))
+            samples['decode'].append((time.perf_counter() - t0) * 1000)
+
+            result = pipeline.process(image)
+            for stage in ('vehicle_detection', 'plate_detection', 'ocr'):
+                samples[stage].append(result['timings'][stage])
+            plates_seen += len(result['plates'])
+
+            t0 = time.perf_counter()
+            annotated = draw_plates(image.copy(), result['plates'])
+            samples['draw'].append((time.perf_counter() - t0) * 1000)
+
+            if qt_convert is not None:
+                t0 = time.perf_counter()
+                qt_convert(annotated)
+                samples['qt_convert'].append((time.perf_counter() - t0) * 1000)
+
+            samples['end_to_end'].append((time.perf_counter() - t_frame) * 1000)
+            if legacy_convert is not None:
+                # Đo sau end_to_end: đường cũ không còn nằm trong vòng xử lý frame của VideoMode
+                t0 = time.perf_counter()
+                legacy_convert(annotated)
+                samples['qt_convert_legacy'].append((time.perf_counter() - t0) * 1000)
+            frames += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'stages': {stage: summarize(values) for stage, values in samples.items()},
+        'frames': frames,
+        'plates': plates_seen,
+        'elapsed_s': elapsed,
+        'throughput_fps': frames / elapsed if elapsed > 0 else None,
+    }
+
+
+def environment_info(pipeline):
+    info = {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__, 'numpy': np.__version__,
+            'backend': getattr(pipeline, 'backend', None),
+            'plate_backend': getattr(pipeline, 'plate_backend', None),
+            'ocr_engine': getattr(pipeline, 'ocr_engine', None)}
+    try:
+        import ultralytics
+        info['ultralytics'] = ultralytics.__version__
+    except ImportError:
+        pass
+    return info
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ từng bước của pipeline nhận diện biển số")
+    parser.add_argument('--images', nargs='+', default=list(DEFAULT_IMAGES), help="Các glob ảnh đầu vào")
+    parser.add_argument('--mode', choices=sorted(PIPELINE_PRESETS), default='batch')
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument('--repeat', type=int, default=1, help="Số lần lặp lại toàn bộ tập ảnh")
+    parser.add_argument('--scale', type=float, nargs='+', default=[1.0],
+                        help="Phóng to ảnh để giả lập độ phân giải cao (vd. 1 2 3)")
+    parser.add_argument('--crowd', type=int, default=1, help="Ghép ảnh thành lưới NxN")
+    parser.add_argument('--no-qt', action='store_true', help="Bỏ qua bước chuyển sang QPixmap")
+    parser.add_argument('--output', help="Ghi JSON ra file thay vì stdout")
+    parser.add_argument('--presentation', action='store_true',
+                        help="Chỉ đo đường hiển thị frame (cũ vs FramePresenter), không tải model")
+    parser.add_argument('--display-size', default='1280x720', help="Kích thước label hiển thị, dạng WxH")
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.images, args.scale, args.crowd)
+    if not inputs:
+        parser.error("Không tìm thấy ảnh nào")
+    display_size = tuple(int(v) for v in args.display_size.lower().split('x'))
+
+    if args.presentation:
+        report = {'presentation': run_presentation_benchmark(inputs, display_size, args.repeat),
+                  'display_size': args.display_size, 'scales': args.scale, 'repeat': args.repeat,
+                  'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            print(text)
+        sys.exit(0)
+
+    pipeline = create_pipeline(args.mode, backend=args.backend)
+    qt_convert = None if args.no_qt else make_presenter_converter(display_size)
+    legacy_convert = None if args.no_qt else make_qt_converter(display_size)
+    report = run_benchmark(pipeline, inputs, args.repeat, qt_convert, legacy_convert)
+    report.update({'mode': args.mode, 'images': len(inputs), 'repeat': args.repeat,
+                   'display_size': args.display_size,
+                   'scales': args.scale, 'crowd': args.crowd,
+                   'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'environment': environment_info(pipeline)})
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
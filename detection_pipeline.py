@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""Pipeline nhận diện phương tiện -> biển số -> OCR, không phụ thuộc Qt.
+
+ImageMode, VideoMode và BatchMode đều gọi LicensePlatePipeline, nên có thể chạy
+(và đo đạc) cùng một cascade trên server không có màn hình:
+
+    python detection_pipeline.py img-testing/*.png --mode batch
+"""
+import sys
+import os
+import time
+import json
+
+import cv2
+import numpy as np
+
+from model_backends import load_yolo, BACKENDS, DEFAULT_BACKEND, DEFAULT_PLATE_BACKEND
+from roi_masks import RoiCropper, load_rois
+from plate_ocr import (preprocess_plate, clean_plate_text, read_batch_easyocr, read_batch_tesseract,
+                       read_batch_easyocr_recognizer)
+
+OCR_ALLOWED_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# Cấu hình tương ứng với hành vi gốc của từng mode
+PIPELINE_PRESETS = {
+    'image': {
+        'vehicle_model_path': 'imgmodels/yolov8n.pt',
+        'plate_model_path': 'imgmodels/best.pt',
+        'vehicle_conf': 0.3,
+        'plate_conf': 0.3,
+        'ocr_engine': 'tesseract',
+        'tesseract_cmd': r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+    },
+    'video': {
+        'vehicle_model_path': None,  # Chỉ chạy model biển số trên toàn frame
+        'plate_model_path': 'license_plate_detector.pt',
+        'plate_conf': 0.4,
+        'ocr_engine': 'easyocr-recognizer',  # Biển số đã được YOLO định vị, không cần CRAFT
+        'ocr_preprocess': 'enhance',
+        'min_text_len': 4,
+    },
+    'batch': {
+        'vehicle_model_path': 'yolov8n.pt',
+        'plate_model_path': 'license_plate_detector.pt',
+        'vehicle_conf': 0.5,
+        'vehicle_classes': ['car', 'motorcycle'],
+        'plate_conf': 0.4,
+        'best_plate_only': True,
+        'ocr_engine': 'easyocr-recognizer',
+        'ocr_preprocess': 'gray',
+        'ocr_allowed_chars': OCR_ALLOWED_CHARS,
+    },
+}
+
+
+def create_pipeline(mode, **overrides):
+    """Tạo pipeline theo preset của mode ('image', 'video', 'batch')"""
+    config = dict(PIPELINE_PRESETS[mode])
+    config.update(overrides)
+    return LicensePlatePipeline(**config)
+
+
+def draw_plates(image, plates):
+    """Vẽ biển số lên image (tại chỗ) theo kiểu VideoMode: xanh + text nếu đọc được, đỏ nếu không"""
+    for plate in plates:
+        x1, y1, x2, y2 = plate['bbox']
+        plate_text = plate.get('text', '')
+
+        # If we have a reasonable-length text
+        if plate.get('valid'):
+            # Draw rectangle around the license plate
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            # Add background for text
+            text_width = len(plate_text) * 15
+            cv2.rectangle(image, (x1, y1 - 30), (x1 + text_width, y1), (0, 255, 0), -1)
+
+            # Display the recognized text
+            cv2.putText(image, plate_text, (x1 + 5, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+        else:
+            # Draw red rectangle if no valid text was detected
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+    return image
+
+
+class LicensePlatePipeline:
+    def __init__(self, plate_model_path='license_plate_detector.pt', vehicle_model_path=None,
+                 vehicle_conf=0.3, plate_conf=0.4, vehicle_classes=None, best_plate_only=False,
+                 ocr_engine='easyocr', ocr_preprocess='gray', ocr_allowed_chars=None,
+                 min_text_len=1, batch_plate_detection=True, plate_batch_size=32,
+                 batch_ocr=True, ocr_batch_size=16, ocr_height=64, ocr_lines='auto',
+                 tesseract_cmd=None, backend=DEFAULT_BACKEND, plate_backend=DEFAULT_PLATE_BACKEND):
+        self.plate_model_path = plate_model_path
+        self.vehicle_model_path = vehicle_model_path
+        self.vehicle_conf = vehicle_conf
+        self.plate_conf = plate_conf
+        self.vehicle_classes = vehicle_classes
+        self.best_plate_only = best_plate_only
+        self.ocr_engine = ocr_engine
+        self.ocr_preprocess = ocr_preprocess
+        # 'easyocr-recognizer' bỏ qua CRAFT nên luôn dùng allowlist giống BatchMode
+        if ocr_allowed_chars is None and ocr_engine == 'easyocr-recognizer':
+            ocr_allowed_chars = OCR_ALLOWED_CHARS
+        self.ocr_allowed_chars = ocr_allowed_chars
+        self.min_text_len = min_text_len
+        self.batch_plate_detection = batch_plate_detection
+        self.plate_batch_size = plate_batch_size
+        self.batch_ocr = batch_ocr
+        self.ocr_batch_size = ocr_batch_size
+        self.ocr_height = ocr_height
+        self.ocr_lines = ocr_lines
+        self.tesseract_cmd = tesseract_cmd
+        self.backend = backend
+        # Model biển số có thể dùng backend riêng, ví dụ 'openvino-int8' sau khi lượng tử hoá
+        self.plate_backend = plate_backend or backend
+
+        self.vehicle_model = None
+        self.plate_model = None
+        self.ocr_reader = None
+        self.models_loaded = False
+        self.ocr_timings = {}
+        self.roi_cropper = None
+
+    def load_models(self, warmup=True):
+        if self.models_loaded:
+            return
+
+        dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+        if self.vehicle_model_path:
+            print(f"[INFO] Đang tải model nhận diện xe ({os.path.basename(self.vehicle_model_path)}, {self.backend})...")
+            self.vehicle_model = load_yolo(self.vehicle_model_path, self.backend)
+            if warmup:
+                self.vehicle_model(dummy, verbose=False)
+
+        print(f"[INFO] Đang tải model nhận diện biển số ({os.path.basename(self.plate_model_path)}, {self.plate_backend})...")
+        self.plate_model = load_yolo(self.plate_model_path, self.plate_backend)
+        if warmup:
+            self.plate_model(dummy, verbose=False)
+
+        if self.ocr_engine in ('easyocr', 'easyocr-recognizer'):
+            import easyocr
+            self.ocr_reader = easyocr.Reader(['en'], gpu=False)
+        elif self.ocr_engine == 'tesseract':
+            import pytesseract
+            if self.tesseract_cmd and os.path.exists(self.tesseract_cmd):
+                pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+            self.ocr_reader = pytesseract
+        else:
+            raise ValueError(f"OCR engine không hỗ trợ: {self.ocr_engine}")
+
+        self.models_loaded = True
+        print("[INFO] Pipeline đã sẵn sàng.")
+
+    def process(self, frame, rois=None):
+        """Chạy toàn bộ cascade trên một frame BGR, trả về dict kết quả"""
+        return self.process_batch([frame], rois)[0]
+
+    def process_batch(self, frames, rois=None):
+        """Phát hiện trên từng frame, sau đó OCR tất cả biển số của mọi frame trong một lần gọi"""
+        self.load_models()
+        results = self._detect_batch(frames, rois)
+
+        crops = []
+        for frame, result in zip(frames, results):
+            for plate in result['plates']:
+                x1, y1, x2, y2 = plate['bbox']
+                crops.append(frame[y1:y2, x1:x2])
+
+        t0 = time.perf_counter()
+        reads = self.read_plates(crops)
+        ocr_ms = (time.perf_counter() - t0) * 1000
+        per_plate_ms = ocr_ms / len(crops) if crops else 0.0
+        sub_per_plate = {name: ms / len(crops) if crops else 0.0 for name, ms in self.ocr_timings.items()}
+
+        reads = iter(reads)
+        for result in results:
+            for plate in result['plates']:
+                plate['text'], plate['ocr_error'] = next(reads)
+                plate['valid'] = len(plate['text']) >= self.min_text_len
+            timings = result['timings']
+            # Thời gian OCR được chia đều cho các biển số trong batch
+            timings['ocr'] = per_plate_ms * len(result['plates'])
+            timings['ocr_per_plate'] = per_plate_ms
+            for name, ms in sub_per_plate.items():
+                timings[name] = ms * len(result['plates'])
+            timings['total'] += timings['ocr']
+        return results
+
+    def detect(self, frame, rois=None):
+        """Chỉ chạy phần phát hiện (xe + biển số), không OCR; dùng cùng recognize_plates"""
+        self.load_models()
+        return self._detect(frame, rois)
+
+    def detect_batch(self, frames, rois=None):
+        """Như detect() cho nhiều frame; không có model xe thì model biển số chạy một lần cho cả batch"""
+        self.load_models()
+        return self._detect_batch(frames, rois)
+
+    def recognize_plates(self, plate_rois):
+        """OCR các vùng biển số đã cắt, trả về {'reads': [{'text', 'ocr_error', 'valid'}], 'timings'}"""
+        self.load_models()
+        t0 = time.perf_counter()
+        reads = [{'text': text, 'ocr_error': error, 'valid': len(text) >= self.min_text_len}
+                 for text, error in self.read_plates(plate_rois)]
+        timings = dict(self.ocr_timings, ocr=(time.perf_counter() - t0) * 1000)
+        return {'reads': reads, 'timings': timings}
+
+    def _get_roi_cropper(self, rois, frame_shape):
+        # Bố cục canvas chỉ tính lại khi ROI hoặc kích thước frame thay đổi
+        key = (repr(rois), frame_shape[:2])
+        if self.roi_cropper is None or self.roi_cropper[0] != key:
+            self.roi_cropper = (key, RoiCropper(rois, frame_shape))
+        return self.roi_cropper[1]
+
+    def _detect_batch(self, frames, rois=None):
+        if self.vehicle_model is not None or not self.batch_plate_detection or len(frames) < 2:
+            return [self._detect(frame, rois) for frame in frames]
+
+        # Gom các frame liên tiếp (video) vào một lần forward của model biển số
+        t0 = time.perf_counter()
+        croppers = [self._get_roi_cropper(rois, frame.shape) if rois else None for frame in frames]
+        images = [cropper.pack(frame) if cropper else frame for cropper, frame in zip(croppers, frames)]
+        pack_ms = (time.perf_counter() - t0) * 1000 / len(frames)
+
+        t0 = time.perf_counter()
+        per_frame = self.detect_plates_batch(images, [(0, 0)] * len(images))
+        detection_ms = (time.perf_counter() - t0) * 1000 / len(frames)
+
+        results = []
+        for cropper, plates in zip(croppers, per_frame):
+            timings = {'vehicle_detection': 0.0, 'plate_detection': detection_ms}
+            if cropper is not None:
+                timings['roi_pack'] = pack_ms
+                _, plates = self._map_from_roi(cropper, [], plates)
+            timings['total'] = sum(timings.values())
+            results.append({'vehicles': [], 'plates': plates, 'timings': timings})
+        return results
+
+    def _detect(self, frame, rois=None):
+        """rois: list đa giác chuẩn hoá (xem roi_masks), chỉ phát hiện trong các vùng này"""
+        timings = {'vehicle_detection': 0.0, 'plate_detection': 0.0}
+
+        cropper = None
+        if rois:
+            t0 = time.perf_counter()
+            cropper = self._get_roi_cropper(rois, frame.shape)
+            frame = cropper.pack(frame)
+            timings['roi_pack'] = (time.perf_counter() - t0) * 1000
+
+        vehicles = []
+        if self.vehicle_model is not None:
+            t0 = time.perf_counter()
+            vehicles = self.detect_vehicles(frame)
+            timings['vehicle_detection'] = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        if self.vehicle_model is not None:
+            plates = []
+            crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (v['bbox'] for v in vehicles)]
+            offsets = [v['bbox'][:2] for v in vehicles]
+            if self.batch_plate_detection:
+                per_vehicle = self.detect_plates_batch(crops, offsets)
+            else:
+                per_vehicle = [self.detect_plates(crop, offset) for crop, offset in zip(crops, offsets)]
+            for vehicle, vehicle_plates in zip(vehicles, per_vehicle):
+                vehicle['plates'] = vehicle_plates
+                plates.extend(vehicle_plates)
+        else:
+            plates = self.detect_plates(frame)
+        timings['plate_detection'] = (time.perf_counter() - t0) * 1000
+
+        if cropper is not None:
+            vehicles, plates = self._map_from_roi(cropper, vehicles, plates)
+
+        timings['total'] = sum(timings.values())
+        return {'vehicles': vehicles, 'plates': plates, 'timings': timings}
+
+    @staticmethod
+    def _map_from_roi(cropper, vehicles, plates):
+        """Đổi box trên canvas ROI về toạ độ frame gốc, bỏ box không thuộc vùng nào"""
+        mapped_plates = []
+        for plate in plates:
+            plate['bbox'] = cropper.map_box(plate['bbox'])
+            if plate['bbox'] is not None:
+                mapped_plates.append(plate)
+        mapped_vehicles = []
+        for vehicle in vehicles:
+            vehicle['bbox'] = cropper.map_box(vehicle['bbox'])
+            if vehicle['bbox'] is not None:
+                vehicle['plates'] = [plate for plate in vehicle['plates'] if plate['bbox'] is not None]
+                mapped_vehicles.append(vehicle)
+        return mapped_vehicles, mapped_plates
+
+    def detect_vehicles(self, frame):
+        vehicles = []
+        results = self.vehicle_model(frame, conf=self.vehicle_conf, verbose=False)
+        for result in results:
+            for box in result.boxes:
+                class_name = self.vehicle_model.names[int(box.cls[0])]
+                if self.vehicle_classes and class_name not in self.vehicle_classes:
+                    continue
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+                x1, y1 = max(0, x1), max(0, y1)
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                vehicles.append({'bbox': (x1, y1, x2, y2), 'conf': float(box.conf[0]),
+                                 'class_name': class_name, 'plates': []})
+        return vehicles
+
+    def detect_plates(self, image, offset=(0, 0)):
+        """Phát hiện biển số trong image, bbox trả về theo toạ độ ảnh gốc (cộng offset)"""
+        if image.size == 0:
+            return []
+        results = self.plate_model(image, conf=self.plate_conf, verbose=False)
+        return self._collect_plates(results[0], offset)
+
+    def detect_plates_batch(self, crops, offsets):
+        """Một lần forward cho tất cả crop xe (chia theo plate_batch_size), trả về list biển số cho từng crop"""
+        per_crop = [[] for _ in crops]
+        valid = [i for i, crop in enumerate(crops) if crop.size > 0]
+        for start in range(0, len(valid), self.plate_batch_size):
+            chunk = valid[start:start + self.plate_batch_size]
+            results = self.plate_model([crops[i] for i in chunk], conf=self.plate_conf, verbose=False)
+            for i, result in zip(chunk, results):
+                per_crop[i] = self._collect_plates(result, offsets[i])
+        return per_crop
+
+    def _collect_plates(self, result, offset):
+        ox, oy = offset
+        plates = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            x1, y1 = max(0, x1), max(0, y1)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            plates.append({'bbox': (ox + x1, oy + y1, ox + x2, oy + y2),
+                           'conf': float(box.conf[0])})
+        if self.best_plate_only and plates:
+            plates = [max(plates, key=lambda p: p['conf'])]
+        return plates
+
+    def read_plates(self, plate_rois):
+        """OCR nhiều vùng biển số trong một lần gọi, trả về list (text, lỗi hoặc None)"""
+        reads = [('', None)] * len(plate_rois)
+        self.ocr_timings = {'ocr_preprocess': 0.0, 'ocr_recognize': 0.0}
+        valid = [i for i, roi in enumerate(plate_rois) if roi.size > 0]
+        if not valid:
+            return reads
+
+        t0 = time.perf_counter()
+        images = [preprocess_plate(plate_rois[i], self.ocr_preprocess) for i in valid]
+        t1 = time.perf_counter()
+
+        texts = None
+        if self.batch_ocr and len(valid) >= 2:
+            try:
+                texts = self._recognize_batch(images)
+            except Exception as e:
+                # Batch lỗi thì đọc lại từng biển để lỗi được gán đúng biển số
+                print(f"[ERROR] Lỗi OCR theo batch, chuyển sang đọc từng biển: {e}")
+        if texts is not None:
+            for i, text in zip(valid, texts):
+                reads[i] = (clean_plate_text(text), None)
+        else:
+            for i, image in zip(valid, images):
+                try:
+                    reads[i] = (clean_plate_text(self._recognize(image)), None)
+                except Exception as e:
+                    print(f"[ERROR] Lỗi OCR: {e}")
+                    reads[i] = ('', str(e))
+
+        self.ocr_timings = {'ocr_preprocess': (t1 - t0) * 1000,
+                            'ocr_recognize': (time.perf_counter() - t1) * 1000}
+        return reads
+
+    def _recognize(self, ocr_input):
+        if self.ocr_engine == 'tesseract':
+            return self.ocr_reader.image_to_string(ocr_input, config='--psm 8')
+        if self.ocr_engine == 'easyocr-recognizer':
+            return read_batch_easyocr_recognizer(self.ocr_reader, [ocr_input], allowlist=self.ocr_allowed_chars,
+                                                 lines=self.ocr_lines)[0][0]
+        return ''.join(self.ocr_reader.readtext(ocr_input, detail=0, paragraph=False,
+                                                allowlist=self.ocr_allowed_chars))
+
+    def _recognize_batch(self, images):
+        if self.ocr_engine == 'tesseract':
+            return read_batch_tesseract(self.ocr_reader, images, height=self.ocr_height)
+        if self.ocr_engine == 'easyocr-recognizer':
+            reads_with_conf = read_batch_easyocr_recognizer(self.ocr_reader, images,
+                                                            allowlist=self.ocr_allowed_chars,
+                                                            lines=self.ocr_lines,
+                                                            batch_size=self.ocr_batch_size)
+            return [text for text, _ in reads_with_conf]
+        return read_batch_easyocr(self.ocr_reader, images, allowlist=self.ocr_allowed_chars,
+                                  height=self.ocr_height, batch_size=self.ocr_batch_size)
+
+
+def compare_plate_batching(pipeline, frame, repeat=5):
+    """Đo thời gian model biển số: vòng lặp từng crop xe vs một lần batch"""
+    pipeline.load_models()
+    if pipeline.vehicle_model is None:
+        raise ValueError("Preset không có model xe, không có crop để batch")
+    vehicles = pipeline.detect_vehicles(frame)
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (v['bbox'] for v in vehicles)]
+    offsets = [v['bbox'][:2] for v in vehicles]
+
+    def timed(fn):
+        fn()  # warm-up
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return sorted(samples)[len(samples) // 2]
+
+    per_crop_ms = timed(lambda: [pipeline.detect_plates(c, o) for c, o in zip(crops, offsets)])
+    batched_ms = timed(lambda: pipeline.detect_plates_batch(crops, offsets))
+    return {'vehicles': len(vehicles), 'per_crop_ms': per_crop_ms, 'batched_ms': batched_ms,
+            'speedup': per_crop_ms / batched_ms if batched_ms > 0 else None}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chạy pipeline nhận diện biển số không cần giao diện")
+    parser.add_argument('images', nargs='+', help="Đường dẫn ảnh đầu vào")
+    parser.add_argument('--mode', choices=sorted(PIPELINE_PRESETS), default='batch')
+    parser.add_argument('--ocr-engine', choices=['easyocr', 'easyocr-recognizer', 'tesseract'],
+                        help="Ghi đè OCR engine của preset")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="Backend suy luận cho các detector YOLO")
+    parser.add_argument('--plate-backend', choices=BACKENDS, default=DEFAULT_PLATE_BACKEND,
+                        help="Backend riêng cho model biển số (mặc định giống --backend)")
+    parser.add_argument('--compare-batching', action='store_true',
+                        help="So sánh độ trễ model biển số: batch một lần/ảnh vs từng crop xe")
+    parser.add_argument('--crowd', type=int, default=1,
+                        help="Ghép ảnh thành lưới NxN để giả lập cảnh đông xe")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--image-batch', type=int, default=1,
+                        help="Số ảnh gom lại để OCR chung một lần")
+    parser.add_argument('--roi', help="Tên video/camera có ROI đã lưu trong roi_masks/")
+    args = parser.parse_args()
+
+    overrides = {'backend': args.backend, 'plate_backend': args.plate_backend}
+    if args.ocr_engine:
+        overrides['ocr_engine'] = args.ocr_engine
+    pipeline = create_pipeline(args.mode, **overrides)
+    rois = load_rois(args.roi) if args.roi else None
+    if args.roi and not rois:
+        parser.error(f"Không có ROI cho '{args.roi}'")
+    pending = []
+    for index, path in enumerate(args.images):
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[ERROR] Không đọc được ảnh: {path}", file=sys.stderr)
+        else:
+            if args.crowd > 1:
+                image = np.tile(image, (args.crowd, args.crowd, 1))
+            if args.compare_batching:
+                print(json.dumps({'file': path, **compare_plate_batching(pipeline, image, args.repeat)}))
+                continue
+            pending.append((path, image))
+        if pending and (len(pending) >= args.image_batch or index == len(args.images) - 1):
+            results = pipeline.process_batch([image for _, image in pending], rois)
+            for (pending_path, _), result in zip(pending, results):
+                print(json.dumps({'file': pending_path, **result}, ensure_ascii=False))
+            pending = []
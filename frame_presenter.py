@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Đường hiển thị frame video ít sao chép.
+
+Cách cũ: cvtColor BGR->RGB ở độ phân giải gốc, QImage, QPixmap rồi scale
+SmoothTransformation, tức là vài bản sao full-frame mỗi frame (rất nặng với 4K).
+FramePresenter resize bằng OpenCV xuống đúng kích thước label trước, ghi vào buffer
+cấp phát sẵn, và bọc buffer bằng QImage định dạng BGR (Qt >= 5.14) nên không cần
+đổi màu; với Qt cũ hơn thì đổi màu vào một buffer RGB cũng cấp phát sẵn.
+"""
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage
+
+BGR_FORMAT = getattr(QImage, 'Format_BGR888', None)
+
+
+class FramePresenter:
+    def __init__(self, interpolation_down=cv2.INTER_AREA, interpolation_up=cv2.INTER_LINEAR):
+        self.interpolation_down = interpolation_down
+        self.interpolation_up = interpolation_up
+        self.buffer = None
+        self.rgb_buffer = None
+        self.image = None
+
+    @staticmethod
+    def fit_size(width, height, target_width, target_height):
+        """Kích thước vừa khung target, giữ tỉ lệ (giống Qt.KeepAspectRatio)"""
+        scale = min(target_width / float(width), target_height / float(height))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def scale(self, frame, target_width, target_height):
+        """Resize frame BGR vào buffer dùng lại giữa các frame, trả về buffer"""
+        height, width = frame.shape[:2]
+        out_width, out_height = self.fit_size(width, height, target_width, target_height)
+        if self.buffer is None or self.buffer.shape[:2] != (out_height, out_width):
+            # Chỉ cấp phát lại khi kích thước label/video đổi
+            self.buffer = np.empty((out_height, out_width, 3), dtype=np.uint8)
+            self.rgb_buffer = None if BGR_FORMAT is not None else np.empty_like(self.buffer)
+            self.image = None
+        if (out_width, out_height) == (width, height):
+            np.copyto(self.buffer, frame)
+        else:
+            interpolation = self.interpolation_down if out_width < width else self.interpolation_up
+            cv2.resize(frame, (out_width, out_height), dst=self.buffer, interpolation=interpolation)
+        return self.buffer
+
+    def qimage(self):
+        """QImage bọc buffer hiện tại (không sao chép); chỉ hợp lệ tới lần scale() kế tiếp"""
+        if BGR_FORMAT is None:
+            cv2.cvtColor(self.buffer, cv2.COLOR_BGR2RGB, dst=self.rgb_buffer)
+        if self.image is None:
+            source = self.buffer if BGR_FORMAT is not None else self.rgb_buffer
+            height, width = source.shape[:2]
+            self.image = QImage(source.data, width, height, 3 * width,
+                                BGR_FORMAT if BGR_FORMAT is not None else QImage.Format_RGB888)
+        return self.image
+
+    def present(self, frame, target_width, target_height):
+        self.scale(frame, target_width, target_height)
+        return self.qimage()
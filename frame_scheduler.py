@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Chọn tần suất chạy detector theo ngân sách độ trễ mỗi frame.
+
+Thay cho skip_frames cố định: scheduler đo độ trễ thực tế của lần nhận diện
+(YOLO + OCR, tăng theo số biển số trong khung hình) và chi phí các frame không
+nhận diện, rồi chọn khoảng cách N frame giữa hai lần nhận diện sao cho chi phí
+trung bình mỗi frame nằm trong budget * (1 / fps). Máy nhanh hơn hoặc ít biển số
+hơn thì N giảm xuống, nhận diện dày hơn.
+"""
+import math
+
+
+class AdaptiveDetectionScheduler:
+    def __init__(self, fps, budget=0.8, max_interval=None, alpha=0.3):
+        self.fps = fps if fps > 0 else 30.0
+        self.budget = budget  # Tỉ lệ thời gian một frame được dùng cho xử lý
+        self.max_interval = max_interval or max(1, int(round(self.fps)))  # Ít nhất mỗi giây một lần
+        self.alpha = alpha
+        self.detection_ms = None
+        self.frame_ms = 0.0
+        self.interval = 1
+        self.last_detection = None
+
+    @property
+    def budget_ms(self):
+        return self.budget * 1000.0 / self.fps
+
+    @property
+    def detection_rate(self):
+        """Số lần chạy detector mỗi giây video"""
+        return self.fps / self.interval
+
+    def set_budget(self, budget):
+        self.budget = min(1.0, max(0.1, budget))
+        self._update_interval()
+
+    def should_detect(self, frame_index):
+        if self.last_detection is None or frame_index < self.last_detection:
+            return True  # Lần đầu hoặc vừa seek lùi
+        return frame_index - self.last_detection >= self.interval
+
+    def record_frame(self, frame_index, elapsed_ms, detected):
+        """Ghi thời gian xử lý một frame (ms), detected=True nếu frame này chạy detector"""
+        if detected:
+            self.last_detection = frame_index
+            self.detection_ms = elapsed_ms if self.detection_ms is None else \
+                self.alpha * elapsed_ms + (1 - self.alpha) * self.detection_ms
+        else:
+            self.frame_ms = self.alpha * elapsed_ms + (1 - self.alpha) * self.frame_ms
+        self._update_interval()
+
+    def _update_interval(self):
+        if self.detection_ms is None:
+            return
+        # N frame tốn detection_ms + (N - 1) * frame_ms, phải <= N * budget_ms
+        available = self.budget_ms - self.frame_ms
+        if available <= 0:
+            self.interval = self.max_interval
+            return
+        needed = math.ceil((self.detection_ms - self.frame_ms) / available)
+        self.interval = min(self.max_interval, max(1, needed))
+
+    def reset(self):
+        """Gọi khi seek hoặc bật lại nhận diện để frame kế tiếp chạy detector ngay"""
+        self.last_detection = None
+
+    def describe(self):
+        detection = f"{self.detection_ms:.0f} ms" if self.detection_ms is not None else "-"
+        return (f"Nhận diện: 1/{self.interval} frame ({self.detection_rate:.1f} lần/s), "
+                f"trễ {detection}, budget {self.budget_ms:.0f} ms/frame")
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Inference server cục bộ giữ model YOLO + OCR luôn sẵn sàng cho các mode.
+
+main.py khởi động server một lần; ImageMode, VideoMode và BatchMode gọi
+connect_pipeline() để gửi frame tới server thay vì tự tải model. Nếu server
+không chạy, connect_pipeline() trả về pipeline cục bộ như trước.
+
+Server nhận (unpickle) mọi yêu cầu nên chỉ chấp nhận kết nối có authkey của phiên
+hiện tại: main.py tạo khoá ngẫu nhiên mỗi lần chạy và truyền cho server và các mode
+qua biến môi trường LPR_SERVER_AUTHKEY. Mode không có khoá thì dùng pipeline cục bộ.
+
+    LPR_SERVER_AUTHKEY=<hex> python inference_server.py --preload video batch image
+"""
+import sys
+import os
+import subprocess
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from detection_pipeline import create_pipeline, PIPELINE_PRESETS
+
+DEFAULT_ADDRESS = ('127.0.0.1', int(os.environ.get('LPR_SERVER_PORT', 6010)))
+AUTHKEY_ENV = 'LPR_SERVER_AUTHKEY'
+
+
+def session_authkey():
+    """Authkey của phiên hiện tại (từ biến môi trường), hoặc None nếu không có"""
+    value = os.environ.get(AUTHKEY_ENV)
+    if not value:
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return None
+
+
+def new_session_authkey():
+    """Tạo authkey ngẫu nhiên cho phiên này; các process con kế thừa qua biến môi trường"""
+    authkey = os.urandom(32)
+    os.environ[AUTHKEY_ENV] = authkey.hex()
+    return authkey
+
+
+class InferenceServer:
+    def __init__(self, authkey, address=DEFAULT_ADDRESS):
+        self.authkey = authkey
+        self.address = address
+        self.pipelines = {}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.running = False
+
+    def get_pipeline(self, mode, overrides):
+        # Mỗi cấu hình có một pipeline và một lock riêng; override trùng giá trị preset bị bỏ
+        # để client truyền lại giá trị mặc định vẫn dùng chung pipeline đã tải trước
+        preset = PIPELINE_PRESETS[mode]
+        overrides = {name: value for name, value in overrides.items()
+                     if name not in preset or preset[name] != value}
+        key = (mode, repr(sorted(overrides.items())))
+        with self.lock:
+            if key not in self.pipelines:
+                self.pipelines[key] = (create_pipeline(mode, **overrides), threading.Lock())
+        pipeline, pipeline_lock = self.pipelines[key]
+        with pipeline_lock:
+            pipeline.load_models()
+        return pipeline, pipeline_lock
+
+    def preload(self, modes):
+        for mode in modes:
+            try:
+                self.get_pipeline(mode, {})
+            except Exception as e:
+                print(f"[ERROR] Không thể tải trước pipeline '{mode}': {e}")
+
+    def serve_forever(self):
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.running = True
+        print(f"[INFO] Inference server đang lắng nghe tại {self.address[0]}:{self.address[1]}")
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break  # Listener đã bị đóng bởi lệnh shutdown
+            except Exception as e:
+                print(f"[ERROR] Kết nối bị từ chối: {e}")
+                continue
+            if not self.running:
+                conn.close()
+                break
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+    def shutdown(self):
+        self.running = False
+        if self.listener is not None:
+            # accept() không tự thoát khi listener bị đóng, kết nối giả để đánh thức nó
+            try:
+                Client(self.address, authkey=self.authkey).close()
+            except (OSError, AuthenticationError):
+                pass
+            self.listener.close()
+
+    def handle_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    response = {'ok': True, 'result': self.dispatch(request)}
+                except Exception as e:
+                    print(f"[ERROR] Lỗi xử lý yêu cầu '{request.get('cmd')}': {e}")
+                    response = {'ok': False, 'error': str(e)}
+                conn.send(response)
+                if request.get('cmd') == 'shutdown':
+                    self.shutdown()
+                    break
+
+    def dispatch(self, request):
+        cmd = request.get('cmd')
+        if cmd == 'ping':
+            return 'pong'
+        if cmd == 'shutdown':
+            return None
+        pipeline, pipeline_lock = self.get_pipeline(request['mode'], request.get('overrides', {}))
+        if cmd == 'load':
+            return None
+        if cmd == 'process':
+            with pipeline_lock:
+                return pipeline.process_batch(request['frames'], request.get('rois'))
+        if cmd == 'detect':
+            with pipeline_lock:
+                return pipeline.detect(request['frame'], request.get('rois'))
+        if cmd == 'recognize':
+            with pipeline_lock:
+                return pipeline.recognize_plates(request['crops'])
+        raise ValueError(f"Lệnh không hỗ trợ: {cmd}")
+
+
+class RemotePipeline:
+    """Thay thế LicensePlatePipeline, gửi frame tới InferenceServer"""
+
+    def __init__(self, mode, authkey, address=DEFAULT_ADDRESS, **overrides):
+        self.mode = mode
+        self.authkey = authkey
+        self.address = address
+        self.overrides = overrides
+        self.models_loaded = False
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _call(self, request):
+        with self.lock:
+            if self.conn is None:
+                self.conn = Client(self.address, authkey=self.authkey)
+            try:
+                self.conn.send(request)
+                response = self.conn.recv()
+            except (EOFError, OSError):
+                self.conn = None
+                raise
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def load_models(self, warmup=True):
+        self._call({'cmd': 'load', 'mode': self.mode, 'overrides': self.overrides})
+        self.models_loaded = True
+
+    def process(self, frame, rois=None):
+        return self.process_batch([frame], rois)[0]
+
+    def process_batch(self, frames, rois=None):
+        return self._call({'cmd': 'process', 'mode': self.mode, 'overrides': self.overrides,
+                           'frames': list(frames), 'rois': rois})
+
+    def detect(self, frame, rois=None):
+        return self._call({'cmd': 'detect', 'mode': self.mode, 'overrides': self.overrides,
+                           'frame': frame, 'rois': rois})
+
+    def recognize_plates(self, plate_rois):
+        return self._call({'cmd': 'recognize', 'mode': self.mode, 'overrides': self.overrides,
+                           'crops': list(plate_rois)})
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+def server_available(address=DEFAULT_ADDRESS, authkey=None):
+    authkey = authkey or session_authkey()
+    if authkey is None:
+        return False  # Không có khoá của phiên: không dùng server
+    try:
+        conn = Client(address, authkey=authkey)
+    except (OSError, AuthenticationError):
+        return False  # Không có server, hoặc server của phiên khác
+    try:
+        conn.send({'cmd': 'ping'})
+        return conn.recv().get('result') == 'pong'
+    except (EOFError, OSError):
+        return False
+    finally:
+        conn.close()
+
+
+def connect_pipeline(mode, address=DEFAULT_ADDRESS, **overrides):
+    """Dùng inference server nếu đang chạy, nếu không thì tải model ngay trong process này"""
+    authkey = session_authkey()
+    if server_available(address, authkey):
+        print(f"[INFO] Dùng inference server tại {address[0]}:{address[1]} cho mode '{mode}'")
+        return RemotePipeline(mode, authkey, address, **overrides)
+    return create_pipeline(mode, **overrides)
+
+
+def start_server_process(preload=('video', 'batch', 'image'), address=DEFAULT_ADDRESS):
+    """Khởi động server ở process riêng (nếu chưa chạy), trả về Popen hoặc None.
+
+    Cần authkey của phiên (new_session_authkey()); server nhận khoá qua biến môi trường.
+    """
+    if session_authkey() is None or server_available(address):
+        return None
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_server.py')
+    startupinfo = None
+    if os.name == 'nt':  # Chỉ trên Windows
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    env = dict(os.environ, LPR_SERVER_PORT=str(address[1]))
+    return subprocess.Popen(['python', server_path, '--preload', *preload],
+                            startupinfo=startupinfo, env=env)
+
+
+def stop_server(address=DEFAULT_ADDRESS):
+    authkey = session_authkey()
+    if authkey is None:
+        return
+    try:
+        conn = Client(address, authkey=authkey)
+    except (OSError, AuthenticationError):
+        return
+    try:
+        conn.send({'cmd': 'shutdown'})
+        conn.recv()
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inference server giữ model nhận diện biển số luôn sẵn sàng")
+    parser.add_argument('--preload', nargs='*', default=[], choices=sorted(PIPELINE_PRESETS),
+                        help="Các preset cần tải model trước khi nhận kết nối")
+    parser.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    args = parser.parse_args()
+
+    authkey = session_authkey()
+    if authkey is None:
+        parser.error(f"Thiếu authkey: đặt {AUTHKEY_ENV} (hex) hoặc khởi động qua main.py")
+    server = InferenceServer(authkey, (DEFAULT_ADDRESS[0], args.port))
+    # Nhận kết nối ngay, model được tải trước ở thread nền
+    threading.Thread(target=server.preload, args=(args.preload,), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    sys.exit(0)
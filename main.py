@@ -5,10 +5,20 @@ from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QGridLayout,
 from PyQt5.QtCore import Qt, QSize, QPoint
 from PyQt5.QtGui import QFont, QIcon, QPixmap, QPainter, QBrush, QColor, QPen, QPolygon
 
+from inference_server import start_server_process, stop_server, new_session_authkey
+
 class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.active_process = None  # Lưu process đang chạy
+        # Khởi động inference server một lần để các mode dùng chung model đã tải sẵn.
+        # Khoá ngẫu nhiên của phiên này được server và các mode kế thừa qua biến môi trường
+        new_session_authkey()
+        try:
+            self.server_process = start_server_process()
+        except Exception as e:
+            print(f"Lỗi khi khởi động inference server: {e}")
+            self.server_process = None
         self.initUI()
         
     def initUI(self):
@@ -409,6 +419,16 @@ if __name__ == '__main__':
         if event.key() == Qt.Key_Escape:
             self.close()
 
+    def closeEvent(self, event):
+        # Dừng inference server nếu launcher đã khởi động nó
+        if self.server_process is not None:
+            stop_server()
+            try:
+                self.server_process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.server_process.terminate()
+        event.accept()
+
 if __name__ == '__main__':
     import sys
     
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Backend suy luận cho các detector YOLO: PyTorch, ONNX Runtime hoặc OpenVINO.
+
+Model .pt được export một lần sang ONNX / OpenVINO IR và lưu trong model_cache/,
+các lần sau chỉ nạp file đã export. So sánh độ trễ giữa các backend:
+
+    python model_backends.py img-testing/*.png img/*.png --model license_plate_detector.pt
+"""
+import os
+import shutil
+import hashlib
+import time
+import json
+
+BACKENDS = ('pytorch', 'onnx', 'openvino', 'openvino-int8')
+DEFAULT_BACKEND = os.environ.get('LPR_BACKEND', 'pytorch')
+DEFAULT_PLATE_BACKEND = os.environ.get('LPR_PLATE_BACKEND')  # None: giống DEFAULT_BACKEND
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache')
+
+
+def _cache_key(model_path, backend, imgsz, int8):
+    # Export lại khi file .pt thay đổi (mtime/kích thước) hoặc cấu hình export khác
+    stat = os.stat(model_path)
+    raw = f"{os.path.abspath(model_path)}|{stat.st_mtime_ns}|{stat.st_size}|{backend}|{imgsz}|{int8}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+def exported_model_path(model_path, backend, imgsz=640, int8=False, cache_dir=MODEL_CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    name = f"{stem}-{'int8-' if int8 else ''}{_cache_key(model_path, backend, imgsz, int8)}"
+    if backend == 'onnx':
+        return os.path.join(cache_dir, name + '.onnx')
+    return os.path.join(cache_dir, name + '_openvino_model')
+
+
+def export_model(model_path, backend, imgsz=640, int8=False, data=None, cache_dir=MODEL_CACHE_DIR):
+    """Export model .pt sang backend (nếu chưa có trong cache), trả về đường dẫn model đã export"""
+    if backend == 'pytorch':
+        return model_path
+    if backend not in ('onnx', 'openvino'):
+        raise ValueError(f"Backend không hỗ trợ: {backend}")
+
+    target = exported_model_path(model_path, backend, imgsz, int8, cache_dir)
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+
+    print(f"[INFO] Đang export {os.path.basename(model_path)} sang {backend} (chỉ chạy lần đầu)...")
+    os.makedirs(cache_dir, exist_ok=True)
+    export_args = {'format': backend, 'imgsz': imgsz, 'dynamic': True}
+    if int8:
+        export_args.update({'int8': True, 'data': data})
+    exported = YOLO(model_path).export(**export_args)
+    shutil.move(str(exported), target)
+    print(f"[INFO] Đã lưu model {backend} tại {target}")
+    return target
+
+
+def load_yolo(model_path, backend=DEFAULT_BACKEND, imgsz=640):
+    """Nạp detector YOLO với backend đã chọn, API kết quả giống hệt bản PyTorch"""
+    from ultralytics import YOLO
+
+    if backend == 'pytorch' or not model_path.endswith('.pt'):
+        return YOLO(model_path)
+    if backend == 'openvino-int8':
+        # Model INT8 cần dữ liệu calibration nên phải tạo trước bằng quantize_plate_model.py
+        target = exported_model_path(model_path, 'openvino', imgsz, int8=True)
+        if not os.path.exists(target):
+            raise FileNotFoundError(f"Chưa có model INT8 cho {model_path}, hãy chạy quantize_plate_model.py trước")
+        return YOLO(target, task='detect')
+    return YOLO(export_model(model_path, backend, imgsz), task='detect')
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_agreement(reference, candidate, iou_threshold=0.9):
+    """Tỉ lệ box tham chiếu có box tương ứng (IoU >= ngưỡng) ở backend khác, và IoU trung bình"""
+    if not reference:
+        return {'matched': 1.0 if not candidate else 0.0, 'mean_iou': 1.0, 'count_delta': len(candidate)}
+    ious = [max((box_iou(ref, box) for box in candidate), default=0.0) for ref in reference]
+    return {'matched': sum(iou >= iou_threshold for iou in ious) / len(ious),
+            'mean_iou': sum(ious) / len(ious),
+            'count_delta': len(candidate) - len(reference)}
+
+
+def benchmark_backends(model_path, images, backends=BACKENDS, conf=0.4, imgsz=640, repeat=5):
+    """Đo độ trễ từng backend trên cùng tập ảnh, so sánh box với bản PyTorch"""
+    report = {}
+    reference_boxes = None
+    for backend in backends:
+        try:
+            model = load_yolo(model_path, backend, imgsz)
+        except Exception as e:
+            print(f"[ERROR] Không thể nạp backend {backend}: {e}")
+            report[backend] = {'error': str(e)}
+            continue
+
+        model(images[0], conf=conf, imgsz=imgsz, verbose=False)  # Warm-up
+        samples = []
+        boxes = []
+        for image in images:
+            for r in range(repeat):
+                t0 = time.perf_counter()
+                result = model(image, conf=conf, imgsz=imgsz, verbose=False)[0]
+                samples.append((time.perf_counter() - t0) * 1000)
+            boxes.append([tuple(map(float, box.xyxy[0])) for box in result.boxes])
+
+        samples.sort()
+        entry = {'p50_ms': samples[len(samples) // 2],
+                 'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                 'mean_ms': sum(samples) / len(samples)}
+        if reference_boxes is None:
+            reference_boxes = boxes
+        else:
+            agreements = [box_agreement(ref, cand) for ref, cand in zip(reference_boxes, boxes)]
+            entry['box_match_rate'] = sum(a['matched'] for a in agreements) / len(agreements)
+            entry['mean_iou'] = sum(a['mean_iou'] for a in agreements) / len(agreements)
+        report[backend] = entry
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import cv2
+
+    parser = argparse.ArgumentParser(description="So sánh độ trễ detector YOLO giữa các backend CPU")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--model', default='license_plate_detector.pt')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    images = [image for image in (cv2.imread(path) for path in args.images) if image is not None]
+    if not images:
+        parser.error("Không đọc được ảnh nào")
+    report = benchmark_backends(args.model, images, args.backends, args.conf, args.imgsz, args.repeat)
+    print(json.dumps({'model': args.model, 'images': len(images), 'backends': report}, indent=2))
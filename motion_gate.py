@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Cổng chuyển động rẻ tiền cho camera cố định.
+
+Frame được thu nhỏ, chuyển xám, làm mờ rồi so với nền trung bình trượt. Khi tỉ lệ
+điểm ảnh thay đổi dưới ngưỡng, cảnh được coi là tĩnh và VideoMode bỏ qua YOLO +
+OCR. Chỉ cần một frame có chuyển động là cổng mở lại ngay, và giữ mở thêm
+hold_frames frame để xe vừa dừng vẫn được nhận diện nốt.
+"""
+import cv2
+import numpy as np
+
+# Độ nhạy: (ngưỡng chênh lệch mức xám, tỉ lệ điểm ảnh thay đổi tối thiểu)
+SENSITIVITY_LEVELS = {
+    'low': (35, 0.02),
+    'medium': (25, 0.005),
+    'high': (15, 0.001),
+}
+
+
+class MotionGate:
+    def __init__(self, sensitivity='medium', width=160, alpha=0.1, hold_frames=15):
+        self.width = width
+        self.alpha = alpha
+        self.hold_frames = hold_frames
+        self.set_sensitivity(sensitivity)
+        self.background = None
+        self.hold = 0
+        self.frames = 0
+        self.static_frames = 0
+        self.last_change = 0.0
+
+    def set_sensitivity(self, sensitivity):
+        """sensitivity là một khoá của SENSITIVITY_LEVELS, hoặc 'off' để tắt cổng"""
+        self.sensitivity = sensitivity
+        self.enabled = sensitivity != 'off'
+        if self.enabled:
+            self.pixel_threshold, self.min_changed = SENSITIVITY_LEVELS[sensitivity]
+
+    def reset(self):
+        # Sau khi seek, nền cũ không còn đúng: frame kế tiếp coi như có chuyển động
+        self.background = None
+        self.hold = 0
+
+    def update(self, frame):
+        """Trả về (có chuyển động, vừa bắt đầu chuyển động) cho frame BGR này"""
+        if not self.enabled:
+            return True, False
+        height, width = frame.shape[:2]
+        scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+
+        self.frames += 1
+        if self.background is None:
+            self.background = gray
+            self.hold = self.hold_frames
+            return True, True
+
+        diff = cv2.absdiff(gray, self.background)
+        self.last_change = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        cv2.accumulateWeighted(gray, self.background, self.alpha)
+
+        was_moving = self.hold > 0
+        if self.last_change >= self.min_changed:
+            self.hold = self.hold_frames
+            return True, not was_moving
+        if self.hold > 0:
+            self.hold -= 1
+            return True, False
+        self.static_frames += 1
+        return False, False
+
+    @property
+    def skipped_fraction(self):
+        return self.static_frames / self.frames if self.frames else 0.0
+
+    def describe(self):
+        if not self.enabled:
+            return "Cổng chuyển động: tắt"
+        return (f"Cổng chuyển động ({self.sensitivity}): bỏ qua {self.skipped_fraction:.0%} frame, "
+                f"thay đổi {self.last_change:.2%}")
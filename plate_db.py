@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""Lưu các lần đọc biển số vào SQLite cục bộ (plate_reads.db).
+
+Thread xử lý chỉ đưa bản ghi vào hàng đợi (không bao giờ chờ đĩa); một thread ghi
+riêng gom bản ghi thành batch và chèn bằng executemany trong một transaction, ảnh
+crop biển số (nếu có) cũng được ghi ở thread này. Hàng đợi đầy thì bản ghi bị bỏ
+và được đếm trong dropped thay vì làm chậm vòng xử lý.
+
+Bảng có chỉ mục theo (text, thời gian), thời gian và (nguồn, thời gian) nên tra
+theo biển số / khoảng thời gian / camera vẫn nhanh với hàng chục triệu dòng:
+
+    python plate_db.py --plate 51F12345
+    python plate_db.py --source camera1.mp4 --since "2026-10-18 08:00" --until "2026-10-18 09:00"
+"""
+import os
+import time
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import cv2
+
+from plate_ocr import clean_plate_text
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plate_reads.db')
+CROP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plate_crops')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS plate_reads (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    frame INTEGER,
+    video_seconds REAL,
+    seen_at REAL NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    text TEXT NOT NULL,
+    confidence REAL,
+    crop_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reads_text_time ON plate_reads (text, seen_at);
+CREATE INDEX IF NOT EXISTS idx_reads_time ON plate_reads (seen_at);
+CREATE INDEX IF NOT EXISTS idx_reads_source_time ON plate_reads (source_id, seen_at);
+CREATE INDEX IF NOT EXISTS idx_reads_source_frame ON plate_reads (source_id, frame);
+"""
+
+READ_COLUMNS = ('id', 'source', 'frame', 'video_seconds', 'seen_at', 'bbox', 'text', 'confidence', 'crop_path')
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    # WAL: đọc (tìm kiếm, giao diện) không bị chặn trong lúc thread ghi đang chèn
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _row_to_read(row):
+    read_id, source, frame, video_seconds, seen_at, x1, y1, x2, y2, text, confidence, crop_path = row
+    bbox = (x1, y1, x2, y2) if x1 is not None else None
+    return dict(zip(READ_COLUMNS, (read_id, source, frame, video_seconds, seen_at, bbox, text,
+                                   confidence, crop_path)))
+
+
+class PlateDatabaseWriter:
+    def __init__(self, path=DB_PATH, crop_dir=None, batch_size=500, flush_interval=0.5, queue_size=50000):
+        self.path = path
+        self.crop_dir = crop_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, source, text, frame=None, video_seconds=None, bbox=None, confidence=None,
+               crop=None, seen_at=None):
+        """Đưa một lần đọc vào hàng đợi ghi; trả về False nếu bị bỏ vì hàng đợi đầy"""
+        text = clean_plate_text(text)
+        if not text:
+            return False
+        item = (str(source), text, frame, video_seconds, time.time() if seen_at is None else seen_at,
+                tuple(int(v) for v in bbox) if bbox is not None else None, confidence, crop)
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def close(self, timeout=10.0):
+        """Ghi nốt các bản ghi còn trong hàng đợi rồi dừng thread ghi"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            conn = connect(self.path)
+        except sqlite3.Error as e:
+            self.error = e
+            print(f"[ERROR] Không mở được CSDL biển số {self.path}: {e}")
+            return
+        source_ids = {}
+        closing = False
+        try:
+            while not closing:
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                deadline = time.perf_counter() + self.flush_interval
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                    except queue.Empty:
+                        break
+                closing = item is None
+                if batch:
+                    self._write_batch(conn, batch, source_ids)
+        finally:
+            conn.close()
+
+    def _source_id(self, conn, name, source_ids):
+        if name not in source_ids:
+            conn.execute('INSERT OR IGNORE INTO sources (name) VALUES (?)', (name,))
+            source_ids[name] = conn.execute('SELECT id FROM sources WHERE name = ?', (name,)).fetchone()[0]
+        return source_ids[name]
+
+    def _write_batch(self, conn, batch, source_ids):
+        rows = []
+        for source, text, frame, video_seconds, seen_at, bbox, confidence, crop in batch:
+            source_id = self._source_id(conn, source, source_ids)
+            crop_path = self._save_crop(source_id, source, text, frame, seen_at, crop) if crop is not None else None
+            x1, y1, x2, y2 = bbox if bbox is not None else (None, None, None, None)
+            rows.append((source_id, frame, video_seconds, seen_at,
+                         x1, y1, x2, y2, text, confidence, crop_path))
+        try:
+            with conn:
+                conn.executemany('INSERT INTO plate_reads (source_id, frame, video_seconds, seen_at, '
+                                 'x1, y1, x2, y2, text, confidence, crop_path) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            self.error = e
+            self.dropped += len(rows)
+            print(f"[ERROR] Lỗi ghi {len(rows)} bản ghi biển số: {e}")
+
+    def _save_crop(self, source_id, source, text, frame, seen_at, crop):
+        if not self.crop_dir:
+            return None
+        # Thư mục theo id nguồn: hai video cùng tên ở hai thư mục khác nhau không ghi đè crop của nhau
+        stem = os.path.splitext(os.path.basename(source))[0] or 'source'
+        directory = os.path.join(self.crop_dir, f"{source_id}_{stem}")
+        os.makedirs(directory, exist_ok=True)
+        position = frame if frame is not None else int(seen_at * 1000)
+        path = os.path.join(directory, f"{position}_{text}.jpg")
+        return path if cv2.imwrite(path, crop) else None
+
+
+class PlateDatabase:
+    """Truy vấn các lần đọc đã lưu; kết quả là list dict theo READ_COLUMNS"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = connect(path)
+
+    def close(self):
+        self.conn.close()
+
+    def _query(self, where, params, limit):
+        sql = ('SELECT r.id, s.name, r.frame, r.video_seconds, r.seen_at, r.x1, r.y1, r.x2, r.y2, '
+               'r.text, r.confidence, r.crop_path FROM plate_reads r JOIN sources s ON s.id = r.source_id')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY r.seen_at'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        return [_row_to_read(row) for row in self.conn.execute(sql, params)]
+
+    def _time_filter(self, where, params, start, end, column='r.seen_at'):
+        if start is not None:
+            where.append(f'{column} >= ?')
+            params.append(start)
+        if end is not None:
+            where.append(f'{column} <= ?')
+            params.append(end)
+
+    def find_plate(self, text, start=None, end=None, limit=1000):
+        return self.find_plates([text], start, end, limit)
+
+    def find_plates(self, texts, start=None, end=None, limit=1000):
+        """Các lần đọc có text thuộc texts (mỗi text tra qua chỉ mục (text, seen_at))"""
+        texts = list(dict.fromkeys(clean_plate_text(text) for text in texts))[:500]  # Giới hạn số tham số SQLite
+        if not texts:
+            return []
+        where, params = [f"r.text IN ({', '.join('?' * len(texts))})"], list(texts)
+        self._time_filter(where, params, start, end)
+        return self._query(where, params, limit)
+
+    def distinct_texts(self, after_id=0):
+        """(các text khác nhau của lần đọc có id > after_id, id lớn nhất đã xét)"""
+        last_id = self.last_id()
+        if last_id <= after_id:
+            return [], after_id
+        if after_id == 0:
+            # Cả bảng: duyệt chỉ mục (text, seen_at) thay vì đọc từng dòng
+            rows = self.conn.execute('SELECT DISTINCT text FROM plate_reads INDEXED BY idx_reads_text_time '
+                                     'WHERE id <= ?', (last_id,))
+        else:
+            rows = self.conn.execute('SELECT DISTINCT text FROM plate_reads WHERE id > ? AND id <= ?',
+                                     (after_id, last_id))
+        return [text for text, in rows], last_id
+
+    def in_range(self, start=None, end=None, source=None, limit=1000):
+        where, params = [], []
+        if source is not None:
+            # Tra id nguồn trước để dùng chỉ mục (source_id, seen_at)
+            row = self.conn.execute('SELECT id FROM sources WHERE name = ?', (str(source),)).fetchone()
+            if row is None:
+                return []
+            where.append('r.source_id = ?')
+            params.append(row[0])
+        self._time_filter(where, params, start, end)
+        return self._query(where, params, limit)
+
+    def source_frames(self, source):
+        """Các frame khác nhau có lần đọc của một nguồn, tăng dần"""
+        row = self.conn.execute('SELECT id FROM sources WHERE name = ?', (str(source),)).fetchone()
+        if row is None:
+            return []
+        # Duyệt chỉ mục (source_id, frame): đủ nhanh để gọi trên thread GUI khi mở video
+        return [frame for frame, in self.conn.execute(
+            'SELECT DISTINCT frame FROM plate_reads INDEXED BY idx_reads_source_frame '
+            'WHERE source_id = ? AND frame IS NOT NULL ORDER BY frame',
+            (row[0],))]
+
+    def last_id(self):
+        return self.conn.execute('SELECT MAX(id) FROM plate_reads').fetchone()[0] or 0
+
+    def sources(self):
+        return [name for name, in self.conn.execute('SELECT name FROM sources ORDER BY name')]
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM plate_reads').fetchone()[0]
+
+
+def parse_time(value):
+    """Giây epoch hoặc thời gian ISO ('2026-10-18 08:00') -> giây epoch"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def format_read(read):
+    seen = datetime.fromtimestamp(read['seen_at']).strftime('%Y-%m-%d %H:%M:%S')
+    position = f"frame {read['frame']}" if read['frame'] is not None else ''
+    confidence = f"{read['confidence']:.2f}" if read['confidence'] is not None else '-'
+    return f"{seen}  {read['text']:<12} {confidence:>5}  {read['source']} {position}"
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tra cứu các lần đọc biển số đã lưu trong SQLite")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--plate', help="Biển số cần tìm (khớp chính xác sau khi chuẩn hoá)")
+    parser.add_argument('--source', help="File video / camera")
+    parser.add_argument('--since', help="Từ thời điểm (giây epoch hoặc ISO)")
+    parser.add_argument('--until', help="Tới thời điểm (giây epoch hoặc ISO)")
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    database = PlateDatabase(args.db)
+    start = parse_time(args.since) if args.since else None
+    end = parse_time(args.until) if args.until else None
+    t0 = time.perf_counter()
+    if args.plate:
+        reads = database.find_plate(args.plate, start, end, limit=args.limit)
+    else:
+        reads = database.in_range(start, end, source=args.source, limit=args.limit)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    for read in reads:
+        print(format_read(read))
+    print(f"{len(reads)} kết quả / {database.count()} lần đọc trong {elapsed_ms:.1f} ms")
+    database.close()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Kho sự kiện biển số có chỉ mục, thay cho list detected_plates.
+
+Mỗi biển số (text đã chuẩn hoá) chỉ tạo một sự kiện trong cửa sổ thời gian
+window_seconds: lần đọc lặp lại được gộp vào sự kiện cũ bằng một lần tra dict,
+không phải quét cả list. Số sự kiện giữ trong bộ nhớ bị giới hạn (sự kiện cũ nhất
+bị bỏ trước).
+"""
+import threading
+from collections import deque
+
+from plate_ocr import clean_plate_text
+
+
+class PlateEvent:
+    __slots__ = ('text', 'source', 'first_frame', 'last_frame', 'first_seconds', 'last_seconds',
+                 'bbox', 'reads', 'track_id')
+
+    def __init__(self, text, source, frame, seconds, bbox, reads=1, track_id=None):
+        self.text = text
+        self.source = source
+        self.first_frame = self.last_frame = frame
+        self.first_seconds = self.last_seconds = seconds
+        self.bbox = tuple(bbox)
+        self.reads = reads
+        self.track_id = track_id
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"PlateEvent({self.text!r}, {self.first_seconds:.2f}s-{self.last_seconds:.2f}s, reads={self.reads})"
+
+
+class PlateEventStore:
+    def __init__(self, window_seconds=30.0, max_events=200000):
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.events = deque()
+        self.latest_by_text = {}  # text chuẩn hoá -> sự kiện gần nhất, để gộp lần đọc lặp lại
+        self.total_added = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.events))
+
+    def add(self, text, frame, seconds, bbox, reads=1, track_id=None, source=None):
+        """Ghi một lần đọc biển số; trả về (sự kiện, True nếu là sự kiện mới)"""
+        text = clean_plate_text(text)
+        if not text:
+            return None, False
+        with self.lock:
+            event = self.latest_by_text.get(text)
+            if event is not None and event.source == source and \
+                    abs(seconds - event.last_seconds) <= self.window_seconds:
+                # Cùng biển số trong cửa sổ thời gian: gộp vào sự kiện cũ
+                if seconds > event.last_seconds:
+                    event.last_frame, event.last_seconds, event.bbox = frame, seconds, tuple(bbox)
+                event.reads += reads
+                return event, False
+
+            event = PlateEvent(text, source, frame, seconds, bbox, reads, track_id)
+            if len(self.events) >= self.max_events:
+                self._evict_oldest()
+            self.events.append(event)
+            self.latest_by_text[text] = event
+            self.total_added += 1
+            return event, True
+
+    def _evict_oldest(self):
+        old = self.events.popleft()
+        if self.latest_by_text.get(old.text) is old:
+            del self.latest_by_text[old.text]
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.latest_by_text.clear()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Các hàm OCR biển số dùng chung cho LicensePlatePipeline (đơn lẻ và theo batch)"""
+import re
+
+import cv2
+import numpy as np
+
+
+def enhance_plate_for_ocr(plate_roi):
+    """Grayscale + CLAHE + bilateral + adaptive threshold + upscale (VideoMode)"""
+    gray_plate = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
+
+    # Enhance contrast
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(gray_plate)
+
+    # Apply bilateral filter to preserve edges while reducing noise
+    filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
+
+    # Apply adaptive thresholding
+    binary = cv2.adaptiveThreshold(
+        filtered, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY, 11, 2
+    )
+
+    # Resize image to better handle text recognition
+    return cv2.resize(binary, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+
+
+def preprocess_plate(plate_roi, mode):
+    if mode == 'enhance':
+        return enhance_plate_for_ocr(plate_roi)
+    return cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
+
+
+def clean_plate_text(text):
+    """Viết hoa và bỏ các ký tự không phải chữ/số"""
+    return re.sub(r'[^A-Z0-9]', '', text.upper())
+
+
+def resize_to_height(image, height):
+    h, w = image.shape[:2]
+    width = max(1, int(round(w * height / float(h))))
+    interpolation = cv2.INTER_AREA if h > height else cv2.INTER_CUBIC
+    return cv2.resize(image, (width, height), interpolation=interpolation)
+
+
+def pad_to_width(image, width):
+    missing = width - image.shape[1]
+    if missing <= 0:
+        return image
+    return cv2.copyMakeBorder(image, 0, 0, 0, missing, cv2.BORDER_REPLICATE)
+
+
+def width_buckets(images, step=32, max_width=512):
+    """Gom các ảnh (đã cùng chiều cao) theo chiều rộng làm tròn lên bội số của step"""
+    buckets = {}
+    for i, image in enumerate(images):
+        width = min(max_width, -(-image.shape[1] // step) * step)
+        buckets.setdefault(width, []).append(i)
+    return buckets
+
+
+def read_batch_easyocr(reader, images, allowlist=None, height=64, batch_size=16):
+    """Nhận diện nhiều ảnh biển số xám bằng readtext_batched, theo từng bucket chiều rộng"""
+    resized = [resize_to_height(image, height) for image in images]
+    texts = [''] * len(images)
+    for width, indices in width_buckets(resized).items():
+        bucket = [pad_to_width(resized[i][:, :width], width) for i in indices]
+        results = reader.readtext_batched(bucket, n_width=width, n_height=height, detail=0,
+                                          paragraph=False, allowlist=allowlist, batch_size=batch_size)
+        for i, result in zip(indices, results):
+            texts[i] = ''.join(result)
+    return texts
+
+
+def read_batch_tesseract(pytesseract, images, height=64, gap=24):
+    """Xếp các biển số thành một ảnh dọc và gọi Tesseract một lần, tách kết quả theo vị trí dòng"""
+    resized = [resize_to_height(image, height) for image in images]
+    slot = height + gap
+    width = max(image.shape[1] for image in resized) + 2 * gap
+    canvas = np.full((slot * len(resized) + gap, width), 255, dtype=np.uint8)
+    for i, image in enumerate(resized):
+        y = gap + i * slot
+        canvas[y:y + height, gap:gap + image.shape[1]] = image
+
+    data = pytesseract.image_to_data(canvas, config='--psm 6', output_type=pytesseract.Output.DICT)
+    words = [[] for _ in images]
+    for text, left, top, h in zip(data['text'], data['left'], data['top'], data['height']):
+        if not text.strip():
+            continue
+        index = int((top + h / 2.0 - gap / 2.0) // slot)
+        if 0 <= index < len(words):
+            words[index].append((left, text))
+    return [''.join(text for _, text in sorted(line)) for line in words]
+
+
+def plate_line_boxes(height, width, lines='auto', two_line_ratio=0.45):
+    """Chia biển số thành 1 hoặc 2 dòng, trả về các box [x_min, x_max, y_min, y_max]"""
+    if lines == 'auto':
+        lines = 2 if height >= two_line_ratio * width else 1
+    if lines == 2:
+        middle = height // 2
+        return [[0, width, 0, middle], [0, width, middle, height]]
+    return [[0, width, 0, height]]
+
+
+def read_batch_easyocr_recognizer(reader, images, allowlist=None, lines='auto', gap=16, batch_size=16):
+    """Bỏ qua bước CRAFT: đưa thẳng vùng biển số (1-2 dòng) vào recognizer của EasyOCR.
+
+    Các biển số được xếp dọc thành một ảnh, mỗi dòng là một box trong horizontal_list,
+    nên recognizer xử lý toàn bộ trong một lần gọi theo batch_size.
+    Trả về list (text, confidence) theo thứ tự ảnh đầu vào.
+    """
+    width = max(image.shape[1] for image in images)
+    canvas = np.full((sum(image.shape[0] + gap for image in images), width), 255, dtype=np.uint8)
+    boxes = []
+    owners = []
+    y = 0
+    for i, image in enumerate(images):
+        h, w = image.shape[:2]
+        canvas[y:y + h, :w] = image
+        for x_min, x_max, y_min, y_max in plate_line_boxes(h, w, lines):
+            boxes.append([x_min, x_max, y + y_min, y + y_max])
+            owners.append((y + y_min, i))
+        y += h + gap
+
+    results = reader.recognize(canvas, horizontal_list=boxes, free_list=[], detail=1,
+                               paragraph=False, allowlist=allowlist, batch_size=batch_size)
+
+    # Kết quả có thể bị sắp xếp lại, gán về biển số theo toạ độ y của box
+    owner_by_top = dict(owners)
+    parts = [[] for _ in images]
+    for points, text, confidence in results:
+        top = int(min(point[1] for point in points))
+        index = owner_by_top.get(top)
+        if index is None:
+            index = max((o for o in owners if o[0] <= top), default=owners[0])[1]
+        parts[index].append((top, text, confidence))
+
+    reads = []
+    for line_parts in parts:
+        line_parts.sort()
+        text = ''.join(text for _, text, _ in line_parts)
+        confidence = min((c for _, _, c in line_parts), default=0.0)
+        reads.append((text, float(confidence)))
+    return reads
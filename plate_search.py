@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Tìm gần đúng biển số trong các lần đọc đã lưu (plate_reads.db).
+
+OCR hay nhầm 0/O, 8/B, 1/I... nên tra chính xác bỏ sót nhiều lần thấy thật. Mỗi
+text được đưa về dạng chuẩn (các ký tự dễ nhầm gộp về một ký tự), và khoảng cách
+giữa hai biển số là khoảng cách Levenshtein trên dạng chuẩn: nhầm O với 0 không
+tính là sai khác.
+
+Chỉ mục là các biến thể xoá ký tự của từng text chuẩn (kiểu SymSpell): hai chuỗi
+cách nhau <= d phép sửa luôn có chung một biến thể xoá <= d ký tự, nên tìm với
+d <= max_distance chỉ cần tra dict vài chục lần rồi kiểm tra lại vài ứng viên,
+không phụ thuộc số lần đọc. Chỉ mục được lưu trong plate_search_index.pkl và chỉ
+nạp thêm các lần đọc mới ở lần mở sau:
+
+    python plate_search.py 51F12345 --distance 1
+"""
+import os
+import time
+import pickle
+from itertools import combinations
+
+from plate_ocr import clean_plate_text
+from plate_db import PlateDatabase, DB_PATH, format_read, parse_time
+
+SEARCH_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plate_search_index.pkl')
+# Khoảng cách lớn nhất chỉ mục hỗ trợ; lớn hơn thì search phải quét mọi biển số
+SEARCH_MAX_DISTANCE = 1
+
+# Các nhóm ký tự OCR hay nhầm lẫn, mọi ký tự trong nhóm được đưa về ký tự đầu
+CONFUSION_GROUPS = ('0ODQ', '1IL', '8B', '5S', '2Z', '6G')
+CANONICAL = str.maketrans({char: group[0] for group in CONFUSION_GROUPS for char in group[1:]})
+
+
+def canonical_plate(text):
+    return clean_plate_text(text).translate(CANONICAL)
+
+
+def bounded_distance(a, b, limit):
+    """Khoảng cách Levenshtein giữa a và b, hoặc limit + 1 nếu lớn hơn limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def plate_distance(a, b, limit=2):
+    """Khoảng cách có tính nhầm lẫn OCR: các ký tự dễ nhầm coi như giống nhau"""
+    return bounded_distance(canonical_plate(a), canonical_plate(b), limit)
+
+
+def deletion_variants(text, max_deletes):
+    variants = {text}
+    for count in range(1, min(max_deletes, len(text)) + 1):
+        for positions in combinations(range(len(text)), count):
+            variants.add(''.join(char for i, char in enumerate(text) if i not in positions))
+    return variants
+
+
+class PlateSearchIndex:
+    def __init__(self, max_distance=1):
+        self.max_distance = max_distance
+        self.variants = {}  # text chuẩn -> các text gốc đã đọc được
+        self.deletes = {}  # biến thể xoá ký tự -> các text chuẩn sinh ra nó
+        self.last_id = 0  # id lần đọc lớn nhất đã nạp
+        self.db_path = None
+
+    def __len__(self):
+        return len(self.variants)
+
+    def add(self, text):
+        text = clean_plate_text(text)
+        if not text:
+            return
+        key = text.translate(CANONICAL)
+        if key not in self.variants:
+            self.variants[key] = set()
+            for variant in deletion_variants(key, self.max_distance):
+                self.deletes.setdefault(variant, []).append(key)
+        self.variants[key].add(text)
+
+    def refresh(self, database):
+        """Nạp các text của lần đọc mới hơn last_id; trả về số text đã xét"""
+        db_path = os.path.abspath(database.path)
+        if self.db_path != db_path:
+            self.__init__(self.max_distance)
+            self.db_path = db_path
+        texts, self.last_id = database.distinct_texts(self.last_id)
+        for text in texts:
+            self.add(text)
+        return len(texts)
+
+    def search(self, text, distance=1):
+        """Các text gốc cách text <= distance, trả về list (text, khoảng cách) gần nhất trước"""
+        query = canonical_plate(text)
+        if not query:
+            return []
+        if distance <= self.max_distance:
+            candidates = set()
+            for variant in deletion_variants(query, distance):
+                candidates.update(self.deletes.get(variant, ()))
+        else:
+            candidates = self.variants  # Vượt quá chỉ mục: kiểm tra mọi text chuẩn
+        matches = []
+        for key in candidates:
+            key_distance = bounded_distance(query, key, distance)
+            if key_distance <= distance:
+                matches.extend((variant, key_distance) for variant in self.variants[key])
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+
+def load_search_index(database, path=SEARCH_INDEX_PATH, max_distance=SEARCH_MAX_DISTANCE):
+    """Chỉ mục từ cache (nếu khớp CSDL) cộng các lần đọc mới, lưu lại cache nếu có thay đổi"""
+    index = None
+    try:
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    if not isinstance(index, PlateSearchIndex) or index.max_distance != max_distance or \
+            index.db_path != os.path.abspath(database.path) or index.last_id > database.last_id():
+        index = PlateSearchIndex(max_distance)  # CSDL khác hoặc đã bị tạo lại
+    if index.refresh(database):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    return index
+
+
+def find_sightings(index, database, text, distance=1, start=None, end=None, limit=1000):
+    """Các lần đọc khớp gần đúng text, mỗi lần đọc có thêm khoá 'distance'"""
+    distances = dict(index.search(text, distance))
+    reads = database.find_plates(distances, start, end, limit)
+    for read in reads:
+        read['distance'] = distances[read['text']]
+    return reads
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tìm gần đúng biển số (tính cả nhầm lẫn OCR) trong CSDL")
+    parser.add_argument('plate')
+    parser.add_argument('--distance', type=int, default=SEARCH_MAX_DISTANCE,
+                        choices=range(SEARCH_MAX_DISTANCE + 1), help="Số ký tự sai khác tối đa")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--index', default=SEARCH_INDEX_PATH, help="File cache chỉ mục tìm kiếm")
+    parser.add_argument('--since', help="Từ thời điểm (giây epoch hoặc ISO)")
+    parser.add_argument('--until', help="Tới thời điểm (giây epoch hoặc ISO)")
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    database = PlateDatabase(args.db)
+    t0 = time.perf_counter()
+    index = load_search_index(database, args.index)
+    t1 = time.perf_counter()
+    matches = index.search(args.plate, args.distance)
+    t2 = time.perf_counter()
+    reads = find_sightings(index, database, args.plate, args.distance,
+                           parse_time(args.since) if args.since else None,
+                           parse_time(args.until) if args.until else None, args.limit)
+    t3 = time.perf_counter()
+
+    for read in reads:
+        print(f"d={read['distance']}  {format_read(read)}")
+    print(f"{len(matches)} biển số gần đúng, {len(reads)} lần thấy | chỉ mục {len(index)} biển số "
+          f"({(t1 - t0) * 1000:.0f} ms nạp) | tìm {(t2 - t1) * 1000:.1f} ms, tra CSDL {(t3 - t2) * 1000:.1f} ms")
+    database.close()
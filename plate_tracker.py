@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Tracker biển số kiểu SORT (Kalman vận tốc không đổi + ghép IoU).
+
+Detector chỉ chạy trên một số frame; ở các frame còn lại tracker dự đoán vị trí
+box để vẽ lên frame hiện tại thay vì hiện lại ảnh cũ. Trạng thái Kalman giống
+SORT: [cx, cy, diện tích, tỉ lệ w/h, vcx, vcy, vdiện tích], bước thời gian tính
+theo số frame giữa hai lần cập nhật nên frame bị bỏ qua không làm lệch dự đoán.
+
+Mỗi track cũng gom các lần OCR và bỏ phiếu: khi một chuỗi chiếm đa số (hoặc đã
+đọc đủ max_reads lần) thì text của track được chốt và không cần OCR nữa.
+"""
+from collections import Counter
+
+import numpy as np
+
+from model_backends import box_iou
+
+
+def _bbox_to_z(bbox):
+    x1, y1, x2, y2 = bbox
+    w, h = max(1.0, x2 - x1), max(1.0, y2 - y1)
+    return np.array([x1 + w / 2.0, y1 + h / 2.0, w * h, w / h], dtype=float)
+
+
+def _x_to_bbox(x):
+    area, ratio = max(1.0, x[2]), max(1e-3, x[3])
+    w = np.sqrt(area * ratio)
+    h = area / w
+    return (x[0] - w / 2.0, x[1] - h / 2.0, x[0] + w / 2.0, x[1] + h / 2.0)
+
+
+class KalmanBoxTrack:
+    H = np.hstack([np.eye(4), np.zeros((4, 3))])
+    R = np.diag([1.0, 1.0, 10.0, 0.01])
+
+    def __init__(self, track_id, plate, frame_index):
+        self.id = track_id
+        self.x = np.zeros(7)
+        self.x[:4] = _bbox_to_z(plate['bbox'])
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0])
+        self.last_frame = frame_index  # Frame của trạng thái hiện tại
+        self.last_update = frame_index  # Frame cuối cùng được ghép với một detection
+        self.first_frame = frame_index
+        self.hits = 1
+        self.plate = plate
+        self.votes = Counter()
+        self.reads = 0
+        self.final_text = None
+        self.reported = False
+
+    def predict(self, frame_index):
+        dt = frame_index - self.last_frame
+        if dt <= 0:
+            return
+        F = np.eye(7)
+        F[0, 4] = F[1, 5] = F[2, 6] = dt
+        Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001]) * dt
+        if self.x[2] + self.x[6] * dt <= 0:
+            self.x[6] = 0.0  # Diện tích không được âm
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        self.last_frame = frame_index
+
+    def update(self, plate, frame_index):
+        self.predict(frame_index)
+        y = _bbox_to_z(plate['bbox']) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+        self.last_update = frame_index
+        self.hits += 1
+        self.plate = plate
+
+    @property
+    def bbox(self):
+        return _x_to_bbox(self.x)
+
+    @property
+    def converged(self):
+        return self.final_text is not None
+
+    @property
+    def text(self):
+        """Text đã chốt, hoặc chuỗi nhiều phiếu nhất hiện tại"""
+        if self.final_text is not None:
+            return self.final_text
+        return self.votes.most_common(1)[0][0] if self.votes else ''
+
+    @property
+    def confidence(self):
+        """Tỉ lệ phiếu OCR hợp lệ đồng ý với text của track"""
+        total = sum(self.votes.values())
+        return self.votes[self.text] / total if total else 0.0
+
+    def add_read(self, text, valid, min_votes=3, min_share=0.6, max_reads=10):
+        """Thêm một lần OCR; trả về True nếu text của track vừa được chốt"""
+        if self.converged:
+            return False
+        self.reads += 1
+        if valid:
+            self.votes[text] += 1
+        if not self.votes:
+            return False
+        best, count = self.votes.most_common(1)[0]
+        if (count >= min_votes and count >= min_share * sum(self.votes.values())) or self.reads >= max_reads:
+            self.final_text = best
+            return True
+        return False
+
+
+class PlateTracker:
+    def __init__(self, max_age=30, iou_threshold=0.2, min_votes=3, min_share=0.6, max_reads=10):
+        self.max_age = max_age  # Số frame giữ track khi không còn được detector thấy
+        self.iou_threshold = iou_threshold
+        self.min_votes = min_votes
+        self.min_share = min_share
+        self.max_reads = max_reads
+        self.tracks = []
+        self.finished = []  # Track đã chốt text hoặc đã mất nhưng còn text, chờ pop_finished()
+        self.next_id = 1
+        self.ocr_reads = 0
+        self.ocr_skipped = 0
+
+    def reset(self):
+        """Bắt đầu lại (seek, đổi ROI...): giống flush(), track đã có text vẫn được báo cáo"""
+        return self.flush()
+
+    def update(self, plates, frame_index):
+        """Ghép detection của frame này vào các track, trả về danh sách track đang sống"""
+        for track in self.tracks:
+            track.predict(frame_index)
+
+        # Ghép tham lam theo IoU giảm dần, đủ tốt cho vài biển số mỗi frame
+        pairs = sorted(((box_iou(track.bbox, plate['bbox']), t, p)
+                        for t, track in enumerate(self.tracks) for p, plate in enumerate(plates)),
+                       key=lambda pair: pair[0], reverse=True)
+        used_tracks, used_plates = set(), set()
+        for iou, t, p in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in used_tracks or p in used_plates:
+                continue
+            self.tracks[t].update(plates[p], frame_index)
+            plates[p]['track_id'] = self.tracks[t].id
+            used_tracks.add(t)
+            used_plates.add(p)
+
+        for p, plate in enumerate(plates):
+            if p not in used_plates:
+                self.tracks.append(KalmanBoxTrack(self.next_id, plate, frame_index))
+                plate['track_id'] = self.next_id
+                self.next_id += 1
+        return self._alive(frame_index)
+
+    def needs_ocr(self, plates):
+        """Lọc các biển số (đã qua update) mà track của chúng chưa chốt text"""
+        tracks = {track.id: track for track in self.tracks}
+        pending = [plate for plate in plates if not tracks[plate['track_id']].converged]
+        self.ocr_reads += len(pending)
+        self.ocr_skipped += len(plates) - len(pending)
+        return pending
+
+    def add_reads(self, plates, reads):
+        """Ghi kết quả OCR ({'text', 'valid'}) cho từng biển số vào phiếu bầu của track"""
+        tracks = {track.id: track for track in self.tracks}
+        for plate, read in zip(plates, reads):
+            track = tracks.get(plate['track_id'])
+            if track is None:
+                continue  # Track đã hết hạn trước khi có kết quả OCR
+            if track.add_read(read['text'], read['valid'], self.min_votes, self.min_share, self.max_reads):
+                self._finish(track)
+
+    def flush(self):
+        """Kết thúc mọi track còn sống (hết video), trả về các track có text chưa báo cáo"""
+        for track in self.tracks:
+            self._finish(track)
+        self.tracks = []
+        return self.pop_finished()
+
+    def pop_finished(self):
+        finished, self.finished = self.finished, []
+        return finished
+
+    def _finish(self, track):
+        if not track.reported and track.text:
+            track.reported = True
+            self.finished.append(track)
+
+    def hold(self, frame_index):
+        """Cảnh đứng yên: giữ nguyên box và làm mới các track để chúng không hết hạn"""
+        for track in self.tracks:
+            track.x[4:] = 0.0
+            track.last_frame = track.last_update = frame_index
+        return self.tracks
+
+    def predict(self, frame_index):
+        """Dự đoán vị trí các track ở frame không chạy detector"""
+        for track in self.tracks:
+            track.predict(frame_index)
+        return self._alive(frame_index)
+
+    def _alive(self, frame_index):
+        alive = []
+        for track in self.tracks:
+            if 0 <= frame_index - track.last_update <= self.max_age:
+                alive.append(track)
+            else:
+                self._finish(track)  # Xe đã đi mà chưa chốt: dùng chuỗi nhiều phiếu nhất
+        self.tracks = alive
+        return self.tracks
+
+    def plates(self, frame_shape):
+        """Box dự đoán của các track ở dạng dict giống kết quả pipeline, dùng được với draw_plates"""
+        height, width = frame_shape[:2]
+        plates = []
+        for track in self.tracks:
+            x1, y1, x2, y2 = track.bbox
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(width, int(x2)), min(height, int(y2))
+            if x2 <= x1 or y2 <= y1:
+                continue
+            text = track.text
+            plates.append(dict(track.plate, bbox=(x1, y1, x2, y2), track_id=track.id,
+                               text=text, valid=bool(text)))
+        return plates
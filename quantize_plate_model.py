@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Lượng tử hoá INT8 (post-training) model biển số bằng OpenVINO/NNCF, kèm kiểm tra độ chính xác.
+
+Calibration dùng một thư mục ảnh nhỏ (mặc định img/ và img-testing/). Vì các ảnh này
+không có nhãn, kết quả của model FP32 được dùng làm nhãn tham chiếu: plate-hit-rate là
+tỉ lệ biển số FP32 được model INT8 tìm lại (IoU >= 0.5). Nếu ảnh có nhãn YOLO (.txt cùng
+tên) thì báo cáo thêm hit-rate so với nhãn thật cho cả hai model.
+
+Độ chính xác được đo trên ảnh không dùng để calibration: thư mục --eval, hoặc nếu
+không có thì một phần (--holdout) ảnh calibration được giữ lại để đánh giá.
+
+    python quantize_plate_model.py --model license_plate_detector.pt --calib img img-testing
+    python quantize_plate_model.py --calib img --eval img-testing
+
+Sau khi đạt ngưỡng, các mode dùng model INT8 bằng cách đặt LPR_PLATE_BACKEND=openvino-int8.
+"""
+import sys
+import os
+import glob
+import json
+import shutil
+import tempfile
+import time
+
+import cv2
+
+from model_backends import export_model, exported_model_path, load_yolo, box_iou
+
+IMAGE_EXTENSIONS = ('*.png', '*.jpg', '*.jpeg', '*.bmp')
+
+
+def collect_images(folders):
+    paths = []
+    for folder in folders:
+        for pattern in IMAGE_EXTENSIONS:
+            paths.extend(glob.glob(os.path.join(folder, pattern)))
+    return sorted(set(paths))
+
+
+def split_holdout(paths, fraction):
+    """Chia ảnh thành (calibration, đánh giá): cứ khoảng 1/fraction ảnh lấy một ảnh để đánh giá"""
+    if fraction <= 0 or len(paths) < 2:
+        return paths, []
+    step = max(2, int(round(1 / fraction)))
+    held_out = set(paths[step - 1::step])
+    return [path for path in paths if path not in held_out], [path for path in paths if path in held_out]
+
+
+def write_calibration_dataset(image_paths, names, work_dir):
+    """Tạo dataset YAML tối thiểu mà ultralytics cần để calibration INT8"""
+    images_dir = os.path.join(work_dir, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    for i, path in enumerate(image_paths):
+        shutil.copy(path, os.path.join(images_dir, f"{i:04d}{os.path.splitext(path)[1]}"))
+    yaml_path = os.path.join(work_dir, 'calibration.yaml')
+    with open(yaml_path, 'w', encoding='utf-8') as f:
+        f.write(f"path: {work_dir}\ntrain: images\nval: images\nnames:\n")
+        for class_id, name in names.items():
+            f.write(f"  {class_id}: {name}\n")
+    return yaml_path
+
+
+def read_yolo_labels(image_path, width, height):
+    label_path = os.path.splitext(image_path)[0] + '.txt'
+    if not os.path.exists(label_path):
+        return None
+    boxes = []
+    with open(label_path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            boxes.append(((cx - w / 2) * width, (cy - h / 2) * height,
+                          (cx + w / 2) * width, (cy + h / 2) * height))
+    return boxes
+
+
+def hit_rate(references, predictions, iou_threshold=0.5):
+    total = sum(len(ref) for ref in references)
+    if total == 0:
+        return None
+    hits = sum(sum(1 for box in ref if any(box_iou(box, p) >= iou_threshold for p in pred))
+               for ref, pred in zip(references, predictions))
+    return hits / total
+
+
+def predict_all(model, images, conf, repeat):
+    boxes = []
+    samples = []
+    model(images[0], conf=conf, verbose=False)  # Warm-up
+    for image in images:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = model(image, conf=conf, verbose=False)[0]
+            samples.append((time.perf_counter() - t0) * 1000)
+        boxes.append([tuple(map(float, box.xyxy[0])) for box in result.boxes])
+    samples.sort()
+    return boxes, samples[len(samples) // 2]
+
+
+def evaluate(model_path, image_paths, conf=0.4, imgsz=640, repeat=3):
+    images = [cv2.imread(path) for path in image_paths]
+    fp32_model = load_yolo(model_path, 'pytorch')
+    int8_model = load_yolo(model_path, 'openvino-int8', imgsz)
+    fp32_boxes, fp32_ms = predict_all(fp32_model, images, conf, repeat)
+    int8_boxes, int8_ms = predict_all(int8_model, images, conf, repeat)
+
+    report = {
+        'images': len(images),
+        'fp32_p50_ms': fp32_ms,
+        'int8_p50_ms': int8_ms,
+        'speedup': fp32_ms / int8_ms if int8_ms > 0 else None,
+        # Nhãn tham chiếu = dự đoán của FP32
+        'plate_hit_rate_vs_fp32': hit_rate(fp32_boxes, int8_boxes),
+        'extra_detections_vs_fp32': sum(len(i) for i in int8_boxes) - sum(len(f) for f in fp32_boxes),
+    }
+
+    labels = [read_yolo_labels(path, image.shape[1], image.shape[0]) for path, image in zip(image_paths, images)]
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+    if labelled:
+        ground_truth = [labels[i] for i in labelled]
+        fp32_hit = hit_rate(ground_truth, [fp32_boxes[i] for i in labelled])
+        int8_hit = hit_rate(ground_truth, [int8_boxes[i] for i in labelled])
+        report['labelled_images'] = len(labelled)
+        report['fp32_hit_rate'] = fp32_hit
+        report['int8_hit_rate'] = int8_hit
+        if fp32_hit is not None and int8_hit is not None:
+            report['hit_rate_delta'] = int8_hit - fp32_hit
+    elif report['plate_hit_rate_vs_fp32'] is not None:
+        report['hit_rate_delta'] = report['plate_hit_rate_vs_fp32'] - 1.0
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lượng tử hoá INT8 model biển số và so sánh độ chính xác")
+    parser.add_argument('--model', default='license_plate_detector.pt')
+    parser.add_argument('--calib', nargs='+', default=['img', 'img-testing'],
+                        help="Các thư mục ảnh dùng để calibration")
+    parser.add_argument('--eval', nargs='+',
+                        help="Các thư mục ảnh dùng để đánh giá (mặc định giữ lại một phần ảnh --calib)")
+    parser.add_argument('--holdout', type=float, default=0.3,
+                        help="Tỉ lệ ảnh --calib giữ lại để đánh giá khi không có --eval")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.4)
+    parser.add_argument('--max-hit-drop', type=float, default=0.02,
+                        help="Mức giảm plate-hit-rate tối đa chấp nhận được")
+    parser.add_argument('--force', action='store_true', help="Lượng tử hoá lại dù đã có trong cache")
+    args = parser.parse_args()
+
+    image_paths = collect_images(args.calib)
+    if args.eval:
+        calibration = set(image_paths)
+        eval_paths = [path for path in collect_images(args.eval) if path not in calibration]
+    else:
+        image_paths, eval_paths = split_holdout(image_paths, args.holdout)
+    if not image_paths:
+        parser.error("Không tìm thấy ảnh calibration")
+    if not eval_paths:
+        parser.error("Không có ảnh đánh giá tách riêng khỏi ảnh calibration (dùng --eval hoặc --holdout)")
+
+    from ultralytics import YOLO
+
+    names = YOLO(args.model).names
+    work_dir = tempfile.mkdtemp(prefix='lpr-calib-')
+    try:
+        data_yaml = write_calibration_dataset(image_paths, names, work_dir)
+        if args.force:
+            shutil.rmtree(exported_model_path(args.model, 'openvino', args.imgsz, int8=True), ignore_errors=True)
+        int8_path = export_model(args.model, 'openvino', args.imgsz, int8=True, data=data_yaml)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = evaluate(args.model, eval_paths, args.conf, args.imgsz)
+    report['int8_model'] = int8_path
+    report['calibration_images'] = len(image_paths)
+    delta = report.get('hit_rate_delta')
+    # Không có biển số tham chiếu (FP32 không tìm thấy biển số nào, không có nhãn): không kết luận được
+    report['accepted'] = None if delta is None else delta >= -args.max_hit_drop
+    print(json.dumps(report, indent=2))
+    if report['accepted'] is None:
+        print("[WARN] Không đánh giá được độ chính xác: ảnh đánh giá không có biển số tham chiếu nào.",
+              file=sys.stderr)
+        sys.exit(2)
+    if not report['accepted']:
+        print(f"[WARN] Độ chính xác giảm {-delta:.3f} > {args.max_hit_drop}, không nên dùng model INT8 cho triển khai này.",
+              file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Vùng quan tâm (ROI) dạng đa giác cho từng video/camera.
+
+ROI được lưu trong roi_masks/<tên video>.json với toạ độ chuẩn hoá 0..1 nên dùng
+được cho mọi độ phân giải. Trước khi phát hiện, RoiCropper cắt khung bao của mỗi
+đa giác, tô đen phần nằm ngoài đa giác, xếp các vùng cạnh nhau thành một ảnh nhỏ
+hơn frame gốc, rồi đổi box phát hiện được về toạ độ frame gốc.
+"""
+import os
+import json
+
+import cv2
+import numpy as np
+
+ROI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'roi_masks')
+
+
+def roi_path(source):
+    """File ROI của một video (theo tên file) hoặc một camera (theo tên bất kỳ)"""
+    stem = os.path.splitext(os.path.basename(str(source)))[0] or 'default'
+    return os.path.join(ROI_DIR, stem + '.json')
+
+
+def load_rois(source):
+    """Trả về list đa giác [[(x, y), ...], ...] chuẩn hoá 0..1, hoặc [] nếu chưa có"""
+    path = roi_path(source)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Không đọc được ROI {path}: {e}")
+        return []
+    return [[tuple(point) for point in polygon] for polygon in data.get('polygons', []) if len(polygon) >= 3]
+
+
+def save_rois(source, polygons):
+    os.makedirs(ROI_DIR, exist_ok=True)
+    path = roi_path(source)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(str(source)),
+                   'polygons': [[list(point) for point in polygon] for polygon in polygons]}, f, indent=2)
+    return path
+
+
+class RoiCropper:
+    def __init__(self, polygons, frame_shape, gap=8):
+        height, width = frame_shape[:2]
+        self.frame_shape = (height, width)
+        self.regions = []  # (x, y, w, h trên frame gốc, x, y trên canvas, mask)
+
+        rects = []
+        for polygon in polygons:
+            points = np.array([(x * width, y * height) for x, y in polygon], dtype=np.int32)
+            x, y, w, h = cv2.boundingRect(points)
+            x, y = max(0, x), max(0, y)
+            w, h = min(width - x, w), min(height - y, h)
+            if w > 0 and h > 0:
+                rects.append((x, y, w, h, points))
+
+        # Xếp theo kệ (shelf): vùng cao trước, mỗi kệ rộng tối đa bằng vùng rộng nhất hoặc căn bậc hai tổng diện tích
+        rects.sort(key=lambda r: r[3], reverse=True)
+        shelf_width = max([r[2] for r in rects] + [int(np.sqrt(sum(r[2] * r[3] for r in rects)))]) if rects else 0
+        cursor_x = cursor_y = shelf_height = 0
+        for x, y, w, h, points in rects:
+            if cursor_x > 0 and cursor_x + w > shelf_width:
+                cursor_x, cursor_y, shelf_height = 0, cursor_y + shelf_height + gap, 0
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [points - (x, y)], 255)
+            self.regions.append((x, y, w, h, cursor_x, cursor_y, mask))
+            cursor_x += w + gap
+            shelf_height = max(shelf_height, h)
+        self.canvas_shape = (cursor_y + shelf_height, shelf_width) if rects else (0, 0)
+
+    @property
+    def pixel_ratio(self):
+        """Tỉ lệ số điểm ảnh canvas so với frame gốc"""
+        return (self.canvas_shape[0] * self.canvas_shape[1]) / float(self.frame_shape[0] * self.frame_shape[1])
+
+    def pack(self, frame):
+        canvas = np.zeros(self.canvas_shape + frame.shape[2:], dtype=frame.dtype)
+        for x, y, w, h, cx, cy, mask in self.regions:
+            where = mask > 0 if frame.ndim == 2 else (mask > 0)[..., None]
+            np.copyto(canvas[cy:cy + h, cx:cx + w], frame[y:y + h, x:x + w], where=where)
+        return canvas
+
+    def map_box(self, bbox):
+        """Đổi box trên canvas về frame gốc (theo vùng chứa tâm box), None nếu nằm ngoài mọi vùng"""
+        x1, y1, x2, y2 = bbox
+        center_x, center_y = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+        for x, y, w, h, cx, cy, _ in self.regions:
+            if cx <= center_x < cx + w and cy <= center_y < cy + h:
+                return (x + max(0, x1 - cx), y + max(0, y1 - cy),
+                        x + min(w, x2 - cx), y + min(h, y2 - cy))
+        return None
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Bộ đo thời gian nhẹ cho hot-path của VideoMode.
+
+Mỗi bước (decode, inference, OCR, vẽ, chuyển Qt, scale...) được đo bằng
+``with timer.stage('decode'):``. Timer giữ trung bình trượt cho overlay, đếm FPS
+thực tế / frame bị trễ, và có thể xuất sự kiện theo định dạng Chrome trace
+(mở bằng chrome://tracing hoặc https://ui.perfetto.dev).
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class StageTimer:
+    def __init__(self, window=60, max_trace_events=200000):
+        self.window = window
+        self.samples = {}
+        self.frame_times = deque(maxlen=window)
+        self.dropped_frames = 0
+        self.enabled = True
+        self.tracing = False
+        self.trace_events = deque(maxlen=max_trace_events)
+        self.lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name, start, end):
+        """Ghi một bước đã đo bằng time.perf_counter()"""
+        duration_ms = (end - start) * 1000
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+            self.samples[name].append(duration_ms)
+            if self.tracing:
+                self.trace_events.append({
+                    'name': name, 'ph': 'X', 'cat': 'video',
+                    'ts': (start - self._origin) * 1e6, 'dur': duration_ms * 1000,
+                    'pid': os.getpid(), 'tid': threading.get_ident(),
+                })
+
+    def record_breakdown(self, start, timings, names):
+        """Ghi các bước con (ms) đo ở nơi khác, ví dụ trong inference server, nối tiếp từ start"""
+        for name in names:
+            duration_ms = timings.get(name)
+            if duration_ms is None:
+                continue
+            end = start + duration_ms / 1000.0
+            self.record(name, start, end)
+            start = end
+
+    def tick_frame(self, frame_interval=None):
+        """Gọi mỗi lần hiển thị một frame; đếm frame trễ so với khoảng cách mong muốn (giây)"""
+        now = time.perf_counter()
+        with self.lock:
+            if frame_interval and self.frame_times:
+                late = int((now - self.frame_times[-1]) / frame_interval - 0.5)
+                if late > 0:
+                    self.dropped_frames += late
+            self.frame_times.append(now)
+
+    def fps(self):
+        with self.lock:
+            if len(self.frame_times) < 2:
+                return 0.0
+            span = self.frame_times[-1] - self.frame_times[0]
+            return (len(self.frame_times) - 1) / span if span > 0 else 0.0
+
+    def mean_ms(self, name):
+        with self.lock:
+            values = self.samples.get(name)
+            return sum(values) / len(values) if values else None
+
+    def summary(self):
+        with self.lock:
+            return {name: sum(values) / len(values) for name, values in self.samples.items() if values}
+
+    def overlay_lines(self, stages=None):
+        lines = [f"FPS: {self.fps():.1f}   Frame trễ: {self.dropped_frames}"]
+        summary = self.summary()
+        for name in stages or sorted(summary):
+            if name in summary:
+                lines.append(f"{name}: {summary[name]:.1f} ms")
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.frame_times.clear()
+            self.dropped_frames = 0
+
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.trace_events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Dải ảnh thu nhỏ cho thanh thời gian của VideoMode.
+
+Mỗi interval_frames frame lấy một ảnh nhỏ (mặc định tối đa ~120 ảnh cho cả video).
+Ảnh được tạo ở thread nền với VideoCapture riêng, seek tới keyframe gần nhất nếu
+có chỉ mục keyframe, nên không chặn việc phát video. Khi xong, cả dải được lưu
+thành một file JPEG + JSON trong thumbnails/ và được dùng lại khi mở lại video.
+"""
+import os
+import json
+import threading
+
+import cv2
+import numpy as np
+
+from video_index import video_cache_key, load_keyframe_index, nearest_keyframe
+
+THUMBNAIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails')
+
+
+class ThumbnailStrip:
+    def __init__(self, path, fps, total_frames, interval_seconds=None, height=54, max_thumbnails=120,
+                 cache_dir=THUMBNAIL_DIR):
+        self.path = path
+        self.fps = fps if fps > 0 else 30.0
+        self.total_frames = max(1, total_frames)
+        duration = self.total_frames / self.fps
+        if interval_seconds is None:
+            interval_seconds = max(2.0, duration / max_thumbnails)
+        self.interval_frames = max(1, int(round(interval_seconds * self.fps)))
+        self.count = max(1, -(-self.total_frames // self.interval_frames))
+        self.height = height
+        self.thumbnails = [None] * self.count
+        self.frames = [i * self.interval_frames for i in range(self.count)]
+        self.ready = 0
+        self.complete = False
+        self.cache_dir = cache_dir
+        self.cache_base = os.path.join(cache_dir, f"{video_cache_key(path)}-{self.interval_frames}")
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self._load_cache():
+            return
+        self.thread = threading.Thread(target=self._generate, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def index_at(self, frame_index):
+        return min(self.count - 1, max(0, frame_index // self.interval_frames))
+
+    def _generate(self):
+        index = load_keyframe_index(self.path)
+        keyframes = index['keyframes'] if index else None
+        cap = cv2.VideoCapture(self.path)
+        try:
+            for i, frame_index in enumerate(self.frames):
+                if self.cancelled.is_set():
+                    return
+                # Ảnh thu nhỏ không cần đúng từng frame: lấy keyframe gần nhất để chỉ giải mã một ảnh
+                target = nearest_keyframe(keyframes, frame_index) if keyframes else frame_index
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                ret, frame = cap.read()
+                if ret:
+                    self.frames[i] = target
+                    h, w = frame.shape[:2]
+                    self.thumbnails[i] = cv2.resize(frame, (max(1, w * self.height // h), self.height),
+                                                    interpolation=cv2.INTER_AREA)
+                self.ready = i + 1
+        finally:
+            cap.release()
+        self.complete = True
+        self._save_cache()
+
+    def _save_cache(self):
+        if any(thumbnail is None for thumbnail in self.thumbnails):
+            return  # Video lỗi giữa chừng: lần sau tạo lại
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Ghi ra file tạm rồi os.replace: tiến trình khác (hoặc lần mở sau khi bị tắt giữa chừng)
+        # không bao giờ đọc phải ảnh / metadata ghi dở. File tạm giữ đuôi .jpg để cv2 chọn đúng định dạng
+        temp_base = f"{self.cache_base}.{os.getpid()}.tmp"
+        if not cv2.imwrite(temp_base + '.jpg', np.hstack(self.thumbnails), [cv2.IMWRITE_JPEG_QUALITY, 80]):
+            return
+        with open(temp_base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'frames': self.frames, 'widths': [t.shape[1] for t in self.thumbnails],
+                       'height': self.height}, f)
+        os.replace(temp_base + '.jpg', self.cache_base + '.jpg')
+        os.replace(temp_base + '.json', self.cache_base + '.json')
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_base + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        strip = cv2.imread(self.cache_base + '.jpg')
+        if strip is None or len(meta['frames']) != self.count or meta['height'] != self.height or \
+                strip.shape[1] != sum(meta['widths']):
+            return False
+        x = 0
+        for i, width in enumerate(meta['widths']):
+            self.thumbnails[i] = strip[:, x:x + width]
+            x += width
+        self.frames = meta['frames']
+        self.ready = self.count
+        self.complete = True
+        return True
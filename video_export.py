@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Ghi video đã chú thích (frame VideoMode hiển thị) ra file ở thread riêng.
+
+Thread xử lý chỉ đưa frame vào hàng đợi có giới hạn (số frame và tổng số byte, vì
+mỗi frame 4K đã ~25 MB), không bao giờ chờ encoder.
+Khi encoder chậm hơn video, hàng đợi đầy và frame mới bị bỏ; theo policy:
+  - 'drop': frame thiếu (bị bỏ, hoặc do VideoWorker bỏ khi phát trễ) không được ghi,
+    video xuất ngắn hơn video gốc,
+  - 'duplicate': khoảng trống giữa hai frame được lấp bằng cách ghi lại frame trước,
+    nên thời lượng và tốc độ video xuất khớp video gốc.
+Độ trễ của encoder (số frame / giây còn trong hàng đợi) được báo qua lag_frames,
+lag_seconds và describe().
+"""
+import queue
+import threading
+
+import cv2
+
+EXPORT_POLICIES = ('drop', 'duplicate')
+
+
+class AnnotatedVideoWriter:
+    def __init__(self, path, fps, policy='drop', fourcc='mp4v', queue_size=8, max_queue_bytes=256 * 1024 * 1024,
+                 max_gap_seconds=2.0):
+        if policy not in EXPORT_POLICIES:
+            raise ValueError(f"Policy không hợp lệ: {policy} (chọn một trong {', '.join(EXPORT_POLICIES)})")
+        self.path = path
+        self.fps = fps if fps > 0 else 30.0
+        self.policy = policy
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        # Khoảng trống dài hơn (seek, tạm dừng) không được lấp
+        self.max_gap = max(1, int(round(max_gap_seconds * self.fps)))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_queue_bytes = max_queue_bytes
+        self.queued_bytes = 0
+        self.bytes_lock = threading.Lock()
+        self.closing = threading.Event()
+        self.writer = None
+        self.frame_size = None
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.last_submitted = None
+        self.last_written = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, index, frame):
+        """Đưa frame (chỉ số frame gốc, ảnh BGR) vào hàng đợi; False nếu bị bỏ vì encoder đang chậm"""
+        if self.closing.is_set() or self.error is not None:
+            return False
+        self.last_submitted = index
+        with self.bytes_lock:
+            # Luôn nhận ít nhất một frame để frame rất lớn vẫn được ghi
+            if self.queued_bytes and self.queued_bytes + frame.nbytes > self.max_queue_bytes:
+                self.dropped += 1
+                return False
+            try:
+                self.queue.put_nowait((index, frame))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self.queued_bytes += frame.nbytes
+        self.submitted += 1
+        return True
+
+    @property
+    def lag_frames(self):
+        return self.queue.qsize()
+
+    @property
+    def lag_seconds(self):
+        return self.lag_frames / self.fps
+
+    def describe(self):
+        text = f"Xuất video: {self.written} frame, trễ {self.lag_seconds:.1f}s ({self.lag_frames} frame)"
+        if self.dropped:
+            text += f", bỏ {self.dropped}"
+        if self.duplicated:
+            text += f", lặp {self.duplicated}"
+        if self.error is not None:
+            text += f", lỗi: {self.error}"
+        return text
+
+    def close(self, wait=False, timeout=10.0):
+        """Ngừng nhận frame; thread ghi nốt các frame còn trong hàng đợi rồi đóng file"""
+        self.closing.set()
+        if wait:
+            self.thread.join(timeout)
+
+    def _run(self):
+        last_frame = None
+        try:
+            while True:
+                try:
+                    index, frame = self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.closing.is_set():
+                        break
+                    continue
+                with self.bytes_lock:
+                    self.queued_bytes -= frame.nbytes
+                if self.writer is None:
+                    self._open(frame)
+                if frame.shape[1::-1] != self.frame_size:
+                    frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+                if self.policy == 'duplicate' and last_frame is not None:
+                    gap = index - self.last_written - 1
+                    if 0 < gap <= self.max_gap:
+                        for _ in range(gap):
+                            self.writer.write(last_frame)
+                        self.duplicated += gap
+                self.writer.write(frame)
+                self.written += 1
+                self.last_written = index
+                last_frame = frame
+        except Exception as e:
+            self.error = e
+            print(f"[ERROR] Lỗi ghi video {self.path}: {e}")
+        finally:
+            if self.writer is not None:
+                self.writer.release()
+
+    def _open(self, frame):
+        height, width = frame.shape[:2]
+        self.frame_size = (width, height)
+        self.writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, self.frame_size)
+        if not self.writer.isOpened():
+            raise IOError(f"Không thể tạo file video: {self.path}")
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Chỉ mục keyframe của file video, dùng để seek nhanh trong VideoMode.
+
+Với H.264 GOP dài, cap.set(CAP_PROP_POS_FRAMES, n) phải giải mã lại từ keyframe
+trước n. Khi biết vị trí keyframe, seek có thể:
+  - giải mã tiếp từ vị trí hiện tại nếu đích nằm phía trước và cùng GOP,
+  - nhảy đúng tới keyframe gần nhất rồi chỉ giải mã tiếp tới đích,
+  - khi kéo thanh thời gian, chỉ giải mã keyframe gần nhất làm ảnh xem trước.
+
+Chỉ mục được tạo bằng PyAV (chỉ demux, không giải mã) và lưu trong video_index/.
+Không có PyAV thì trả về None và VideoMode seek như cũ.
+"""
+import os
+import json
+import bisect
+import hashlib
+import threading
+
+VIDEO_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_index')
+
+
+def video_cache_key(path):
+    """Tên file cache cho một video, đổi khi file video thay đổi (mtime/kích thước)"""
+    stat = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]}"
+
+
+def index_cache_path(path, cache_dir=VIDEO_INDEX_DIR):
+    return os.path.join(cache_dir, video_cache_key(path) + '.json')
+
+
+def build_keyframe_index(path):
+    """Đọc packet của luồng video, trả về {'fps', 'frame_count', 'keyframes'} hoặc None nếu thiếu PyAV"""
+    try:
+        import av
+    except ImportError:
+        return None
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate or 30)
+        time_base = float(stream.time_base)
+        start = stream.start_time or 0
+        keyframes = []
+        frame_count = 0
+        for packet in container.demux(stream):
+            if packet.pts is None or packet.size == 0:
+                continue
+            frame_count += 1
+            if packet.is_keyframe:
+                keyframes.append(int(round((packet.pts - start) * time_base * fps)))
+    keyframes = sorted(set(keyframes)) or [0]
+    return {'fps': fps, 'frame_count': frame_count, 'keyframes': keyframes}
+
+
+def load_keyframe_index(path, cache_dir=VIDEO_INDEX_DIR):
+    """Chỉ mục từ cache, tạo mới (và lưu) nếu chưa có; None nếu không tạo được"""
+    cache_path = index_cache_path(path, cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass  # Cache hỏng thì tạo lại
+
+    try:
+        index = build_keyframe_index(path)
+    except Exception as e:
+        print(f"[ERROR] Không tạo được chỉ mục keyframe cho {path}: {e}")
+        return None
+    if index is None:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    # Ghi ra file tạm rồi đổi tên, vì VideoWorker và dải thumbnail có thể tạo chỉ mục cùng lúc
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, cache_path)
+    return index
+
+
+def nearest_keyframe(keyframes, frame_index):
+    """Keyframe lớn nhất <= frame_index"""
+    position = bisect.bisect_right(keyframes, frame_index) - 1
+    return keyframes[max(0, position)]
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""Giải mã và nhận diện video ngoài thread GUI.
+
+Thread decoder đọc frame vào một hàng đợi có giới hạn, thread inference lấy frame
+ra, chạy hàm annotate (YOLO + OCR) và giữ lại frame đã vẽ mới nhất theo đúng nhịp
+FPS của video. Thread GUI chỉ cần gọi take_latest() định kỳ rồi vẽ.
+
+Mỗi lần seek/stop tăng generation: frame và kết quả của generation cũ bị bỏ qua,
+nên việc đang giải mã hay nhận diện dở không làm hiện lại frame cũ.
+
+Khi có chỉ mục keyframe (video_index), seek chỉ giải mã từ keyframe gần nhất hoặc
+tiếp từ vị trí hiện tại, và seek xem trước (lúc kéo thanh thời gian) chỉ giải mã
+keyframe rồi thu nhỏ, không chạy nhận diện.
+
+PresentationClock xếp lịch hiển thị theo đồng hồ thực: mốc được đặt khi bắt đầu
+phát (và sau mỗi lần tạm dừng/seek), hạn của frame n là mốc + n / fps nên sai số
+không cộng dồn như QTimer. Frame đã trễ bị bỏ (decoder chỉ grab, không giải mã,
+khi tụt lại quá xa) để nhận diện chậm chỉ làm giảm số frame hiển thị chứ không
+làm cả video chậm lại.
+"""
+import time
+import queue
+import threading
+import traceback
+
+import cv2
+
+from stage_timer import StageTimer
+from video_index import load_keyframe_index, nearest_keyframe
+
+
+class PresentationClock:
+    def __init__(self, frame_interval, late_tolerance=None, decode_skip_after=2):
+        self.frame_interval = frame_interval
+        self.late_tolerance = late_tolerance or frame_interval / 2
+        self.decode_skip_after = decode_skip_after  # Số frame trễ để decoder bắt đầu bỏ giải mã
+        self.lock = threading.Lock()
+        self.anchor = None
+        self.presented = 0
+        self.late = 0
+        self.dropped = 0
+        self.decode_skipped = 0
+
+    def reset(self):
+        """Đặt lại mốc (tạm dừng, seek): frame kế tiếp được hiển thị ngay"""
+        with self.lock:
+            self.anchor = None
+
+    def due(self, index):
+        """Thời điểm (perf_counter) frame index cần được hiển thị; đặt mốc nếu chưa có"""
+        with self.lock:
+            if self.anchor is None:
+                self.anchor = (time.perf_counter(), index)
+            start, start_index = self.anchor
+        return start + (index - start_index) * self.frame_interval
+
+    def lateness(self, index):
+        """Frame index đang trễ bao nhiêu giây, None nếu chưa có mốc"""
+        with self.lock:
+            if self.anchor is None:
+                return None
+            start, start_index = self.anchor
+        return time.perf_counter() - (start + (index - start_index) * self.frame_interval)
+
+    def should_skip_decode(self, index):
+        lateness = self.lateness(index)
+        return lateness is not None and lateness > self.decode_skip_after * self.frame_interval
+
+    def record_presented(self, due):
+        with self.lock:
+            self.presented += 1
+            if time.perf_counter() - due > self.late_tolerance:
+                self.late += 1
+
+    def describe(self):
+        return (f"Hiển thị {self.presented}, trễ {self.late}, bỏ {self.dropped}, "
+                f"không giải mã {self.decode_skipped}")
+
+
+class VideoWorker:
+    def __init__(self, path, annotate=None, timer=None, queue_size=8, preview_width=320, autostart=True):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Không thể mở video: {path}")
+        self.path = path
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_interval = 1.0 / self.fps if self.fps > 0 else 1.0 / 30
+        self.annotate = annotate
+        self.timer = timer or StageTimer()
+        self.preview_width = preview_width
+        self.keyframes = None  # Được nạp ở thread nền, None thì seek bằng cap.set như thường
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.generation = 0
+        self.seek_target = 0
+        self.seek_preview = False
+        self.step = True  # Cho phép hiện một frame khi đang tạm dừng (sau khi mở/seek)
+        self.playing = threading.Event()
+        self.stopped = threading.Event()
+        self.clock = PresentationClock(self.frame_interval)
+
+        self.latest = None
+        self.serial = 0
+        self.finished = False
+        self.sink = None  # sink(index, frame) nhận mọi frame đã chú thích khi đang phát (xuất video)
+
+        self.threads = [threading.Thread(target=self._decode_loop, daemon=True),
+                        threading.Thread(target=self._process_loop, daemon=True)]
+        if autostart:
+            self.start()
+
+    def start(self):
+        """Chạy các thread nền; autostart=False để caller chuẩn bị xong trạng thái annotate trước"""
+        for thread in self.threads:
+            thread.start()
+        threading.Thread(target=self._load_index, daemon=True).start()
+
+    def _load_index(self):
+        index = load_keyframe_index(self.path)
+        if index is not None:
+            self.keyframes = index['keyframes']
+
+    # --- Điều khiển từ thread GUI ---
+
+    def play(self):
+        self.clock.reset()
+        self.playing.set()
+
+    def pause(self):
+        self.playing.clear()
+        self.clock.reset()
+
+    def seek(self, index, preview=False):
+        """Huỷ các frame đang chờ/đang xử lý và hiện frame tại index (kể cả khi đang tạm dừng).
+
+        preview=True: chỉ hiện nhanh ảnh thu nhỏ của keyframe gần nhất, không nhận diện.
+        """
+        with self.wakeup:
+            self.generation += 1
+            self.seek_target = max(0, index)
+            self.seek_preview = preview
+            self.step = not self.playing.is_set()
+            self.finished = False
+            self.clock.reset()
+            self.wakeup.notify_all()
+        self._drain()
+
+    def stop(self, timeout=2.0):
+        """Dừng các thread nền; trả về False nếu còn thread chưa kết thúc sau timeout"""
+        self.stopped.set()
+        self.playing.set()
+        with self.wakeup:
+            self.generation += 1
+            self.wakeup.notify_all()
+        self._drain()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(timeout)
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def take_latest(self):
+        """Trả về (serial, chỉ số frame, frame đã vẽ) mới nhất, hoặc None nếu chưa có"""
+        with self.lock:
+            if self.latest is None:
+                return None
+            return (self.serial,) + self.latest
+
+    # --- Thread nền ---
+
+    def _drain(self):
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+
+    def _put(self, item, generation):
+        # Hàng đợi đầy thì chờ, nhưng bỏ frame nếu đã seek/stop trong lúc chờ
+        while not self.stopped.is_set() and generation == self.generation:
+            try:
+                self.frames.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                continue
+
+    def _seek(self, target, position, generation, preview):
+        """Đưa capture tới target, trả về chỉ số frame mà lần read() kế tiếp sẽ trả về"""
+        keyframes = self.keyframes
+        if keyframes is None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            return target
+
+        keyframe = nearest_keyframe(keyframes, target)
+        if preview:
+            if position != keyframe:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            return keyframe
+
+        if not keyframe <= position <= target:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            position = keyframe
+        # Cùng GOP: giải mã tiếp (grab không chuyển sang ảnh) tới đích, dừng nếu có seek mới
+        while position < target and generation == self.generation and not self.stopped.is_set():
+            if not self.cap.grab():
+                break
+            position += 1
+        return position
+
+    def _decode_loop(self):
+        index = 0
+        parked = False  # Hết video hoặc vừa hiện ảnh xem trước: chờ lệnh seek kế tiếp
+        while not self.stopped.is_set():
+            with self.wakeup:
+                while parked and self.seek_target is None and not self.stopped.is_set():
+                    self.wakeup.wait()
+                generation = self.generation
+                target, self.seek_target = self.seek_target, None
+                preview = self.seek_preview
+            if self.stopped.is_set():
+                break
+
+            if target is not None:
+                parked = False
+                with self.timer.stage('seek'):
+                    index = self._seek(target, index, generation, preview)
+                if generation != self.generation:
+                    continue
+                if preview:
+                    ret, frame = self.cap.read()
+                    if ret:
+                        height, width = frame.shape[:2]
+                        if width > self.preview_width:
+                            frame = cv2.resize(frame, (self.preview_width, height * self.preview_width // width),
+                                               interpolation=cv2.INTER_AREA)
+                        self._put((generation, index, frame, True), generation)
+                        index += 1
+                    parked = True
+                    continue
+
+            if self.playing.is_set() and self.clock.should_skip_decode(index):
+                # Tụt lại quá xa so với đồng hồ: bỏ qua frame này mà không giải mã ảnh
+                if self.cap.grab():
+                    self.clock.decode_skipped += 1
+                    index += 1
+                    continue
+
+            with self.timer.stage('decode'):
+                ret, frame = self.cap.read()
+            parked = not ret
+            self._put((generation, index, frame if ret else None, False), generation)
+            if ret:
+                index += 1
+        self.cap.release()
+
+    def _process_loop(self):
+        while not self.stopped.is_set():
+            try:
+                generation, index, frame, preview = self.frames.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if generation != self.generation:
+                continue
+            if frame is None:
+                with self.lock:
+                    if generation == self.generation:
+                        self.finished = True
+                continue
+            if preview:
+                self._publish(generation, index, frame)
+                continue
+
+            while not self.playing.is_set() and not self.step and generation == self.generation:
+                self.playing.wait(0.05)
+            if self.stopped.is_set() or generation != self.generation:
+                continue
+
+            with self.lock:
+                stepping = not self.playing.is_set()
+                if stepping:
+                    self.step = False
+
+            due = None
+            if not stepping:
+                due = self.clock.due(index)
+                # Đã trễ hơn một frame và còn frame mới hơn trong hàng đợi: bỏ frame này
+                if time.perf_counter() - due > self.frame_interval and not self.frames.empty():
+                    self.clock.dropped += 1
+                    continue
+
+            annotated = frame
+            if self.annotate is not None:
+                try:
+                    annotated = self.annotate(frame, index)
+                except Exception as e:
+                    # Một frame lỗi không được làm chết thread xử lý: hiện frame chưa chú thích
+                    print(f"[ERROR] Lỗi xử lý frame {index}: {e}")
+                    traceback.print_exc()
+            sink = self.sink
+            if sink is not None and not stepping:
+                sink(index, annotated)
+
+            if due is not None:
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    self.stopped.wait(delay)
+                self.clock.record_presented(due)
+
+            self._publish(generation, index, annotated)
+
+    def _publish(self, generation, index, frame):
+        with self.lock:
+            if generation == self.generation:
+                self.latest = (index, frame)
+                self.serial += 1
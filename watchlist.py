@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Danh sách biển số cần theo dõi, cảnh báo ngay khi OCR đọc được một biển số trong danh sách.
+
+Danh sách (hàng nghìn tới hàng trăm nghìn biển số) được đánh chỉ mục bằng
+PlateSearchIndex nên mỗi lần đọc chỉ tốn vài lần tra dict, kể cả khi cho phép
+sai khác max_distance ký tự và nhầm lẫn OCR (0/O, 8/B...). File danh sách là
+text hoặc CSV, mỗi dòng một biển số, có thể kèm ghi chú sau dấu phẩy:
+
+    51F12345,Xe mất cắp
+    30A67890
+
+Cùng một biển số trong danh sách chỉ cảnh báo lại sau cooldown_seconds (theo từng
+nguồn) vì tracker đọc lại một xe ở nhiều frame liên tiếp.
+"""
+import os
+import csv
+import json
+import time
+
+from plate_ocr import clean_plate_text
+from plate_search import PlateSearchIndex
+
+WATCHLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watchlist.txt')
+ALERT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watchlist_alerts.jsonl')
+
+
+def read_watchlist_file(path):
+    """Đọc file danh sách, trả về dict biển số chuẩn hoá -> ghi chú"""
+    entries = {}
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].lstrip().startswith('#'):
+                continue
+            plate = clean_plate_text(row[0])
+            if plate:
+                entries[plate] = ','.join(row[1:]).strip()
+    return entries
+
+
+class Watchlist:
+    def __init__(self, entries=None, max_distance=1, cooldown_seconds=30.0, on_alert=None,
+                 log_path=ALERT_LOG_PATH, cache_size=4096):
+        self.max_distance = max_distance
+        self.cooldown_seconds = cooldown_seconds
+        self.on_alert = on_alert
+        self.log_path = log_path
+        self.cache_size = cache_size
+        self.index = PlateSearchIndex(max_distance)
+        self.notes = {}
+        self.cache = {}  # text đọc được -> kết quả tra, tracker đọc lại cùng text rất nhiều lần
+        self.last_alert = {}  # (biển số trong danh sách, nguồn) -> thời điểm cảnh báo gần nhất
+        self.checked = 0
+        self.alerts = 0
+        for plate, note in (entries or {}).items():
+            self.add(plate, note)
+
+    @classmethod
+    def from_file(cls, path=WATCHLIST_PATH, **kwargs):
+        return cls(read_watchlist_file(path), **kwargs)
+
+    def __len__(self):
+        return len(self.notes)
+
+    def add(self, plate, note=''):
+        plate = clean_plate_text(plate)
+        if plate:
+            self.index.add(plate)
+            self.notes[plate] = note
+            self.cache.clear()
+
+    def match(self, text):
+        """Các biển số trong danh sách khớp text, list (biển số, khoảng cách) gần nhất trước"""
+        text = clean_plate_text(text)
+        matches = self.cache.get(text)
+        if matches is None:
+            matches = self.index.search(text, self.max_distance) if text else []
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[text] = matches
+        return matches
+
+    def check(self, text, source=None, frame_index=None, seconds=None, bbox=None, frame=None):
+        """Kiểm tra một lần đọc; gọi on_alert và ghi log cho mỗi biển số khớp, trả về list cảnh báo"""
+        self.checked += 1
+        matches = self.match(text)
+        if not matches:
+            return []
+        now = time.time()
+        alerts = []
+        for plate, distance in matches:
+            key = (plate, source)
+            if now - self.last_alert.get(key, float('-inf')) < self.cooldown_seconds:
+                continue
+            self.last_alert[key] = now
+            alert = {'plate': plate, 'read': clean_plate_text(text), 'distance': distance,
+                     'note': self.notes.get(plate, ''), 'source': source, 'frame_index': frame_index,
+                     'seconds': seconds, 'bbox': tuple(int(v) for v in bbox) if bbox is not None else None,
+                     'time': now}
+            self._log(alert)
+            self.alerts += 1
+            if self.on_alert is not None:
+                self.on_alert(dict(alert, frame=frame))  # Ảnh frame chỉ đưa cho callback, không ghi log
+            alerts.append(alert)
+        return alerts
+
+    def _log(self, alert):
+        print(f"[ALERT] Biển số theo dõi {alert['plate']} (đọc được {alert['read']}, sai khác {alert['distance']}) "
+              f"tại {alert['source']} frame {alert['frame_index']} {alert['note']}")
+        if self.log_path:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(alert, ensure_ascii=False) + '\n')
+
+
+def load_watchlist(path=WATCHLIST_PATH, **kwargs):
+    """Watchlist từ file, hoặc None nếu chưa có file danh sách"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return Watchlist.from_file(path, **kwargs)
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        print(f"[ERROR] Không đọc được danh sách theo dõi {path}: {e}")
+        return None